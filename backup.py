@@ -0,0 +1,194 @@
+"""
+Резервное копирование базы данных SQLite на лету
+
+Копия снимается через online backup API SQLite небольшими порциями
+страниц. Источник держит открытую транзакцию чтения, поэтому копия -
+согласованный снимок на момент начала, а в режиме WAL бот продолжает
+писать в базу, пока копия снимается. Каждая копия проверяется
+PRAGMA integrity_check, сжимается gzip и хранится в ротации.
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackupManager:
+    """Периодические сжатые резервные копии базы с ротацией"""
+    
+    FILE_PREFIX = 'backup_'
+    FILE_SUFFIX = '.db.gz'
+    
+    def __init__(self, db_path: str, backup_dir: str = 'backups', interval_hours: float = 24,
+                 keep: int = 7, pages_per_step: int = 256, step_pause: float = 0.01):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            backup_dir: Каталог для резервных копий
+            interval_hours: Период резервного копирования в часах
+            keep: Сколько последних копий хранить
+            pages_per_step: Страниц за один шаг backup API
+            step_pause: Пауза между шагами в секундах (уступаем диск боту)
+        """
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval_hours = interval_hours
+        self.keep = max(1, keep)
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        
+        self.last_stats: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+    
+    def list_backups(self) -> List[str]:
+        """Пути к резервным копиям, от новых к старым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(self.FILE_PREFIX) and name.endswith(self.FILE_SUFFIX)
+        ]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+    
+    def _copy(self, target_path: str) -> int:
+        """Снимок базы в target_path порциями страниц (возвращает число страниц)"""
+        pages_total = 0
+        
+        def progress(status, remaining, total):
+            nonlocal pages_total
+            pages_total = total
+            if self.step_pause:
+                time.sleep(self.step_pause)
+        
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(target_path)
+        try:
+            # Открытая транзакция чтения фиксирует снимок: записи бота из
+            # других соединений не перезапускают копирование
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=self.pages_per_step, progress=progress)
+            source.rollback()
+            # Копия - самодостаточный файл без -wal/-shm
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            source.close()
+        return pages_total
+    
+    @staticmethod
+    def _integrity_check(path: str) -> str:
+        """Результат PRAGMA integrity_check ('ok' для целой базы)"""
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows = conn.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            conn.close()
+        return '; '.join(row[0] for row in rows)
+    
+    @staticmethod
+    def _compress(source_path: str, target_path: str):
+        """Сжатие файла gzip"""
+        with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, length=1024 * 1024)
+    
+    def _rotate(self) -> List[str]:
+        """Удаление копий сверх keep (возвращает удаленные пути)"""
+        removed = self.list_backups()[self.keep:]
+        for path in removed:
+            os.remove(path)
+        return removed
+    
+    def backup(self) -> Dict[str, Any]:
+        """
+        Снятие, проверка, сжатие и ротация одной резервной копии
+        
+        Блокирующая операция: из event loop вызывайте run_backup().
+        
+        Returns:
+            Статистика: path, duration, copy_duration, pages,
+            pages_per_second, db_size, compressed_size, integrity
+        
+        Raises:
+            RuntimeError: если копия не прошла integrity_check
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        raw_path = os.path.join(self.backup_dir, f'{self.FILE_PREFIX}{stamp}.db.tmp')
+        final_path = os.path.join(self.backup_dir, f'{self.FILE_PREFIX}{stamp}{self.FILE_SUFFIX}')
+        
+        started = time.monotonic()
+        try:
+            pages = self._copy(raw_path)
+            copy_duration = time.monotonic() - started
+            
+            integrity = self._integrity_check(raw_path)
+            if integrity != 'ok':
+                raise RuntimeError(f"Резервная копия повреждена: {integrity}")
+            
+            db_size = os.path.getsize(raw_path)
+            self._compress(raw_path, final_path + '.tmp')
+            os.replace(final_path + '.tmp', final_path)
+        finally:
+            for path in (raw_path, final_path + '.tmp'):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        removed = self._rotate()
+        duration = time.monotonic() - started
+        
+        stats = {
+            'path': final_path,
+            'duration': round(duration, 3),
+            'copy_duration': round(copy_duration, 3),
+            'pages': pages,
+            'pages_per_second': round(pages / copy_duration) if copy_duration > 0 else pages,
+            'db_size': db_size,
+            'compressed_size': os.path.getsize(final_path),
+            'integrity': integrity,
+            'removed': removed,
+        }
+        self.last_stats = stats
+        return stats
+    
+    async def run_backup(self) -> Optional[Dict[str, Any]]:
+        """Резервная копия в рабочем потоке (event loop не блокируется)"""
+        async with self._lock:
+            try:
+                stats = await asyncio.to_thread(self.backup)
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования базы: {e}")
+                return None
+        
+        logger.info(
+            f"💾 Резервная копия {stats['path']}: {stats['duration']} с, "
+            f"{stats['pages']} страниц ({stats['pages_per_second']} стр/с), "
+            f"{stats['db_size']} -> {stats['compressed_size']} байт"
+        )
+        return stats
+    
+    def _seconds_until_next(self) -> float:
+        """Сколько ждать до следующей копии с учетом возраста последней"""
+        interval = self.interval_hours * 3600
+        backups = self.list_backups()
+        if not backups:
+            return 0
+        age = time.time() - os.path.getmtime(backups[0])
+        return max(0, interval - age)
+    
+    async def run_periodically(self):
+        """Фоновая задача: резервная копия раз в interval_hours"""
+        logger.info(f"Резервное копирование базы каждые {self.interval_hours} ч в {self.backup_dir}")
+        while True:
+            await asyncio.sleep(self._seconds_until_next())
+            if await self.run_backup() is None:
+                # После ошибки повторяем не чаще раза в час
+                await asyncio.sleep(min(3600, self.interval_hours * 3600))
@@ -1,12 +1,16 @@
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, PreCheckoutQueryHandler, filters, ContextTypes
 
-from database import Database
+from storage import create_storage, is_postgres_url
+from session_cache import CachedUserStorage
 from config import *
 from handlers import UserHandlers, AdminHandlers
-from notifications import NotificationSystem, add_notification_methods_to_db
+from callbacks import CallbackRouter
+from notifications import NotificationSystem
 from payments import PaymentHandler
+from backup import BackupManager
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,18 +21,41 @@ logger = logging.getLogger(__name__)
 
 class TelegramBot:
     def __init__(self):
-        # Инициализация базы данных
-        self.db = Database(DATABASE_PATH)
-        add_notification_methods_to_db(self.db)
+        # Хранилище: SQLite-файл DATABASE_PATH или PostgreSQL по DATABASE_URL
+        self.async_db = create_storage(
+            DATABASE_URL,
+            DATABASE_PATH,
+            pool_size=DATABASE_POOL_SIZE,
+            flush_interval=DATABASE_FLUSH_INTERVAL,
+            rollup_interval=ANALYTICS_ROLLUP_INTERVAL
+        )
+        # Записи пользователей в памяти: переходы по меню не читают базу
+        if SESSION_CACHE_SIZE > 0:
+            self.async_db = CachedUserStorage(self.async_db, SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+        
+        # Резервное копирование SQLite-базы на лету (PostgreSQL копируется своими средствами)
+        self.backup_manager = BackupManager(
+            DATABASE_PATH,
+            backup_dir=BACKUP_DIR,
+            interval_hours=BACKUP_INTERVAL_HOURS,
+            keep=BACKUP_KEEP
+        ) if AUTO_BACKUP and not is_postgres_url(DATABASE_URL) else None
+        self.backup_task = None
         
         # Создание приложения
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+            .build()
+        )
         
         # Инициализация обработчиков
-        self.user_handlers = UserHandlers(self.db)
-        self.admin_handlers = AdminHandlers(self.db)
-        self.notification_system = NotificationSystem(self.db, self.application.bot)
-        self.payment_handler = PaymentHandler(PAYMENT_PROVIDER_TOKEN, self.db) if PAYMENT_PROVIDER_TOKEN else None
+        self.user_handlers = UserHandlers(self.async_db)
+        self.admin_handlers = AdminHandlers(self.async_db, screens=self.user_handlers.screens)
+        self.notification_system = NotificationSystem(self.async_db, self.application.bot)
+        self.payment_handler = PaymentHandler(PAYMENT_PROVIDER_TOKEN, self.async_db) if PAYMENT_PROVIDER_TOKEN else None
         
         # Передаём payment_handler в user_handlers
         self.user_handlers.payment_handler = self.payment_handler
@@ -62,7 +89,27 @@ class TelegramBot:
         
         # Обработчики сообщений и callback
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.user_handlers.handle_message))
-        self.application.add_handler(CallbackQueryHandler(self.user_handlers.handle_callback))
+        # Кнопки: таблица маршрутов callback_data пользовательских и админ-обработчиков
+        self.callback_router = CallbackRouter()
+        self.user_handlers.register_callbacks(self.callback_router)
+        self.admin_handlers.register_callbacks(self.callback_router)
+        self.application.add_handler(CallbackQueryHandler(self.callback_router.dispatch))
+    
+    async def on_startup(self, application: Application):
+        """Запуск фоновых задач после инициализации бота"""
+        if self.backup_manager:
+            self.backup_task = asyncio.create_task(self.backup_manager.run_periodically())
+    
+    async def on_shutdown(self, application: Application):
+        """Остановка фоновых задач и закрытие базы данных после остановки бота"""
+        if self.backup_task:
+            self.backup_task.cancel()
+            try:
+                await self.backup_task
+            except asyncio.CancelledError:
+                pass
+        await self.async_db.close()
+        logger.info("🗄️ Соединения с базой данных закрыты")
     
     def run(self):
         """Запуск бота"""
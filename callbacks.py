@@ -0,0 +1,140 @@
+"""
+Маршрутизация callback-запросов inline-кнопок
+
+callback_data кнопок бывает двух видов:
+- точный ключ: 'main_menu', 'confirm_registration';
+- префикс с одним аргументом после последнего '_': 'product_12',
+  'order_details_7', 'edit_profile_gender_male'.
+
+CallbackRouter находит обработчик одним обращением к словарю в обоих
+случаях - сначала по точному ключу, затем по префиксу data.rpartition('_'),
+поэтому порядок регистрации не важен и пересечения префиксов
+('product_' / 'buy_product_') не мешают. Аргумент разбирается один раз
+парсером маршрута (int, choice(...)) и передается обработчику уже
+типизированным. Нераспознанные callback_data - мертвые кнопки, устаревшие
+клавиатуры, неверные аргументы - считаются в реестре и видны в report().
+"""
+
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CallbackHandler = Callable[..., Awaitable[Any]]
+ArgumentParser = Callable[[str], Any]
+
+
+def choice(*values: str) -> ArgumentParser:
+    """Парсер аргумента из фиксированного набора строк"""
+    allowed = frozenset(values)
+    
+    def parse(value: str) -> str:
+        if value not in allowed:
+            raise ValueError(f"Недопустимое значение: {value}")
+        return value
+    
+    parse.__name__ = f"choice({', '.join(values)})"
+    return parse
+
+
+class CallbackRouter:
+    """Таблица маршрутов callback_data -> обработчик"""
+    
+    # Сколько разных нераспознанных callback_data помнить поименно
+    MAX_UNROUTED_KEYS = 200
+    OTHER_KEY = '<other>'
+    
+    def __init__(self):
+        self._exact: Dict[str, CallbackHandler] = {}
+        self._prefixes: Dict[str, Tuple[CallbackHandler, ArgumentParser]] = {}
+        self.hits: Counter = Counter()
+        self.unrouted: Counter = Counter()
+    
+    def _check_free(self, key: str):
+        if key in self._exact or key in self._prefixes:
+            raise ValueError(f"Маршрут {key!r} уже зарегистрирован")
+    
+    def add(self, key: str, handler: CallbackHandler):
+        """
+        Маршрут по точному ключу
+        
+        Обработчик вызывается как handler(update, context).
+        """
+        self._check_free(key)
+        self._exact[key] = handler
+    
+    def add_prefix(self, prefix: str, handler: CallbackHandler, parse: ArgumentParser = int):
+        """
+        Маршрут по префиксу с одним аргументом
+        
+        Обработчик вызывается как handler(update, context, parse(аргумент)).
+        
+        Args:
+            prefix: Префикс, заканчивающийся на '_' (аргумент - все после него)
+            handler: Корутина-обработчик
+            parse: Парсер аргумента; ValueError/TypeError - callback не распознан
+        """
+        if not prefix.endswith('_'):
+            raise ValueError(f"Префикс должен заканчиваться на '_': {prefix!r}")
+        self._check_free(prefix)
+        self._prefixes[prefix] = (handler, parse)
+    
+    def resolve(self, data: str) -> Optional[Tuple[str, CallbackHandler, tuple]]:
+        """Маршрут для callback_data: (ключ маршрута, обработчик, аргументы) или None"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return data, handler, ()
+        
+        head, separator, argument = data.rpartition('_')
+        route = self._prefixes.get(head + separator) if separator else None
+        if route is None:
+            return None
+        
+        handler, parse = route
+        try:
+            return head + separator, handler, (parse(argument),)
+        except (TypeError, ValueError):
+            return None
+    
+    def _record_unrouted(self, data: str):
+        if data not in self.unrouted and len(self.unrouted) >= self.MAX_UNROUTED_KEYS:
+            data = self.OTHER_KEY
+        self.unrouted[data] += 1
+    
+    async def dispatch(self, update, context):
+        """Обработчик CallbackQueryHandler: ответ на запрос и вызов маршрута"""
+        query = update.callback_query
+        await query.answer()
+        
+        data = query.data or ''
+        resolved = self.resolve(data)
+        if resolved is None:
+            self._record_unrouted(data)
+            logger.warning(f"Нет обработчика для callback_data={data!r} (user_id={query.from_user.id})")
+            return
+        
+        key, handler, args = resolved
+        self.hits[key] += 1
+        await handler(update, context, *args)
+    
+    def routes(self) -> List[str]:
+        """Зарегистрированные ключи и префиксы"""
+        return sorted([*self._exact, *self._prefixes])
+    
+    def report(self) -> Dict[str, Any]:
+        """
+        Реестр маршрутизации с момента запуска
+        
+        Returns:
+            routes - число маршрутов, hits - вызовы по маршрутам,
+            unused - маршруты без единого вызова, unrouted - нераспознанные
+            callback_data с числом нажатий
+        """
+        routes = self.routes()
+        return {
+            'routes': len(routes),
+            'hits': dict(self.hits.most_common()),
+            'unused': [key for key in routes if not self.hits[key]],
+            'unrouted': dict(self.unrouted.most_common()),
+        }
@@ -0,0 +1,212 @@
+"""
+Диалог регистрации и редактирования профиля как конечный автомат
+
+Этап диалога хранится в users.stage. Таблица INPUT_STAGES описывает
+этапы, на которых бот ждет текст: какое поле профиля заполняет ввод,
+каким валидатором он проверяется, в какой этап переходит пользователь
+и какой экран ему показать. step() - чистая функция без Telegram и базы:
+по этапу и тексту возвращает Transition, а обработчик сохраняет поле и
+новый этап одной записью (update_user_fields) и рисует экран по имени.
+
+Модуль не зависит от telegram, поэтому весь поток можно проверить и
+замерить отдельно: python conversation.py
+"""
+
+import re
+from typing import Callable, Dict, Optional, Tuple
+
+# Валидатор: текст -> (ok, очищенное значение или текст ошибки)
+Validator = Callable[[str], Tuple[bool, str]]
+
+
+def sanitize_input(text: str, max_length: int = 100) -> str:
+    """Схлопывание пробелов и обрезка пользовательского ввода до max_length"""
+    if not text:
+        return ""
+    
+    cleaned = ' '.join(text.split())
+    if len(cleaned) > max_length:
+        cleaned = cleaned[:max_length]
+    return cleaned.strip()
+
+
+def validate_name(name: str) -> Tuple[bool, str]:
+    """
+    Валидация имени пользователя
+    
+    Returns:
+        tuple[bool, str]: (is_valid, очищенное имя или текст ошибки)
+    """
+    if not name or not name.strip():
+        return False, "Имя не может быть пустым"
+    
+    sanitized = sanitize_input(name, max_length=50)
+    
+    if len(sanitized) < 2:
+        return False, "Имя должно содержать минимум 2 символа"
+    
+    if len(sanitized) > 50:
+        return False, "Имя слишком длинное (максимум 50 символов)"
+    
+    # Имя должно содержать хотя бы одну букву
+    if not re.search(r'[а-яА-Яa-zA-Z]', sanitized):
+        return False, "Имя должно содержать хотя бы одну букву"
+    
+    return True, sanitized
+
+
+PHONE_PATTERN = re.compile(r'^(?:8|7|\+7)\d{10}$')
+
+
+def validate_phone_number(phone: str) -> bool:
+    """
+    Валидация номера телефона
+    
+    Принимаются форматы:
+    - 89117929394 (11 цифр, начинается с 8)
+    - 79117929394 (11 цифр, начинается с 7)
+    - +79117929394 (+ и 11 цифр, начинается с 7)
+    - С пробелами, скобками, дефисами: +7 (911) 792-93-94
+    """
+    if not phone:
+        return False
+    
+    # Убираем все символы кроме цифр и +
+    cleaned = re.sub(r'[^\d+]', '', phone)
+    return PHONE_PATTERN.match(cleaned) is not None
+
+
+def validate_phone(phone: str) -> Tuple[bool, str]:
+    """validate_phone_number в форме валидатора этапа (номер сохраняется как введен)"""
+    if validate_phone_number(phone):
+        return True, phone
+    return False, "Некорректный номер телефона"
+
+
+class InputStage:
+    """Этап, на котором бот ждет от пользователя текст"""
+    
+    __slots__ = ('field', 'validate', 'next_stage', 'screen', 'title')
+    
+    def __init__(self, field: str, validate: Validator, next_stage: str, screen: str, title: str = ''):
+        """
+        Args:
+            field: Поле профиля, которое заполняет ввод
+            validate: Валидатор ввода
+            next_stage: Этап после успешного ввода
+            screen: Экран, который показывается после перехода
+            title: Заголовок экрана (для общих экранов подтверждения)
+        """
+        self.field = field
+        self.validate = validate
+        self.next_stage = next_stage
+        self.screen = screen
+        self.title = title
+
+
+# Таблица переходов по текстовому вводу: этап -> описание этапа
+INPUT_STAGES: Dict[str, InputStage] = {
+    # Регистрация: пол (кнопки) -> имя -> телефон -> подтверждение
+    'name_input': InputStage('name', validate_name, 'phone_input', 'ask_phone'),
+    'phone_input': InputStage('phone', validate_phone, 'phone_confirmation', 'confirm_registration',
+                              'Благодарим за регистрацию!'),
+    # Исправление данных с экрана подтверждения регистрации
+    'edit_name': InputStage('name', validate_name, 'phone_confirmation', 'confirm_registration',
+                            'Имя обновлено!'),
+    'edit_phone': InputStage('phone', validate_phone, 'phone_confirmation', 'confirm_registration',
+                             'Телефон обновлен!'),
+    # Упрощенная регистрация (без телефона)
+    'edit_name_simple': InputStage('name', validate_name, 'confirmation', 'confirm_simple_registration',
+                                   'Имя обновлено!'),
+    # Редактирование профиля: пол (кнопки) -> имя -> телефон -> подтверждение
+    'edit_profile_name': InputStage('name', validate_name, 'edit_profile_phone', 'ask_profile_phone'),
+    'edit_profile_phone': InputStage('phone', validate_phone, 'edit_profile_confirmation', 'confirm_profile_edit',
+                                     'Профиль обновлен!'),
+}
+
+# Этапы подтверждения: ответ только кнопками, текст не меняет этап
+BUTTON_STAGES = frozenset({'confirmation', 'phone_confirmation', 'edit_profile_confirmation'})
+
+# Этапы, на которых сообщение пользователя не удаляется из чата
+KEEP_INPUT_STAGES = frozenset({'phone_confirmation'})
+
+# Экраны ошибок ввода по полю
+ERROR_SCREENS = {'name': 'name_error', 'phone': 'phone_error'}
+USE_BUTTONS_SCREEN = 'use_buttons'
+
+
+class Transition:
+    """Результат обработки текста на этапе диалога"""
+    
+    __slots__ = ('stage', 'next_stage', 'fields', 'screen', 'title', 'error')
+    
+    def __init__(self, stage: str, next_stage: Optional[str], fields: Dict[str, str], screen: str,
+                 title: str = '', error: str = ''):
+        self.stage = stage
+        self.next_stage = next_stage
+        self.fields = fields
+        self.screen = screen
+        self.title = title
+        self.error = error
+    
+    @property
+    def changes(self) -> Dict[str, str]:
+        """Поля для единственной записи перехода (пусто - писать нечего)"""
+        if self.next_stage is None:
+            return {}
+        return {**self.fields, 'stage': self.next_stage}
+    
+    def __repr__(self):
+        return (f"Transition({self.stage!r} -> {self.next_stage!r}, fields={self.fields!r}, "
+                f"screen={self.screen!r}, error={self.error!r})")
+
+
+def deletes_input(stage: str) -> bool:
+    """Удалять ли сообщение пользователя на этапе stage"""
+    return stage not in KEEP_INPUT_STAGES
+
+
+def step(stage: str, text: str) -> Optional[Transition]:
+    """
+    Переход по тексту пользователя
+    
+    Returns:
+        Transition с новым этапом и полями для записи, Transition с
+        экраном ошибки (этап не меняется) или None - этап не ждет текста
+    """
+    spec = INPUT_STAGES.get(stage)
+    if spec is None:
+        if stage in BUTTON_STAGES:
+            return Transition(stage, None, {}, USE_BUTTONS_SCREEN)
+        return None
+    
+    is_valid, value = spec.validate(text)
+    if not is_valid:
+        return Transition(stage, None, {}, ERROR_SCREENS[spec.field], error=value)
+    return Transition(stage, spec.next_stage, {spec.field: value}, spec.screen, spec.title)
+
+
+if __name__ == '__main__':
+    import timeit
+    
+    # Полный проход регистрации и редактирования профиля без базы и Telegram
+    scenario = [
+        ('name_input', '  Анна  ', 'phone_input'),
+        ('phone_input', '8 911 792-93-94', 'phone_confirmation'),
+        ('phone_input', '12345', None),
+        ('edit_name', '1', None),
+        ('edit_name', 'Анна Петровна', 'phone_confirmation'),
+        ('edit_profile_name', 'Kate', 'edit_profile_phone'),
+        ('edit_profile_phone', '+7 (911) 792-93-94', 'edit_profile_confirmation'),
+        ('phone_confirmation', 'ok', None),
+        ('registered', 'привет', None),
+    ]
+    for stage, text, expected in scenario:
+        transition = step(stage, text)
+        next_stage = transition.next_stage if transition else None
+        assert next_stage == expected, (stage, text, transition)
+        print(f"{stage:20} {text!r:24} -> {transition}")
+    
+    runs = 100000
+    seconds = timeit.timeit(lambda: [step(stage, text) for stage, text, _ in scenario], number=runs // len(scenario))
+    print(f"\nstep(): {seconds / runs * 1e6:.2f} мкс на переход")
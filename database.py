@@ -1,114 +1,820 @@
+import asyncio
+import base64
+import functools
 import sqlite3
 import json
-from datetime import datetime
-from typing import Optional, Dict, List
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional, Dict, Iterator, List, Tuple
 
-class Database:
-    def __init__(self, db_path: str):
+import migrations
+from records import UserRecord, OrderRecord, OrderItemRecord, ProductRecord, CartItem, FavoriteItem, NotificationRecord
+
+# Тексты запросов горячих методов Database. Методы выполняют именно их,
+# а Database.find_full_scans() проверяет их планы на полный просмотр
+# таблиц (python database.py, tests/test_query_plans.py).
+USER_BY_ID_SQL = f'SELECT {UserRecord.COLUMNS} FROM users WHERE user_id = ?'
+ALL_USERS_SQL = f'SELECT {UserRecord.COLUMNS} FROM users ORDER BY registration_date DESC'
+USER_ORDERS_SQL = f'SELECT {OrderRecord.COLUMNS} FROM orders WHERE user_id = ? ORDER BY order_date DESC'
+ORDER_ITEMS_SQL = f'SELECT {OrderItemRecord.COLUMNS} FROM order_items WHERE order_id = ? ORDER BY id'
+# Список ID - одним JSON-параметром: текст запроса не зависит от размера
+# страницы и переиспользуется из кэша запросов
+ORDERS_ITEMS_SQL = f'''
+    SELECT {OrderItemRecord.COLUMNS} FROM order_items
+    WHERE order_id IN (SELECT value FROM json_each(?))
+    ORDER BY order_id, id
+'''
+PENDING_NOTIFICATIONS_SQL = f'''
+    SELECT {NotificationRecord.COLUMNS} FROM notifications
+    WHERE is_sent = 0
+    ORDER BY scheduled_date ASC
+'''
+CART_SQL = f'''
+    SELECT {CartItem.COLUMNS}
+    FROM cart c
+    JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = ?
+    ORDER BY c.added_date DESC
+'''
+IN_FAVORITES_SQL = 'SELECT 1 FROM favorites WHERE user_id = ? AND product_id = ?'
+
+# Шаблоны запросов с условием из фильтров (подставляются через str.format)
+USER_IDS_BATCH_SQL = '''
+    SELECT user_id FROM users
+    WHERE user_id > ? AND {where}
+    ORDER BY user_id
+    LIMIT ?
+'''
+KEYSET_PAGE_SQL = '''
+    SELECT {columns} FROM {table}
+    WHERE {where}
+    ORDER BY {order_by}
+    LIMIT ?
+'''
+ORDERS_WITH_USERS_SQL = '''
+    SELECT {order_columns}, {user_columns}
+    FROM orders o
+    LEFT JOIN users u ON u.user_id = o.user_id
+    WHERE {where}
+    ORDER BY {order_by}
+    LIMIT ?
+'''
+
+# Горячие запросы без подстановок: имя -> (текст, пример параметров).
+# Запросы по шаблонам перечисляет Database.hot_queries().
+HOT_QUERIES = {
+    'get_user': (USER_BY_ID_SQL, (1,)),
+    'get_all_users': (ALL_USERS_SQL, ()),
+    'get_user_orders': (USER_ORDERS_SQL, (1,)),
+    'get_order_items': (ORDER_ITEMS_SQL, (1,)),
+    'list_orders_with_users.items': (ORDERS_ITEMS_SQL, ('[1, 2]',)),
+    'get_pending_notifications': (PENDING_NOTIFICATIONS_SQL, ()),
+    'get_cart': (CART_SQL, (1,)),
+    'is_in_favorites': (IN_FAVORITES_SQL, (1, 1)),
+}
+
+
+# Сегменты аудитории для рассылок: имя -> (условие WHERE, параметры)
+USER_SEGMENTS = {
+    'all': ('1 = 1', ()),
+    'active': ("last_activity >= datetime('now', '-30 days')", ()),
+    'new': ("registration_date >= datetime('now', '-7 days')", ()),
+    'completed': ('stage = ?', ('completed',)),
+    'registered': ('stage = ?', ('registered',)),
+}
+
+
+# Статусы оплаченных заказов: 'paid' ставит оплата в боте (create_order),
+# 'completed' - администратор после выполнения заказа
+PAID_ORDER_STATUSES = ('paid', 'completed')
+
+
+# Метрики временных рядов: имя -> (таблица, колонка, агрегат по неделе).
+# Активные пользователи за неделю - пиковое дневное значение.
+ANALYTICS_METRICS = {
+    'registrations': ('daily_user_stats', 'registrations', 'SUM'),
+    'active_users': ('daily_user_stats', 'active_users', 'MAX'),
+    'orders': ('daily_order_stats', 'orders', 'SUM'),
+    'completed_orders': ('daily_order_stats', 'completed_orders', 'SUM'),
+    'revenue': ('daily_order_stats', 'revenue', 'SUM'),
+}
+
+
+# Поля заказа и сводки покупателя в списке заказов (без тяжелого data)
+ORDER_SUMMARY_FIELDS = tuple(field for field in OrderRecord.FIELDS if field != 'data')
+USER_SUMMARY_FIELDS = ('user_id', 'username', 'first_name', 'last_name', 'name', 'phone', 'stage')
+
+# Ключи сортировки списков в админке - только колонки с индексами
+# (последний элемент ключа - первичный ключ, он же в конце каждого индекса)
+USER_SORTS = frozenset({'registration_date', 'last_activity', 'user_id'})
+ORDER_SORTS = frozenset({'order_date', 'id'})
+
+
+# Поля users, которые разрешено менять через update_user_fields/update_user_data
+USER_UPDATABLE_FIELDS = frozenset({
+    'username', 'first_name', 'last_name', 'gender', 'name', 'phone', 'email', 'stage', 'data'
+})
+
+# Поля products, которые разрешено менять через update_product
+PRODUCT_UPDATABLE_FIELDS = frozenset({'name', 'price', 'description', 'is_active'})
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений SQLite
+    
+    Одно соединение на запись (доступ сериализуется блокировкой) и до
+    max_readers соединений на чтение. База работает в режиме WAL, поэтому
+    читатели не блокируют писателя и наоборот.
+    
+    Для db_path == ':memory:' база живет в памяти одного удерживаемого
+    соединения: читатели получают его же под блокировкой записи. Данные
+    и поведение запросов те же, что у файловой базы, только без
+    параллельного чтения.
+    
+    С read_only=True соединения на чтение открываются только для чтения
+    (URI mode=ro и PRAGMA query_only): так работает процесс админ-API,
+    который читает базу бота через WAL, не беря блокировок записи.
+    Соединение на запись в этом режиме открывается лишь при первой явной
+    записи (действия администратора).
+    """
+    
+    MEMORY_PATH = ':memory:'
+    
+    PRAGMAS = (
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA cache_size = -16000',
+        'PRAGMA mmap_size = 268435456',
+        'PRAGMA temp_store = MEMORY',
+    )
+    
+    def __init__(self, db_path: str, max_readers: int = 4, timeout: float = 30.0,
+                 read_only: bool = False, cached_statements: int = 128):
         self.db_path = db_path
-        self.init_database()
+        self.in_memory = db_path == self.MEMORY_PATH
+        if read_only and self.in_memory:
+            raise ValueError("База в памяти не может быть открыта только для чтения")
+        self.read_only = read_only
+        self.max_readers = max(1, max_readers)
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._readers_lock = threading.Lock()
+        self._readers_created = 0
+        self._closed = False
+        
+        self._writer = None if read_only else self._open_writer()
     
-    def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Таблица пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    gender TEXT,
-                    name TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    stage TEXT DEFAULT 'start',
-                    last_message_id INTEGER,
-                    data JSON
-                )
-            ''')
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Открытие соединения с настройками пула"""
+        conn = sqlite3.connect(
+            f'{Path(self.db_path).resolve().as_uri()}?mode=ro' if read_only else self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            uri=read_only
+        )
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _open_writer(self) -> sqlite3.Connection:
+        """Соединение на запись (переводит базу в режим WAL)"""
+        conn = self._connect()
+        if not self.in_memory:
+            conn.execute('PRAGMA journal_mode = WAL')
+        return conn
+    
+    @contextmanager
+    def writer(self):
+        """
+        Соединение на запись
+        
+        Коммитит транзакцию при успешном выходе из блока и откатывает
+        при исключении (как `with sqlite3.connect(...)`).
+        """
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Пул соединений закрыт")
+            if self._writer is None:
+                self._writer = self._open_writer()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    @contextmanager
+    def reader(self):
+        """Соединение на чтение из пула"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        
+        if self.in_memory:
+            with self._write_lock:
+                # Не трогаем транзакцию записи, внутри которой идет чтение
+                in_transaction = self._writer.in_transaction
+                try:
+                    yield self._writer
+                finally:
+                    if self._writer.in_transaction and not in_transaction:
+                        self._writer.rollback()
+            return
+        
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                if self._readers_created < self.max_readers:
+                    self._readers_created += 1
+                    conn = self._connect(read_only=self.read_only)
+            if conn is None:
+                conn = self._readers.get(timeout=self.timeout)
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+    
+    def close(self):
+        """Закрытие всех соединений пула"""
+        with self._write_lock:
+            self._closed = True
+            if self._writer is not None:
+                self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи частых малоценных обновлений пользователей
+    
+    Обновления (last_message_id, last_activity) схлопываются в памяти по
+    user_id - хранится только последнее значение каждого поля - и
+    сбрасываются в базу одной транзакцией раз в interval секунд, при
+    переполнении и при закрытии. Пока запись идет, сбрасываемые значения
+    остаются видимыми через get().
+    """
+    
+    def __init__(self, flush_func: Callable[[Dict[int, Dict[str, Any]]], None], interval: float = 5.0, max_pending: int = 1000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._flush_func = flush_func
+        
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._flushing: Dict[int, Dict[str, Any]] = {}
+        
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+    
+    def put(self, user_id: int, **fields):
+        """Добавление обновления полей пользователя в буфер"""
+        with self._lock:
+            self._pending.setdefault(user_id, {}).update(fields)
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            self.flush()
+    
+    def clear(self):
+        """Сброс еще не записанных обновлений"""
+        with self._lock:
+            self._pending = {}
+    
+    def get(self, user_id: int) -> Dict[str, Any]:
+        """Еще не записанные в базу поля пользователя"""
+        with self._lock:
+            fields = dict(self._flushing.get(user_id, ()))
+            fields.update(self._pending.get(user_id, ()))
+            return fields
+    
+    def flush(self):
+        """Запись накопленных обновлений одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, {}
             
-            # Миграция: добавляем поле last_message_id, если его нет
             try:
-                cursor.execute('ALTER TABLE users ADD COLUMN last_message_id INTEGER')
-            except sqlite3.OperationalError:
-                pass  # Поле уже существует
+                self._flush_func(self._flushing)
+            except Exception as e:
+                print(f"Ошибка при записи буфера обновлений: {e}")
+                # Возвращаем несохраненное в буфер, не затирая более новые значения
+                with self._lock:
+                    for user_id, fields in self._flushing.items():
+                        merged = dict(fields)
+                        merged.update(self._pending.get(user_id, ()))
+                        self._pending[user_id] = merged
+            finally:
+                with self._lock:
+                    self._flushing = {}
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+    
+    def close(self):
+        """Остановка фонового потока и финальная запись"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
+class ProductCatalog:
+    """
+    Кэш каталога активных продуктов с индексом по id
+    
+    Каталог перечитывается только при смене catalog_version (ее повышают
+    триггеры на products). Версия проверяется не чаще раза в check_interval
+    секунд, поэтому изменения из другого процесса (админ-API) видны с
+    задержкой не больше check_interval; изменения через Database - сразу
+    (invalidate()).
+    """
+    
+    def __init__(self, pool: ConnectionPool, check_interval: float = 5.0):
+        self.pool = pool
+        self.check_interval = check_interval
+        
+        self._lock = threading.Lock()
+        self._products: List[ProductRecord] = []
+        self._by_id: Dict[int, ProductRecord] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+    
+    def _is_fresh(self) -> bool:
+        return self._version is not None and time.monotonic() - self._checked_at < self.check_interval
+    
+    def _refresh(self):
+        """Перечитывание каталога, если изменилась его версия"""
+        if self._is_fresh():
+            return
+        
+        with self._lock:
+            if self._is_fresh():
+                return
             
-            # Таблица платных продуктов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    price REAL NOT NULL,
-                    description TEXT,
-                    is_active BOOLEAN DEFAULT 1
-                )
-            ''')
+            with self.pool.reader() as conn:
+                # Версия и продукты читаются из одного снимка базы
+                conn.execute('BEGIN')
+                row = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+                version = row[0] if row else 0
+                
+                if version != self._version:
+                    cursor = conn.cursor()
+                    cursor.row_factory = ProductRecord.row_factory
+                    cursor.execute(f'SELECT {ProductRecord.COLUMNS} FROM products WHERE is_active = 1')
+                    products = cursor.fetchall()
+                    
+                    self._products = products
+                    self._by_id = {product.id: product for product in products}
+                    self._version = version
             
-            # Таблица заказов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    total_amount REAL,
-                    status TEXT DEFAULT 'pending',
-                    order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    data TEXT
-                )
-            ''')
+            self._checked_at = time.monotonic()
+    
+    def invalidate(self):
+        """Принудительная проверка версии при следующем обращении"""
+        self._checked_at = 0.0
+    
+    @property
+    def version(self) -> int:
+        """Текущая версия каталога"""
+        self._refresh()
+        return self._version
+    
+    def products(self) -> List[ProductRecord]:
+        """Все активные продукты"""
+        self._refresh()
+        return list(self._products)
+    
+    def get(self, product_id: int) -> Optional[ProductRecord]:
+        """Активный продукт по id за O(1)"""
+        self._refresh()
+        return self._by_id.get(product_id)
+
+
+def _utc_timestamp() -> str:
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _shift_day(day: str, days: int) -> str:
+    """Сдвиг даты YYYY-MM-DD на days дней"""
+    return (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def _fill_series(values: Dict[str, Any], date_from: str, date_to: str, period: str) -> List[Dict[str, Any]]:
+    """Временной ряд {начало дня/недели: значение} без пропусков (пропуски - нули)"""
+    first = datetime.strptime(date_from, '%Y-%m-%d')
+    if period == 'week':
+        first -= timedelta(days=first.weekday())
+    step = 7 if period == 'week' else 1
+    current = first.strftime('%Y-%m-%d')
+    series = []
+    while current <= date_to:
+        series.append({'date': current, 'value': values.get(current, 0)})
+        current = _shift_day(current, step)
+    return series
+
+
+def _encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Курсор keyset-пагинации: значение ключа сортировки и id последней строки"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Разбор курсора (ValueError для испорченного курсора)"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError("Некорректный курсор пагинации")
+
+
+class DailyStatsRollup:
+    """
+    Дневные агрегаты для графиков (daily_user_stats, daily_order_stats)
+    
+    Пересчитываются только открытые дни - после closed_through и до
+    сегодняшнего - и закрытые дни, которые триггеры пометили в
+    rollup_dirty_days (заказ изменили или удалили задним числом). Обычно
+    это один-два дня, поэтому обновление не зависит от объема истории.
+    
+    Активные пользователи за день - те, чья последняя активность пришлась
+    на этот день; значение дня только растет, пока день открыт, и
+    сохраняет максимум после закрытия.
+    """
+    
+    def __init__(self, pool: ConnectionPool, interval: float = 300.0):
+        self.pool = pool
+        self.interval = interval
+        
+        self._stop = threading.Event()
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._run, name='db-daily-rollup', daemon=True)
+            self._thread.start()
+    
+    def _rollup(self, conn: sqlite3.Connection, day_from: str, day_to: str):
+        """Пересчет дней day_from..day_to включительно"""
+        params = {'start': day_from, 'end': _shift_day(day_to, 1), 'day_from': day_from, 'day_to': day_to}
+        
+        conn.execute(
+            'UPDATE daily_user_stats SET registrations = 0 WHERE day BETWEEN :day_from AND :day_to',
+            params
+        )
+        conn.execute('''
+            INSERT INTO daily_user_stats (day, registrations)
+            SELECT date(registration_date), COUNT(*) FROM users
+            WHERE registration_date >= :start AND registration_date < :end
+            GROUP BY date(registration_date)
+            ON CONFLICT (day) DO UPDATE SET registrations = excluded.registrations
+        ''', params)
+        conn.execute('''
+            INSERT INTO daily_user_stats (day, active_users)
+            SELECT date(last_activity), COUNT(*) FROM users
+            WHERE last_activity >= :start AND last_activity < :end
+            GROUP BY date(last_activity)
+            ON CONFLICT (day) DO UPDATE SET active_users = MAX(active_users, excluded.active_users)
+        ''', params)
+        
+        conn.execute('DELETE FROM daily_order_stats WHERE day BETWEEN :day_from AND :day_to', params)
+        conn.execute('''
+            INSERT INTO daily_order_stats (day, orders, completed_orders, revenue)
+            SELECT date(order_date), COUNT(*),
+                   SUM(status = 'completed'),
+                   SUM(CASE WHEN status = 'completed' THEN total_amount ELSE 0 END)
+            FROM orders
+            WHERE order_date >= :start AND order_date < :end
+            GROUP BY date(order_date)
+        ''', params)
+    
+    def refresh(self) -> int:
+        """
+        Пересчет открытых и измененных дней одной транзакцией
+        
+        Returns:
+            Количество пересчитанных дней
+        """
+        today = _utc_timestamp()[:10]
+        with self.pool.writer() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            closed_through = conn.execute('SELECT closed_through FROM daily_stats_state WHERE id = 1').fetchone()[0]
+            if closed_through:
+                start = _shift_day(closed_through, 1)
+            else:
+                # Первый запуск: считаем всю историю
+                first = conn.execute('''
+                    SELECT MIN(day) FROM (
+                        SELECT MIN(registration_date) AS day FROM users
+                        UNION ALL
+                        SELECT MIN(order_date) FROM orders
+                    )
+                ''').fetchone()[0]
+                start = min(first[:10], today) if first else today
             
-            # Таблица уведомлений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    target_audience TEXT DEFAULT 'all',
-                    scheduled_date TIMESTAMP,
-                    sent_date TIMESTAMP,
-                    is_sent BOOLEAN DEFAULT 0
-                )
-            ''')
+            dirty = [row[0] for row in conn.execute('SELECT day FROM rollup_dirty_days WHERE day < ?', (start,))]
             
-            # Таблица корзины
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cart (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    quantity INTEGER DEFAULT 1,
-                    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, product_id)
-                )
-            ''')
+            self._rollup(conn, start, today)
+            for day in dirty:
+                self._rollup(conn, day, day)
             
-            # Таблица избранного
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS favorites (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, product_id)
-                )
-            ''')
+            conn.execute('DELETE FROM rollup_dirty_days')
+            conn.execute('UPDATE daily_stats_state SET closed_through = ? WHERE id = 1', (_shift_day(today, -1),))
+        
+        start_date = datetime.strptime(start, '%Y-%m-%d')
+        return (datetime.strptime(today, '%Y-%m-%d') - start_date).days + 1 + len(dirty)
+    
+    def _run(self):
+        # Первый пересчет - сразу после запуска
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Ошибка при пересчете дневной статистики: {e}")
+            if self._stop.wait(self.interval):
+                break
+    
+    def close(self):
+        """Остановка фонового потока"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+class Database:
+    # Время жизни кэша общего количества для отфильтрованных списков, секунды
+    COUNT_CACHE_TTL = 30.0
+    
+    def __init__(self, db_path: str, pool_size: int = 4, flush_interval: float = 5.0, catalog_check_interval: float = 5.0,
+                 rollup_interval: float = 300.0, read_only: bool = False, cached_statements: int = 128):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            pool_size: Количество соединений на чтение
+            flush_interval: Период записи буфера last_message_id/last_activity
+                в секундах (0 - писать сразу, без буфера)
+            catalog_check_interval: Как часто (в секундах) проверять версию
+                каталога продуктов на изменения из других процессов
+            rollup_interval: Период пересчета дневной статистики в секундах
+                (0 - без фонового пересчета, только refresh_daily_stats())
+            read_only: Режим процесса-читателя (админ-API): чтения идут через
+                соединения только для чтения, без буфера записи и фонового
+                пересчета статистики - их ведет процесс бота
+            cached_statements: Размер кэша подготовленных запросов на соединение
+        """
+        self.db_path = db_path
+        self.read_only = read_only
+        self.pool = ConnectionPool(
+            db_path,
+            max_readers=pool_size,
+            read_only=read_only,
+            cached_statements=cached_statements
+        )
+        self.init_database()
+        
+        self.catalog = ProductCatalog(self.pool, check_interval=catalog_check_interval)
+        
+        if read_only:
+            flush_interval = rollup_interval = 0
+        
+        self.write_buffer = None
+        if flush_interval > 0:
+            self.write_buffer = WriteBehindBuffer(self._flush_user_updates, interval=flush_interval)
+        
+        self.rollup = DailyStatsRollup(self.pool, interval=rollup_interval)
+        self._count_cache: Dict[tuple, Tuple[float, int]] = {}
+    
+    def close(self):
+        """Запись буфера и закрытие соединений с базой данных"""
+        self.rollup.close()
+        if self.write_buffer:
+            self.write_buffer.close()
+        self.pool.close()
+    
+    def init_database(self):
+        """Инициализация базы данных: применение миграций схемы"""
+        if self.read_only:
+            # Схема обычно уже актуальна (ее обновляет бот) - запись не нужна
+            try:
+                with self.pool.reader() as conn:
+                    version = migrations.get_schema_version(conn)
+                    journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            except sqlite3.OperationalError:
+                version, journal_mode = 0, None  # Файла базы еще нет
             
-            conn.commit()
+            if version >= migrations.LATEST_VERSION:
+                if journal_mode != 'wal':
+                    print(f"Внимание: база {self.db_path} не в режиме WAL, чтение может задерживать запись")
+                self.schema_version = version
+                return
+        
+        with self.pool.writer() as conn:
+            self.schema_version = migrations.migrate(conn)
+    
+    def snapshot(self) -> bytes:
+        """
+        Снимок всей базы (в памяти или в файле) для restore()
+        
+        Удобно для фикстур тестов и бенчмарков: база наполняется один раз,
+        а перед каждым тестом восстанавливается из снимка.
+        """
+        if self.write_buffer:
+            self.write_buffer.flush()
+        with self.pool.reader() as conn:
+            return conn.serialize()
+    
+    def restore(self, snapshot: bytes):
+        """Восстановление базы из снимка snapshot() с отменой буферов и кэшей"""
+        if self.write_buffer:
+            self.write_buffer.clear()
+        
+        # Снимок файловой базы помечен в заголовке как WAL; в памяти такой
+        # образ не открывается, поэтому возвращаем пометку rollback-журнала
+        if snapshot[18:20] == b'\x02\x02':
+            snapshot = snapshot[:18] + b'\x01\x01' + snapshot[20:]
+        
+        source = sqlite3.connect(ConnectionPool.MEMORY_PATH)
+        try:
+            source.deserialize(snapshot)
+            with self.pool.writer() as conn:
+                source.backup(conn)
+        finally:
+            source.close()
+        
+        self.catalog.invalidate()
+        self._count_cache.clear()
+    
+    @staticmethod
+    def _keyset_query(sort: str, id_column: str, descending: bool, conditions: List[str],
+                      params: List[Any], cursor: Optional[str]) -> Tuple[str, List[Any], str]:
+        """
+        WHERE и ORDER BY для keyset-пагинации по (sort, id_column)
+        
+        Returns:
+            (условие WHERE, параметры, выражение ORDER BY)
+        """
+        conditions = list(conditions)
+        params = list(params)
+        if cursor:
+            sort_value, row_id = _decode_cursor(cursor)
+            if sort == id_column:
+                conditions.append(f'{id_column} {"<" if descending else ">"} ?')
+                params.append(row_id)
+            else:
+                conditions.append(f'({sort}, {id_column}) {"<" if descending else ">"} (?, ?)')
+                params.extend((sort_value, row_id))
+        
+        where = ' AND '.join(conditions) or '1 = 1'
+        direction = 'DESC' if descending else 'ASC'
+        order_by = f'{sort} {direction}' if sort == id_column else f'{sort} {direction}, {id_column} {direction}'
+        return where, params, order_by
+    
+    @classmethod
+    def _keyset_page_query(cls, record_cls, table: str, id_column: str, sort: str, descending: bool,
+                           conditions: List[str], params: List[Any], cursor: Optional[str]) -> Tuple[str, List[Any]]:
+        """
+        Запрос страницы записей по KEYSET_PAGE_SQL
+        
+        Returns:
+            (текст запроса, параметры без LIMIT)
+        """
+        where, params, order_by = cls._keyset_query(sort, id_column, descending, conditions, params, cursor)
+        sql = KEYSET_PAGE_SQL.format(columns=record_cls.COLUMNS, table=table, where=where, order_by=order_by)
+        return sql, params
+    
+    def _keyset_page(self, record_cls, table: str, id_column: str, sort: str, descending: bool,
+                     conditions: List[str], params: List[Any], cursor: Optional[str], limit: int):
+        """
+        Страница записей с keyset-пагинацией по (sort, id_column)
+        
+        Returns:
+            (записи, курсор следующей страницы или None)
+        """
+        sql, params = self._keyset_page_query(record_cls, table, id_column, sort, descending, conditions, params, cursor)
+        
+        with self.pool.reader() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.row_factory = record_cls.row_factory
+            db_cursor.execute(sql, (*params, limit + 1))
+            rows = db_cursor.fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = _encode_cursor(getattr(last, sort), getattr(last, id_column))
+        return rows, next_cursor
+    
+    def _cached_count(self, key: tuple, sql: str, params: tuple) -> int:
+        """COUNT(*) по фильтру с кэшем на COUNT_CACHE_TTL секунд"""
+        now = time.monotonic()
+        cached = self._count_cache.get(key)
+        if cached and now - cached[0] < self.COUNT_CACHE_TTL:
+            return cached[1]
+        
+        with self.pool.reader() as conn:
+            total = conn.execute(sql, params).fetchone()[0]
+        self._count_cache[key] = (now, total)
+        return total
+    
+    def explain_query_plan(self, sql: str, params: tuple = ()) -> List[str]:
+        """План выполнения запроса (колонка detail из EXPLAIN QUERY PLAN)"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in cursor.fetchall()]
+    
+    @classmethod
+    def hot_queries(cls) -> Dict[str, Tuple[str, tuple]]:
+        """
+        Все горячие запросы с примерами параметров
+        
+        К HOT_QUERIES добавляются запросы по шаблонам - теми же
+        построителями, что у методов, для каждого сегмента рассылки,
+        ключа сортировки и набора фильтров админки.
+        
+        Returns:
+            Словарь {имя запроса: (текст, параметры)}
+        """
+        queries = dict(HOT_QUERIES)
+        for segment, (where, params) in USER_SEGMENTS.items():
+            queries[f'get_user_ids_batch[{segment}]'] = (USER_IDS_BATCH_SQL.format(where=where), (0, *params, 500))
+        
+        user_filters = {
+            'all': {},
+            'stage': {'stage': 'registered'},
+            'dates': {'date_from': '2024-01-01', 'date_to': '2024-01-31'},
+        }
+        order_filters = {
+            'all': {},
+            'status': {'status': 'paid'},
+            'user': {'user_id': 1},
+            'dates': {'date_from': '2024-01-01', 'date_to': '2024-01-31'},
+        }
+        for sort in sorted(USER_SORTS):
+            cursor = _encode_cursor('2024-01-01 00:00:00', 1)
+            for name, filters in user_filters.items():
+                conditions, params = cls._user_filters(**filters)
+                sql, params = cls._keyset_page_query(UserRecord, 'users', 'user_id', sort, True, conditions, params, cursor)
+                queries[f'list_users[{sort}, {name}]'] = (sql, (*params, 51))
+        for sort in sorted(ORDER_SORTS):
+            cursor = _encode_cursor('2024-01-01 00:00:00', 1)
+            for name, filters in order_filters.items():
+                conditions, params = cls._order_filters(**filters)
+                sql, params = cls._keyset_page_query(OrderRecord, 'orders', 'id', sort, True, conditions, params, cursor)
+                queries[f'list_orders[{sort}, {name}]'] = (sql, (*params, 51))
+                sql, params = cls._orders_with_users_query(sort=sort, cursor=cursor, **filters)
+                queries[f'list_orders_with_users[{sort}, {name}]'] = (sql, (*params, 51))
+        return queries
+    
+    def find_full_scans(self) -> Dict[str, List[str]]:
+        """
+        Проверка горячих запросов на полный просмотр таблиц
+        
+        Returns:
+            Словарь {имя запроса: шаги плана с SCAN без индекса};
+            пустой словарь, если все запросы используют индексы
+        """
+        full_scans = {}
+        for name, (sql, params) in self.hot_queries().items():
+            steps = [
+                step for step in self.explain_query_plan(sql, params)
+                # Просмотр табличной функции (json_each по параметру) - не таблицы
+                if step.startswith('SCAN') and 'USING' not in step and 'VIRTUAL TABLE' not in step
+            ]
+            if steps:
+                full_scans[name] = steps
+        return full_scans
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> bool:
         """Добавление нового пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
                     VALUES (?, ?, ?, ?)
                 ''', (user_id, username, first_name, last_name))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при добавлении пользователя: {e}")
@@ -117,13 +823,12 @@ class Database:
     def update_user_stage(self, user_id: int, stage: str) -> bool:
         """Обновление этапа пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE users SET stage = ?, last_activity = CURRENT_TIMESTAMP
                     WHERE user_id = ?
                 ''', (stage, user_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при обновлении этапа: {e}")
@@ -131,165 +836,345 @@ class Database:
     
     def update_user_data(self, user_id: int, field: str, value: str) -> bool:
         """Обновление данных пользователя"""
+        if field not in USER_UPDATABLE_FIELDS:
+            print(f"Ошибка при обновлении данных: недопустимое поле {field}")
+            return False
+        return self.update_user_fields(user_id, **{field: value}) is not None
+    
+    def update_user_fields(self, user_id: int, **fields) -> Optional[UserRecord]:
+        """
+        Обновление нескольких полей пользователя одной транзакцией
+        
+        Args:
+            user_id: ID пользователя
+            **fields: Новые значения полей (только из USER_UPDATABLE_FIELDS)
+        
+        Returns:
+            Обновленная запись пользователя или None, если пользователь
+            не найден или произошла ошибка
+        """
+        unknown = set(fields) - USER_UPDATABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Недопустимые поля пользователя: {', '.join(sorted(unknown))}")
+        
+        if 'data' in fields and isinstance(fields['data'], (dict, list)):
+            fields['data'] = json.dumps(fields['data'])
+        
+        assignments = ''.join(f'{field} = ?, ' for field in fields)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = UserRecord.row_factory
                 cursor.execute(f'''
-                    UPDATE users SET {field} = ?, last_activity = CURRENT_TIMESTAMP
+                    UPDATE users SET {assignments}last_activity = CURRENT_TIMESTAMP
                     WHERE user_id = ?
-                ''', (value, user_id))
-                conn.commit()
-                return True
+                    RETURNING {UserRecord.COLUMNS}
+                ''', (*fields.values(), user_id))
+                user = cursor.fetchone()
+            
+            return self._apply_buffered(user)
         except Exception as e:
             print(f"Ошибка при обновлении данных: {e}")
-            return False
+            return None
     
-    def get_user(self, user_id: int) -> Optional[Dict]:
+    def get_user(self, user_id: int) -> Optional[UserRecord]:
         """Получение данных пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    columns = [description[0] for description in cursor.description]
-                    user_data = dict(zip(columns, row))
-                    
-                    # Парсим JSON данные
-                    if user_data.get('data'):
-                        try:
-                            user_data['data'] = json.loads(user_data['data'])
-                        except:
-                            user_data['data'] = {}
-                    
-                    return user_data
-                return None
+                cursor.row_factory = UserRecord.row_factory
+                cursor.execute(USER_BY_ID_SQL, (user_id,))
+                user = cursor.fetchone()
+            
+            return self._apply_buffered(user)
         except Exception as e:
             print(f"Ошибка при получении пользователя: {e}")
             return None
     
-    def get_all_users(self) -> List[Dict]:
+    def _apply_buffered(self, user: Optional[UserRecord]) -> Optional[UserRecord]:
+        """Наложение еще не записанных значений из буфера на запись пользователя"""
+        if not user or not self.write_buffer:
+            return user
+        
+        buffered = self.write_buffer.get(user.user_id)
+        if 'last_message_id' in buffered:
+            user.last_message_id = buffered['last_message_id']
+        if buffered.get('last_activity', '') > (user.last_activity or ''):
+            user.last_activity = buffered['last_activity']
+        return user
+    
+    def get_all_users(self) -> List[UserRecord]:
         """Получение всех пользователей"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users ORDER BY registration_date DESC')
-                rows = cursor.fetchall()
-                
-                columns = [description[0] for description in cursor.description]
-                users = []
-                
-                for row in rows:
-                    user_data = dict(zip(columns, row))
-                    if user_data.get('data'):
-                        try:
-                            user_data['data'] = json.loads(user_data['data'])
-                        except:
-                            user_data['data'] = {}
-                    users.append(user_data)
-                
-                return users
+                cursor.row_factory = UserRecord.row_factory
+                cursor.execute(ALL_USERS_SQL)
+                return cursor.fetchall()
         except Exception as e:
             print(f"Ошибка при получении пользователей: {e}")
             return []
     
-    def add_product(self, name: str, price: float, description: str) -> bool:
-        """Добавление продукта"""
+    def get_user_ids_batch(self, segment: str = 'all', after_user_id: int = 0, limit: int = 500) -> List[int]:
+        """
+        Очередная порция ID пользователей сегмента (keyset-пагинация по user_id)
+        
+        Args:
+            segment: Имя сегмента из USER_SEGMENTS
+            after_user_id: Последний ID из предыдущей порции (0 - с начала)
+            limit: Размер порции
+        """
+        where, params = USER_SEGMENTS[segment]
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(USER_IDS_BATCH_SQL.format(where=where), (after_user_id, *params, limit))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def list_users(self, stage: str = None, date_from: str = None, date_to: str = None,
+                   sort: str = 'registration_date', descending: bool = True,
+                   cursor: str = None, limit: int = 50) -> Tuple[List[UserRecord], Optional[str]]:
+        """
+        Страница пользователей для админки (keyset-пагинация)
+        
+        Args:
+            stage: Фильтр по этапу
+            date_from: Дата регистрации от, YYYY-MM-DD (включительно)
+            date_to: Дата регистрации до, YYYY-MM-DD (включительно)
+            sort: Ключ сортировки из USER_SORTS
+            descending: Сортировка по убыванию
+            cursor: Курсор из предыдущей страницы (None - первая страница)
+            limit: Размер страницы
+        
+        Returns:
+            (пользователи, курсор следующей страницы или None)
+        """
+        if sort not in USER_SORTS:
+            raise ValueError(f"Недопустимый ключ сортировки: {sort}")
+        conditions, params = self._user_filters(stage, date_from, date_to)
+        return self._keyset_page(UserRecord, 'users', 'user_id', sort, descending, conditions, params, cursor, limit)
+    
+    def count_users(self, stage: str = None, date_from: str = None, date_to: str = None) -> int:
+        """Количество пользователей по фильтру (без фильтра - из stats_counters)"""
+        if not (stage or date_from or date_to):
+            return self.get_stats_counters().get('users', {}).get('', 0)
+        conditions, params = self._user_filters(stage, date_from, date_to)
+        return self._cached_count(
+            ('users', stage, date_from, date_to),
+            f'SELECT COUNT(*) FROM users WHERE {" AND ".join(conditions)}',
+            tuple(params)
+        )
+    
+    @staticmethod
+    def _user_filters(stage: str = None, date_from: str = None, date_to: str = None) -> Tuple[List[str], List[Any]]:
+        """Условия WHERE для фильтров списка пользователей"""
+        conditions, params = [], []
+        if stage:
+            conditions.append('stage = ?')
+            params.append(stage)
+        if date_from:
+            conditions.append('registration_date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('registration_date < ?')
+            params.append(_shift_day(date_to, 1))
+        return conditions, params
+    
+    def iter_user_ids(self, segment: str = 'all', batch_size: int = 500) -> Iterator[int]:
+        """
+        Потоковый обход ID пользователей сегмента
+        
+        Читает только колонку user_id порциями по batch_size, соединение
+        занимается только на время чтения одной порции - память постоянна
+        при любом размере аудитории.
+        """
+        if segment not in USER_SEGMENTS:
+            raise ValueError(f"Неизвестный сегмент пользователей: {segment}")
+        
+        last_user_id = 0
+        while True:
+            batch = self.get_user_ids_batch(segment, last_user_id, batch_size)
+            yield from batch
+            if len(batch) < batch_size:
+                break
+            last_user_id = batch[-1]
+    
+    def add_product(self, name: str, price: int, description: str) -> Optional[int]:
+        """Добавление продукта, цена в копейках (возвращает ID продукта или None при ошибке)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO products (name, price, description)
                     VALUES (?, ?, ?)
                 ''', (name, price, description))
-                conn.commit()
-                return True
+                product_id = cursor.lastrowid
+            self.catalog.invalidate()
+            return product_id
         except Exception as e:
             print(f"Ошибка при добавлении продукта: {e}")
+            return None
+    
+    def update_product(self, product_id: int, **fields) -> bool:
+        """
+        Обновление полей продукта (name, price, description, is_active)
+        
+        Цена передается в копейках.
+        
+        Returns:
+            True, если продукт найден и обновлен
+        """
+        unknown = set(fields) - PRODUCT_UPDATABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Недопустимые поля продукта: {', '.join(sorted(unknown))}")
+        if not fields:
+            return self.get_product(product_id) is not None
+        
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        try:
+            with self.pool.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'UPDATE products SET {assignments} WHERE id = ?',
+                    (*fields.values(), product_id)
+                )
+                updated = cursor.rowcount > 0
+            self.catalog.invalidate()
+            return updated
+        except Exception as e:
+            print(f"Ошибка при обновлении продукта: {e}")
             return False
     
-    def get_products(self) -> List[Dict]:
-        """Получение всех активных продуктов"""
+    def delete_product(self, product_id: int) -> bool:
+        """Удаление продукта"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM products WHERE is_active = 1')
-                rows = cursor.fetchall()
-                
-                columns = [description[0] for description in cursor.description]
-                products = []
-                
-                for row in rows:
-                    product_data = dict(zip(columns, row))
-                    products.append(product_data)
-                
-                return products
+                cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+                deleted = cursor.rowcount > 0
+            self.catalog.invalidate()
+            return deleted
+        except Exception as e:
+            print(f"Ошибка при удалении продукта: {e}")
+            return False
+    
+    def get_products(self) -> List[ProductRecord]:
+        """Получение всех активных продуктов (из кэша каталога)"""
+        try:
+            return self.catalog.products()
         except Exception as e:
             print(f"Ошибка при получении продуктов: {e}")
             return []
     
-    def add_notification(self, title: str, message: str, target_audience: str = 'all', scheduled_date: str = None) -> bool:
-        """Добавление уведомления"""
+    def get_product(self, product_id: int) -> Optional[ProductRecord]:
+        """Получение активного продукта по ID (из кэша каталога)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            return self.catalog.get(int(product_id))
+        except Exception as e:
+            print(f"Ошибка при получении продукта: {e}")
+            return None
+    
+    @property
+    def catalog_version(self) -> int:
+        """Версия каталога продуктов (меняется при любом изменении products)"""
+        return self.catalog.version
+    
+    def get_catalog_version(self) -> int:
+        """Версия каталога продуктов (метод Storage для кэшей, построенных по каталогу)"""
+        return self.catalog_version
+    
+    def add_notification(self, title: str, message: str, target_audience: str = 'all',
+                         scheduled_date: str = None) -> Optional[int]:
+        """Добавление уведомления (возвращает ID уведомления или None при ошибке)"""
+        try:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO notifications (title, message, target_audience, scheduled_date)
                     VALUES (?, ?, ?, ?)
                 ''', (title, message, target_audience, scheduled_date))
-                conn.commit()
-                return True
+                return cursor.lastrowid
         except Exception as e:
             print(f"Ошибка при добавлении уведомления: {e}")
+            return None
+    
+    def get_pending_notifications(self) -> List[NotificationRecord]:
+        """Получение всех неотправленных уведомлений"""
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = NotificationRecord.row_factory
+                cursor.execute(PENDING_NOTIFICATIONS_SQL)
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Ошибка при получении уведомлений: {e}")
+            return []
+    
+    def mark_notification_sent(self, notification_id: int) -> bool:
+        """Отметка уведомления как отправленного"""
+        try:
+            with self.pool.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE notifications
+                    SET is_sent = 1, sent_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (notification_id,))
+                return True
+        except Exception as e:
+            print(f"Ошибка при отметке уведомления: {e}")
             return False
     
+    def list_notifications(self, limit: int = 100) -> List[NotificationRecord]:
+        """Последние уведомления для админки, от новых к старым"""
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = NotificationRecord.row_factory
+                cursor.execute(
+                    f'SELECT {NotificationRecord.COLUMNS} FROM notifications ORDER BY id DESC LIMIT ?',
+                    (limit,)
+                )
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Ошибка при получении списка уведомлений: {e}")
+            return []
+    
     def add_order(self, order_data: dict) -> Optional[int]:
         """Добавление заказа"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 
-                # Добавляем заказ
+                # Добавляем заказ вместе с деталями в JSON поле
                 cursor.execute('''
-                    INSERT INTO orders (user_id, total_amount, status, order_date)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (order_data['user_id'], order_data['total_amount'], order_data['status']))
+                    INSERT INTO orders (user_id, total_amount, status, order_date, data)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+                ''', (order_data['user_id'], order_data['total_amount'], order_data['status'], json.dumps(order_data)))
                 
                 order_id = cursor.lastrowid
                 
-                # Сохраняем детали заказа в JSON поле
-                cursor.execute('''
-                    UPDATE orders SET data = ? WHERE id = ?
-                ''', (json.dumps(order_data), order_id))
+                # Позиции заказа
+                cursor.executemany('''
+                    INSERT INTO order_items (order_id, product_id, name, unit_price, quantity)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (order_id, item.get('product_id'), item.get('name'), item.get('price') or 0, item.get('quantity') or 1)
+                    for item in order_data.get('items', [])
+                ])
                 
-                conn.commit()
                 return order_id
         except Exception as e:
             print(f"Ошибка при добавлении заказа: {e}")
             return None
     
-    def get_order(self, order_id: int) -> Optional[Dict]:
+    def get_order(self, order_id: int) -> Optional[OrderRecord]:
         """Получение заказа по ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    columns = [description[0] for description in cursor.description]
-                    order_data = dict(zip(columns, row))
-                    
-                    # Парсим JSON данные
-                    if order_data.get('data'):
-                        try:
-                            order_data['data'] = json.loads(order_data['data'])
-                        except:
-                            order_data['data'] = {}
-                    
-                    return order_data
-                return None
+                cursor.row_factory = OrderRecord.row_factory
+                cursor.execute(f'SELECT {OrderRecord.COLUMNS} FROM orders WHERE id = ?', (order_id,))
+                return cursor.fetchone()
         except Exception as e:
             print(f"Ошибка при получении заказа: {e}")
             return None
@@ -297,59 +1182,376 @@ class Database:
     def update_order_status(self, order_id: int, status: str) -> bool:
         """Обновление статуса заказа"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE orders SET status = ? WHERE id = ?
                 ''', (status, order_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при обновлении статуса заказа: {e}")
             return False
     
-    def get_user_orders(self, user_id: int) -> List[Dict]:
+    def get_user_orders(self, user_id: int) -> List[OrderRecord]:
         """Получение всех заказов пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = OrderRecord.row_factory
+                cursor.execute(USER_ORDERS_SQL, (user_id,))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Ошибка при получении заказов пользователя: {e}")
+            return []
+    
+    def list_orders(self, status: str = None, user_id: int = None, date_from: str = None, date_to: str = None,
+                    sort: str = 'order_date', descending: bool = True,
+                    cursor: str = None, limit: int = 50) -> Tuple[List[OrderRecord], Optional[str]]:
+        """
+        Страница заказов для админки (keyset-пагинация)
+        
+        Args:
+            status: Фильтр по статусу
+            user_id: Фильтр по пользователю
+            date_from: Дата заказа от, YYYY-MM-DD (включительно)
+            date_to: Дата заказа до, YYYY-MM-DD (включительно)
+            sort: Ключ сортировки из ORDER_SORTS
+            descending: Сортировка по убыванию
+            cursor: Курсор из предыдущей страницы (None - первая страница)
+            limit: Размер страницы
+        
+        Returns:
+            (заказы, курсор следующей страницы или None)
+        """
+        if sort not in ORDER_SORTS:
+            raise ValueError(f"Недопустимый ключ сортировки: {sort}")
+        conditions, params = self._order_filters(status, user_id, date_from, date_to)
+        return self._keyset_page(OrderRecord, 'orders', 'id', sort, descending, conditions, params, cursor, limit)
+    
+    def count_orders(self, status: str = None, user_id: int = None, date_from: str = None, date_to: str = None) -> int:
+        """Количество заказов по фильтру (без фильтра и по статусу - из stats_counters)"""
+        if not (user_id or date_from or date_to):
+            by_status = self.get_stats_counters().get('orders', {})
+            return by_status.get(status, 0) if status else sum(by_status.values())
+        conditions, params = self._order_filters(status, user_id, date_from, date_to)
+        return self._cached_count(
+            ('orders', status, user_id, date_from, date_to),
+            f'SELECT COUNT(*) FROM orders WHERE {" AND ".join(conditions)}',
+            tuple(params)
+        )
+    
+    @staticmethod
+    def _order_filters(status: str = None, user_id: int = None, date_from: str = None,
+                       date_to: str = None, prefix: str = '') -> Tuple[List[str], List[Any]]:
+        """Условия WHERE для фильтров списка заказов (prefix - псевдоним таблицы, например 'o.')"""
+        conditions, params = [], []
+        if status:
+            conditions.append(f'{prefix}status = ?')
+            params.append(status)
+        if user_id:
+            conditions.append(f'{prefix}user_id = ?')
+            params.append(user_id)
+        if date_from:
+            conditions.append(f'{prefix}order_date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append(f'{prefix}order_date < ?')
+            params.append(_shift_day(date_to, 1))
+        return conditions, params
+    
+    @classmethod
+    def _orders_with_users_query(cls, status: str = None, user_id: int = None, date_from: str = None,
+                                 date_to: str = None, sort: str = 'order_date', descending: bool = True,
+                                 cursor: str = None) -> Tuple[str, List[Any]]:
+        """
+        Запрос страницы заказов с покупателями по ORDERS_WITH_USERS_SQL
+        
+        Returns:
+            (текст запроса, параметры без LIMIT)
+        """
+        conditions, params = cls._order_filters(status, user_id, date_from, date_to, prefix='o.')
+        where, params, order_by = cls._keyset_query(f'o.{sort}', 'o.id', descending, conditions, params, cursor)
+        sql = ORDERS_WITH_USERS_SQL.format(
+            order_columns=', '.join(f'o.{field}' for field in ORDER_SUMMARY_FIELDS),
+            user_columns=', '.join(f'u.{field}' for field in USER_SUMMARY_FIELDS),
+            where=where,
+            order_by=order_by
+        )
+        return sql, params
+    
+    def list_orders_with_users(self, status: str = None, user_id: int = None, date_from: str = None,
+                               date_to: str = None, sort: str = 'order_date', descending: bool = True,
+                               cursor: str = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Страница заказов вместе с покупателями и позициями для админки
+        
+        Заказы и покупатели читаются одним запросом с JOIN, позиции всех
+        заказов страницы - вторым (по idx_order_items_order), оба из одного
+        снимка базы. Сводка покупателя строится один раз на пользователя
+        и разделяется всеми его заказами на странице. Параметры - как у
+        list_orders.
+        
+        Returns:
+            (заказы - словари с ключами user и items, курсор следующей страницы или None)
+        """
+        if sort not in ORDER_SORTS:
+            raise ValueError(f"Недопустимый ключ сортировки: {sort}")
+        sql, params = self._orders_with_users_query(status, user_id, date_from, date_to, sort, descending, cursor)
+        order_fields = ORDER_SUMMARY_FIELDS
+        
+        with self.pool.reader() as conn:
+            conn.execute('BEGIN')
+            rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = dict(zip(order_fields, rows[-1]))
+                next_cursor = _encode_cursor(last[sort], last['id'])
+            
+            items: Dict[int, List[OrderItemRecord]] = {}
+            if rows:
+                order_ids = json.dumps([row[0] for row in rows])
+                cursor_items = conn.cursor()
+                cursor_items.row_factory = OrderItemRecord.row_factory
+                cursor_items.execute(ORDERS_ITEMS_SQL, (order_ids,))
+                for item in cursor_items.fetchall():
+                    items.setdefault(item.order_id, []).append(item)
+        
+        users: Dict[int, Optional[Dict[str, Any]]] = {}
+        orders = []
+        for row in rows:
+            order = dict(zip(order_fields, row))
+            user_row = row[len(order_fields):]
+            if order['user_id'] not in users:
+                users[order['user_id']] = dict(zip(USER_SUMMARY_FIELDS, user_row)) if user_row[0] is not None else None
+            order['user'] = users[order['user_id']]
+            order['items'] = items.get(order['id'], [])
+            orders.append(order)
+        return orders, next_cursor
+    
+    def get_order_items(self, order_id: int) -> List[OrderItemRecord]:
+        """Позиции заказа"""
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = OrderItemRecord.row_factory
+                cursor.execute(ORDER_ITEMS_SQL, (order_id,))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Ошибка при получении позиций заказа: {e}")
+            return []
+    
+    def get_product_sales(self) -> List[Dict[str, Any]]:
+        """
+        Продажи по продуктам: проданные единицы, выручка (в копейках) и число заказов
+        
+        Агрегируется одним GROUP BY по покрывающему индексу order_items.
+        """
+        try:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT * FROM orders WHERE user_id = ? ORDER BY order_date DESC
+                    SELECT product_id,
+                           SUM(quantity) AS units_sold,
+                           SUM(unit_price * quantity) AS revenue,
+                           COUNT(DISTINCT order_id) AS orders
+                    FROM order_items
+                    WHERE product_id IS NOT NULL
+                    GROUP BY product_id
+                    ORDER BY units_sold DESC
+                ''')
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Ошибка при получении статистики продаж: {e}")
+            return []
+    
+    def get_sales_summary(self) -> Dict[str, Any]:
+        """
+        Сводка по заказам: число заказов, выручка по выполненным заказам
+        (в копейках), проданные единицы и средний размер корзины (позиций на заказ)
+        """
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*),
+                           COALESCE(SUM(CASE WHEN status = 'completed' THEN total_amount ELSE 0 END), 0)
+                    FROM orders
+                ''')
+                total_orders, total_revenue = cursor.fetchone()
+                
+                cursor.execute('''
+                    SELECT COALESCE(SUM(quantity), 0), COUNT(DISTINCT order_id), COUNT(*)
+                    FROM order_items
+                ''')
+                units_sold, orders_with_items, lines = cursor.fetchone()
+                
+                return {
+                    'total_orders': total_orders,
+                    'total_revenue': total_revenue,
+                    'units_sold': units_sold,
+                    'avg_basket_size': lines / orders_with_items if orders_with_items else 0
+                }
+        except Exception as e:
+            print(f"Ошибка при получении сводки по заказам: {e}")
+            return {'total_orders': 0, 'total_revenue': 0, 'units_sold': 0, 'avg_basket_size': 0}
+    
+    def get_stats_counters(self, day: str = None) -> Dict[str, Dict[str, int]]:
+        """
+        Счетчики дашборда из stats_counters (поддерживаются триггерами)
+        
+        Регистрации берутся только за день day (YYYY-MM-DD, по умолчанию -
+        сегодня по UTC), поэтому объем чтения не растет со временем.
+        
+        Returns:
+            Словарь {metric: {key: value}}
+        """
+        day = day or _utc_timestamp()[:10]
+        counters: Dict[str, Dict[str, int]] = {}
+        try:
+            with self.pool.reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT metric, key, value FROM stats_counters
+                    WHERE metric IN ('users', 'products_active', 'orders', 'revenue', 'order_items',
+                                     'product_units', 'product_revenue', 'product_orders')
+                    UNION ALL
+                    SELECT metric, key, value FROM stats_counters
+                    WHERE metric = 'signups' AND key = ?
+                ''', (day,))
+                for metric, key, value in cursor.fetchall():
+                    counters.setdefault(metric, {})[key] = value
+        except Exception as e:
+            print(f"Ошибка при получении счетчиков статистики: {e}")
+        return counters
+    
+    def refresh_daily_stats(self) -> int:
+        """Пересчет открытых дней дневной статистики (возвращает число дней)"""
+        if self.write_buffer:
+            self.write_buffer.flush()
+        return self.rollup.refresh()
+    
+    def get_timeseries(self, metric: str, date_from: str, date_to: str, period: str = 'day') -> List[Dict[str, Any]]:
+        """
+        Временной ряд метрики из дневных агрегатов
+        
+        Args:
+            metric: Имя метрики из ANALYTICS_METRICS (revenue - в копейках)
+            date_from: Начало периода, YYYY-MM-DD (включительно)
+            date_to: Конец периода, YYYY-MM-DD (включительно)
+            period: 'day' или 'week' (недели начинаются с понедельника)
+        
+        Returns:
+            Список {'date': начало дня/недели, 'value': значение}
+            без пропусков: периоды без данных имеют значение 0
+        """
+        if metric not in ANALYTICS_METRICS:
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        if period not in ('day', 'week'):
+            raise ValueError(f"Неизвестный период: {period}")
+        
+        table, column, week_aggregate = ANALYTICS_METRICS[metric]
+        if period == 'day':
+            bucket, aggregate = 'day', 'SUM'
+        else:
+            bucket, aggregate = "date(day, 'weekday 0', '-6 days')", week_aggregate
+        
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {bucket} AS bucket, {aggregate}({column})
+                FROM {table}
+                WHERE day BETWEEN ? AND ?
+                GROUP BY bucket
+            ''', (date_from, date_to))
+            values = dict(cursor.fetchall())
+        
+        return _fill_series(values, date_from, date_to, period)
+    
+    def checkout_cart(self, user_id: int) -> Optional[OrderRecord]:
+        """
+        Оформление заказа из корзины одной транзакцией
+        
+        Снимок корзины, подсчет суммы, создание заказа и очистка корзины
+        выполняются под BEGIN IMMEDIATE: повторное нажатие "Оформить"
+        увидит уже пустую корзину и не создаст дубль заказа.
+        
+        Returns:
+            Созданный заказ или None, если корзина пуста или произошла ошибка
+        """
+        try:
+            with self.pool.writer() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                cursor = conn.cursor()
+                
+                # Снимок корзины
+                cursor.execute('''
+                    SELECT c.product_id, p.name, p.price, c.quantity
+                    FROM cart c
+                    JOIN products p ON c.product_id = p.id
+                    WHERE c.user_id = ?
+                    ORDER BY c.added_date DESC
                 ''', (user_id,))
-                rows = cursor.fetchall()
+                items = [
+                    {'product_id': product_id, 'name': name, 'price': price, 'quantity': quantity}
+                    for product_id, name, price, quantity in cursor.fetchall()
+                ]
+                if not items:
+                    return None
                 
-                columns = [description[0] for description in cursor.description]
-                orders = []
+                cursor.execute('''
+                    SELECT SUM(p.price * c.quantity)
+                    FROM cart c
+                    JOIN products p ON c.product_id = p.id
+                    WHERE c.user_id = ?
+                ''', (user_id,))
+                total = cursor.fetchone()[0]
                 
-                for row in rows:
-                    order_data = dict(zip(columns, row))
-                    if order_data.get('data'):
-                        try:
-                            order_data['data'] = json.loads(order_data['data'])
-                        except:
-                            order_data['data'] = {}
-                    orders.append(order_data)
+                order_data = {
+                    'user_id': user_id,
+                    'total_amount': total,
+                    'status': 'pending',
+                    'items': items
+                }
+                
+                cursor.row_factory = OrderRecord.row_factory
+                cursor.execute(f'''
+                    INSERT INTO orders (user_id, total_amount, status, order_date, data)
+                    VALUES (?, ?, 'pending', CURRENT_TIMESTAMP, ?)
+                    RETURNING {OrderRecord.COLUMNS}
+                ''', (user_id, total, json.dumps(order_data)))
+                order = cursor.fetchone()
                 
-                return orders
+                conn.execute('''
+                    INSERT INTO order_items (order_id, product_id, name, unit_price, quantity)
+                    SELECT ?, c.product_id, p.name, p.price, c.quantity
+                    FROM cart c
+                    JOIN products p ON c.product_id = p.id
+                    WHERE c.user_id = ?
+                ''', (order.id, user_id))
+                conn.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+                return order
         except Exception as e:
-            print(f"Ошибка при получении заказов пользователя: {e}")
-            return []
+            print(f"Ошибка при оформлении заказа из корзины: {e}")
+            return None
     
-    def create_order(self, user_id: int, product_id: int, amount: float, payment_id: str = None) -> int:
+    def create_order(self, user_id: int, product_id: int, amount: int, payment_id: str = None) -> int:
         """
         Создание нового заказа
         
         Args:
             user_id: ID пользователя
             product_id: ID продукта
-            amount: Сумма заказа
+            amount: Сумма заказа в копейках
             payment_id: ID платежа от платежной системы
         
         Returns:
             ID созданного заказа или 0 при ошибке
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 
                 # Данные заказа в JSON
@@ -364,21 +1566,37 @@ class Database:
                     VALUES (?, ?, 'paid', ?)
                 ''', (user_id, amount, json.dumps(order_data)))
                 
-                conn.commit()
-                return cursor.lastrowid
+                order_id = cursor.lastrowid
+                
+                # Одна позиция: оплаченный продукт по сумме платежа
+                cursor.execute('''
+                    INSERT INTO order_items (order_id, product_id, name, unit_price, quantity)
+                    VALUES (?, ?, (SELECT name FROM products WHERE id = ?), ?, 1)
+                ''', (order_id, product_id, product_id, amount))
+                
+                return order_id
         except Exception as e:
             print(f"Ошибка при создании заказа: {e}")
             return 0
     
     def update_last_message_id(self, user_id: int, message_id: int) -> bool:
-        """Обновление ID последнего сообщения бота для пользователя"""
+        """
+        Обновление ID последнего сообщения бота для пользователя
+        
+        Вызывается на каждое отправленное сообщение, поэтому вместе с
+        отметкой активности пишется через буфер отложенной записи.
+        """
+        if self.write_buffer:
+            self.write_buffer.put(user_id, last_message_id=message_id, last_activity=_utc_timestamp())
+            return True
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    UPDATE users SET last_message_id = ? WHERE user_id = ?
+                    UPDATE users SET last_message_id = ?, last_activity = CURRENT_TIMESTAMP
+                    WHERE user_id = ?
                 ''', (message_id, user_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при обновлении last_message_id: {e}")
@@ -386,8 +1604,13 @@ class Database:
     
     def get_last_message_id(self, user_id: int) -> Optional[int]:
         """Получение ID последнего сообщения бота для пользователя"""
+        if self.write_buffer:
+            buffered = self.write_buffer.get(user_id)
+            if 'last_message_id' in buffered:
+                return buffered['last_message_id']
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT last_message_id FROM users WHERE user_id = ?', (user_id,))
                 row = cursor.fetchone()
@@ -396,6 +1619,23 @@ class Database:
             print(f"Ошибка при получении last_message_id: {e}")
             return None
     
+    def _flush_user_updates(self, updates: Dict[int, Dict[str, Any]]):
+        """Запись накопленных в буфере обновлений пользователей"""
+        with self.pool.writer() as conn:
+            conn.executemany('''
+                UPDATE users
+                SET last_message_id = COALESCE(:message_id, last_message_id),
+                    last_activity = MAX(COALESCE(:activity, last_activity), COALESCE(last_activity, :activity))
+                WHERE user_id = :user_id
+            ''', [
+                {
+                    'message_id': fields.get('last_message_id'),
+                    'activity': fields.get('last_activity'),
+                    'user_id': user_id
+                }
+                for user_id, fields in updates.items()
+            ])
+    
     # ============================================
     # КОРЗИНА
     # ============================================
@@ -403,13 +1643,12 @@ class Database:
     def add_to_cart(self, user_id: int, product_id: int, quantity: int = 1) -> bool:
         """Добавление продукта в корзину"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO cart (user_id, product_id, quantity, added_date)
                     VALUES (?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (user_id, product_id, quantity))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при добавлении в корзину: {e}")
@@ -418,30 +1657,22 @@ class Database:
     def remove_from_cart(self, user_id: int, product_id: int) -> bool:
         """Удаление продукта из корзины"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM cart WHERE user_id = ? AND product_id = ?', (user_id, product_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при удалении из корзины: {e}")
             return False
     
-    def get_cart(self, user_id: int) -> List[Dict]:
+    def get_cart(self, user_id: int) -> List[CartItem]:
         """Получение корзины пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT c.*, p.name, p.price, p.description
-                    FROM cart c
-                    JOIN products p ON c.product_id = p.id
-                    WHERE c.user_id = ?
-                    ORDER BY c.added_date DESC
-                ''', (user_id,))
-                rows = cursor.fetchall()
-                columns = [description[0] for description in cursor.description]
-                return [dict(zip(columns, row)) for row in rows]
+                cursor.row_factory = CartItem.row_factory
+                cursor.execute(CART_SQL, (user_id,))
+                return cursor.fetchall()
         except Exception as e:
             print(f"Ошибка при получении корзины: {e}")
             return []
@@ -449,10 +1680,9 @@ class Database:
     def clear_cart(self, user_id: int) -> bool:
         """Очистка корзины пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при очистке корзины: {e}")
@@ -461,7 +1691,7 @@ class Database:
     def is_in_cart(self, user_id: int, product_id: int) -> bool:
         """Проверка, есть ли продукт в корзине"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT 1 FROM cart WHERE user_id = ? AND product_id = ?', (user_id, product_id))
                 return cursor.fetchone() is not None
@@ -476,13 +1706,12 @@ class Database:
     def add_to_favorites(self, user_id: int, product_id: int) -> bool:
         """Добавление продукта в избранное"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR IGNORE INTO favorites (user_id, product_id, added_date)
                     VALUES (?, ?, CURRENT_TIMESTAMP)
                 ''', (user_id, product_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при добавлении в избранное: {e}")
@@ -491,30 +1720,28 @@ class Database:
     def remove_from_favorites(self, user_id: int, product_id: int) -> bool:
         """Удаление продукта из избранного"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM favorites WHERE user_id = ? AND product_id = ?', (user_id, product_id))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при удалении из избранного: {e}")
             return False
     
-    def get_favorites(self, user_id: int) -> List[Dict]:
+    def get_favorites(self, user_id: int) -> List[FavoriteItem]:
         """Получение избранного пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT f.*, p.name, p.price, p.description
+                cursor.row_factory = FavoriteItem.row_factory
+                cursor.execute(f'''
+                    SELECT {FavoriteItem.COLUMNS}
                     FROM favorites f
                     JOIN products p ON f.product_id = p.id
                     WHERE f.user_id = ?
                     ORDER BY f.added_date DESC
                 ''', (user_id,))
-                rows = cursor.fetchall()
-                columns = [description[0] for description in cursor.description]
-                return [dict(zip(columns, row)) for row in rows]
+                return cursor.fetchall()
         except Exception as e:
             print(f"Ошибка при получении избранного: {e}")
             return []
@@ -522,9 +1749,9 @@ class Database:
     def is_in_favorites(self, user_id: int, product_id: int) -> bool:
         """Проверка, есть ли продукт в избранном"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT 1 FROM favorites WHERE user_id = ? AND product_id = ?', (user_id, product_id))
+                cursor.execute(IN_FAVORITES_SQL, (user_id, product_id))
                 return cursor.fetchone() is not None
         except Exception as e:
             print(f"Ошибка при проверке избранного: {e}")
@@ -545,7 +1772,7 @@ class Database:
         - Дату регистрации
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 cursor = conn.cursor()
                 
                 # Сброс регистрационных данных
@@ -565,8 +1792,108 @@ class Database:
                 # Очистка избранного
                 cursor.execute('DELETE FROM favorites WHERE user_id = ?', (user_id,))
                 
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Ошибка при сбросе профиля: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над Database для обработчиков бота
+    
+    Повторяет API Database, но каждый метод возвращает корутину. Запросы
+    выполняются вне event loop: записи - в отдельном потоке-писателе
+    (по одной, в порядке поступления), чтения - в пуле потоков по числу
+    соединений на чтение. Медленный коммит не блокирует обработку
+    апдейтов других пользователей.
+    """
+    
+    WRITE_METHODS = frozenset({
+        'init_database',
+        'add_user',
+        'update_user_stage',
+        'update_user_data',
+        'update_user_fields',
+        'add_product',
+        'update_product',
+        'delete_product',
+        'add_notification',
+        'add_order',
+        'checkout_cart',
+        'update_order_status',
+        'create_order',
+        'add_to_cart',
+        'remove_from_cart',
+        'clear_cart',
+        'add_to_favorites',
+        'remove_from_favorites',
+        'reset_user_profile',
+        'mark_notification_sent',
+    })
+    
+    def __init__(self, database: Database):
+        self.sync = database
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='db-writer'
+        )
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=database.pool.max_readers,
+            thread_name_prefix='db-reader'
+        )
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+        
+        executor = self._write_executor if name in self.WRITE_METHODS else self._read_executor
+        
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(attr, *args, **kwargs))
+        
+        # Кэшируем обертку, чтобы не создавать ее при каждом вызове
+        self.__dict__[name] = call
+        return call
+    
+    async def iter_user_ids(self, segment: str = 'all', batch_size: int = 500):
+        """Асинхронный потоковый обход ID пользователей (см. Database.iter_user_ids)"""
+        if segment not in USER_SEGMENTS:
+            raise ValueError(f"Неизвестный сегмент пользователей: {segment}")
+        
+        last_user_id = 0
+        while True:
+            batch = await self.get_user_ids_batch(segment, last_user_id, batch_size)
+            for user_id in batch:
+                yield user_id
+            if len(batch) < batch_size:
+                break
+            last_user_id = batch[-1]
+    
+    async def close(self):
+        """Дожидается завершения запросов и закрывает базу данных"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+    
+    def _shutdown(self):
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self.sync.close()
+
+
+if __name__ == '__main__':
+    # Проверка планов горячих запросов: python database.py [путь к базе]
+    import sys
+    
+    db = Database(sys.argv[1] if len(sys.argv) > 1 else ConnectionPool.MEMORY_PATH)
+    full_scans = db.find_full_scans()
+    db.close()
+    
+    for name, steps in full_scans.items():
+        print(f"❌ {name}: {'; '.join(steps)}")
+    if not full_scans:
+        print(f"✅ Все горячие запросы ({len(Database.hot_queries())}) используют индексы")
+    sys.exit(1 if full_scans else 0)
@@ -1,103 +1,50 @@
 import logging
-import re
-import json
-from typing import Tuple
+from typing import Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from config import *
-from database import Database
+from storage import Storage
+from database import PAID_ORDER_STATUSES
+from money import format_money, to_kopecks
+from callbacks import CallbackRouter, choice
+from screens import ScreenCache
+import conversation
 
 logger = logging.getLogger(__name__)
 
 class UserHandlers:
     """Обработчики команд пользователей"""
     
-    def __init__(self, database: Database, payment_handler=None):
+    def __init__(self, database: Storage, payment_handler=None, screens: ScreenCache = None):
         self.db = database
         self.payment_handler = payment_handler
+        # Тексты и клавиатуры экранов, собранные при запуске
+        self.screens = screens or ScreenCache()
+        
+        # Экраны диалога регистрации: имя экрана из conversation -> обработчик
+        self.conversation_screens = {
+            'name_error': self.screen_name_error,
+            'phone_error': self.screen_phone_error,
+            conversation.USE_BUTTONS_SCREEN: self.screen_use_buttons,
+            'ask_phone': self.screen_ask_phone,
+            'ask_profile_phone': self.screen_ask_profile_phone,
+            'confirm_registration': self.screen_confirm_registration,
+            'confirm_profile_edit': self.screen_confirm_profile_edit,
+            'confirm_simple_registration': self.screen_confirm_simple_registration,
+        }
     
     def sanitize_input(self, text: str, max_length: int = 100) -> str:
-        """
-        Санитизация пользовательского ввода
-        
-        Args:
-            text: Входной текст
-            max_length: Максимальная длина
-            
-        Returns:
-            str: Очищенный текст
-        """
-        if not text:
-            return ""
-        
-        # Убираем лишние пробелы
-        cleaned = ' '.join(text.split())
-        
-        # Ограничиваем длину
-        if len(cleaned) > max_length:
-            cleaned = cleaned[:max_length]
-        
-        # Убираем опасные символы для Markdown (если нужно)
-        # Но оставляем базовые символы для имен
-        cleaned = cleaned.strip()
-        
-        return cleaned
+        """Санитизация пользовательского ввода (conversation.sanitize_input)"""
+        return conversation.sanitize_input(text, max_length)
     
     def validate_name(self, name: str) -> Tuple[bool, str]:
-        """
-        Валидация имени пользователя
-        
-        Returns:
-            tuple[bool, str]: (is_valid, error_message)
-        """
-        if not name or not name.strip():
-            return False, "Имя не может быть пустым"
-        
-        sanitized = self.sanitize_input(name, max_length=50)
-        
-        if len(sanitized) < 2:
-            return False, "Имя должно содержать минимум 2 символа"
-        
-        if len(sanitized) > 50:
-            return False, "Имя слишком длинное (максимум 50 символов)"
-        
-        # Проверяем, что имя содержит хотя бы одну букву
-        if not re.search(r'[а-яА-Яa-zA-Z]', sanitized):
-            return False, "Имя должно содержать хотя бы одну букву"
-        
-        return True, sanitized
+        """Валидация имени пользователя (conversation.validate_name)"""
+        return conversation.validate_name(name)
     
     def validate_phone_number(self, phone: str) -> bool:
-        """
-        Валидация номера телефона
-        
-        Принимаются форматы:
-        - 89117929394 (11 цифр, начинается с 8)
-        - 79117929394 (11 цифр, начинается с 7)
-        - +79117929394 (+ и 11 цифр, начинается с 7)
-        - С пробелами, скобками, дефисами: +7 (911) 792-93-94
-        
-        Returns:
-            bool: True если номер корректный, False если нет
-        """
-        if not phone:
-            return False
-        
-        # Убираем все символы кроме цифр и +
-        cleaned = re.sub(r'[^\d+]', '', phone)
-        
-        # Проверяем различные форматы
-        patterns = [
-            r'^8\d{10}$',      # 8 + 10 цифр
-            r'^7\d{10}$',      # 7 + 10 цифр
-            r'^\+7\d{10}$',    # +7 + 10 цифр
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, cleaned):
-                return True
-        
-        return False
+        """Валидация номера телефона (conversation.validate_phone_number)"""
+        return conversation.validate_phone_number(phone)
     
     async def send_or_edit_message(
         self, 
@@ -107,10 +54,16 @@ class UserHandlers:
         text: str,
         reply_markup=None,
         parse_mode='Markdown',
-        query=None
+        query=None,
+        edit_in_place: bool = True
     ):
         """
-        Умная отправка сообщений: удаляет старое и отправляет новое (эффект замены)
+        Умная отправка сообщений: экран заменяет предыдущий
+        
+        Если есть query, его сообщение редактируется на месте (один запрос
+        к Telegram). Когда редактирование невозможно - сообщение с медиа,
+        недоступное старое сообщение, ошибка Telegram - старое сообщение
+        удаляется и отправляется новое.
         
         Args:
             context: Контекст бота
@@ -119,9 +72,20 @@ class UserHandlers:
             text: Текст сообщения
             reply_markup: Клавиатура
             parse_mode: Режим парсинга (Markdown/HTML)
-            query: CallbackQuery (если есть, удаляет его сообщение)
+            query: CallbackQuery (если есть, заменяется его сообщение)
+            edit_in_place: Редактировать сообщение query вместо удаления и отправки
+        
+        Returns:
+            ID показанного сообщения или None при ошибке
         """
         try:
+            if query and edit_in_place:
+                # Отредактированное сообщение уже было последним отправленным:
+                # last_message_id не читается и не перезаписывается
+                edited_id = await self._edit_query_message(context, query, text, reply_markup, parse_mode)
+                if edited_id:
+                    return edited_id
+            
             # Определяем ID сообщения для удаления
             message_to_delete = None
             
@@ -131,7 +95,7 @@ class UserHandlers:
                 logger.info(f"🗑️ Планируется удаление сообщения из query: {message_to_delete}")
             else:
                 # Иначе берем последнее сохраненное
-                message_to_delete = self.db.get_last_message_id(user_id)
+                message_to_delete = await self.db.get_last_message_id(user_id)
                 logger.info(f"🗑️ Планируется удаление последнего сохраненного сообщения: {message_to_delete}")
             
             # Удаляем старое сообщение
@@ -156,7 +120,7 @@ class UserHandlers:
             )
             
             # Сохраняем ID нового сообщения
-            self.db.update_last_message_id(user_id, sent_message.message_id)
+            await self.db.update_last_message_id(user_id, sent_message.message_id)
             logger.info(f"📨 Отправлено новое сообщение {sent_message.message_id}")
             return sent_message.message_id
             
@@ -164,6 +128,38 @@ class UserHandlers:
             logger.error(f"❌ Ошибка при отправке/удалении сообщения: {e}")
             return None
     
+    async def _edit_query_message(self, context: ContextTypes.DEFAULT_TYPE, query, text: str,
+                                  reply_markup, parse_mode) -> Optional[int]:
+        """Редактирование сообщения callback-запроса на месте (None - редактировать нельзя)"""
+        message = query.message
+        # Недоступное (слишком старое) сообщение и медиа без текста не редактируются,
+        # а отредактированное сообщение может нести только inline-клавиатуру
+        if (
+            not message
+            or not getattr(message, 'is_accessible', True)
+            or message.text is None
+            or not (reply_markup is None or isinstance(reply_markup, InlineKeyboardMarkup))
+        ):
+            return None
+        
+        try:
+            await context.bot.edit_message_text(
+                chat_id=message.chat_id,
+                message_id=message.message_id,
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+        except BadRequest as e:
+            # Экран не изменился (повторное нажатие) - сообщение уже нужное
+            if 'not modified' in str(e).lower():
+                return message.message_id
+            logger.info(f"Сообщение {message.message_id} не редактируется ({e}) - отправляем новое")
+            return None
+        
+        logger.info(f"✏️ Отредактировано сообщение {message.message_id}")
+        return message.message_id
+    
     async def delete_user_message(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int):
         """Удаление сообщения пользователя"""
         try:
@@ -177,7 +173,7 @@ class UserHandlers:
         chat_id = update.effective_chat.id
         
         # Добавляем пользователя в базу
-        self.db.add_user(
+        await self.db.add_user(
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -185,7 +181,7 @@ class UserHandlers:
         )
         
         # Проверяем, зарегистрирован ли пользователь
-        user_data = self.db.get_user(user.id)
+        user_data = await self.db.get_user(user.id)
         is_registered = (
             user_data and 
             user_data.get('name') and 
@@ -234,103 +230,26 @@ class UserHandlers:
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /help"""
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
-        
-        help_text = """
-📖 **Справка по боту Екатерины - кризисного целителя**
-
-🤖 **О боте:**
-Я ваш персональный помощник, который поможет вам:
-• 📚 Получить доступ к бесплатным материалам
-• 💎 Ознакомиться с продуктами и услугами
-• 📋 Управлять заказами
-• 👤 Настроить профиль
-
-📱 **Основные команды:**
-• `/start` - Начать работу с ботом
-• `/help` - Показать эту справку
-• `/shop` - Открыть каталог продуктов
-
-🎯 **Как использовать:**
-1. Используйте кнопки меню для навигации
-2. Всегда можно вернуться в главное меню
-3. Для покупок выберите "💎 Продукты"
-4. Бесплатные материалы доступны после регистрации
-
-❓ **Частые вопросы:**
-
-**Q: Как зарегистрироваться?**
-A: Нажмите /start и следуйте инструкциям. Регистрация займет 1 минуту.
-
-**Q: Где найти бесплатные материалы?**
-A: После регистрации они будут доступны в разделе "📚 Бесплатные материалы".
-
-**Q: Как купить продукт?**
-A: Выберите "💎 Продукты" → выберите продукт → "Купить" → оплатите.
-
-**Q: Как посмотреть мои заказы?**
-A: В главном меню выберите "📋 Мои заказы".
-
-**Q: Как изменить профиль?**
-A: "👤 Мой профиль" → "Редактировать профиль".
-
-🌐 **Веб-сайт:** https://telegram-bot-kate.vercel.app
-
-💬 **Нужна помощь?**
-Напишите администратору через веб-сайт или используйте форму обратной связи.
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")],
-            [InlineKeyboardButton("💎 Продукты", callback_data="main_shop")],
-            [InlineKeyboardButton("📚 Материалы", callback_data="main_materials")],
-            [InlineKeyboardButton("🌐 Веб-сайт", url="https://telegram-bot-kate.vercel.app")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await self.send_or_edit_message(
             context=context,
-            chat_id=chat_id,
-            user_id=user_id,
-            text=help_text,
-            reply_markup=reply_markup,
+            chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id,
+            text=self.screens.help.text,
+            reply_markup=self.screens.help.reply_markup,
             parse_mode='Markdown'
         )
     
     async def show_main_menu(self, chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE, query=None, welcome_text=None, show_registration_button=False):
         """Показать главное меню"""
-        if welcome_text:
-            menu_text = welcome_text
-        else:
-            menu_text = """
-🤖 **Бот Екатерины - Ваш помощник!**
-
-Выберите, что хотите сделать:
-            """
-        
-        keyboard = []
-        
-        # Если нужно показать кнопку регистрации (для незарегистрированных)
-        if show_registration_button:
-            keyboard.append([InlineKeyboardButton("🚀 Начать регистрацию", callback_data="start_registration")])
-        
-        keyboard.extend([
-            [InlineKeyboardButton("💎 Продукты", callback_data="main_shop")],
-            [InlineKeyboardButton("📚 Бесплатные материалы", callback_data="main_materials")],
-            [InlineKeyboardButton("📋 Мои заказы", callback_data="main_orders")],
-            [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
-            [InlineKeyboardButton("🌐 Веб-сайт", url="https://telegram-bot-kate.vercel.app")],
-            [InlineKeyboardButton("❓ Помощь", callback_data="main_help")]
-        ])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Для незарегистрированных - с кнопкой регистрации
+        screen = self.screens.main_menu_with_registration if show_registration_button else self.screens.main_menu
         
         await self.send_or_edit_message(
             context=context,
             chat_id=chat_id,
             user_id=user_id,
-            text=menu_text,
-            reply_markup=reply_markup,
+            text=welcome_text or screen.text,
+            reply_markup=screen.reply_markup,
             parse_mode='Markdown',
             query=query
         )
@@ -340,14 +259,14 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         await self.show_main_menu(chat_id, user_id, context, welcome_text=welcome_text, show_registration_button=not is_registered)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка текстовых сообщений"""
+        """Обработка текстовых сообщений по этапу диалога (conversation.step)"""
         user_id = update.effective_user.id
         message_text = update.message.text
         chat_id = update.effective_chat.id
         message_id = update.message.message_id
         
         # Получаем данные пользователя
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         if not user_data:
             await self.start_command(update, context)
             return
@@ -355,67 +274,47 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         current_stage = user_data.get('stage', 'start')
         
         # Удаляем сообщение пользователя для чистоты чата (кроме stage='phone_confirmation')
-        if current_stage != 'phone_confirmation':
+        if conversation.deletes_input(current_stage):
             await self.delete_user_message(context, chat_id, message_id)
         
-        if current_stage == 'name_input':
-            # Пользователь вводит имя
-            logger.info(f"Получено имя от user_id={user_id}: {message_text}")
-            
-            # Валидация имени
-            is_valid, result = self.validate_name(message_text)
-            if not is_valid:
-                error_text = f"""
-❌ {result}
+        transition = conversation.step(current_stage, message_text)
+        if transition is None:
+            return
+        
+        # Поле и новый этап сохраняются одной записью
+        changes = transition.changes
+        if changes:
+            logger.info(f"user_id={user_id}: {transition.stage} -> {transition.next_stage}")
+            user_data = await self.db.update_user_fields(user_id, **changes) or user_data
+        
+        await self.conversation_screens[transition.screen](update, context, user_data, transition)
+    
+    @staticmethod
+    def _gender_text(user_data) -> str:
+        gender = user_data.get('gender')
+        return 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+    
+    async def screen_name_error(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Имя не прошло validate_name"""
+        error_text = f"""
+❌ {transition.error}
 
 👤 Пожалуйста, введите ваше имя еще раз:
 • Минимум 2 символа
 • Максимум 50 символов
 • Должно содержать буквы
-                """
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            # Сохраняем валидированное имя
-            sanitized_name = result
-            self.db.update_user_data(user_id, 'name', sanitized_name)
-            self.db.update_user_stage(user_id, 'phone_input')
-            logger.info(f"Обновлен stage на 'phone_input' для user_id={user_id}, имя: {sanitized_name}")
-            
-            # Приятное приветствие и просьба указать телефон
-            phone_text = f"""
-Приятно познакомиться, {sanitized_name}! 😊
-
-Для завершения регистрации, пожалуйста, укажите ваш номер телефона.
+        """
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=error_text,
+            parse_mode='Markdown'
+        )
 
-📞 Формат: +7 (911) 792-93-94
+    async def screen_phone_error(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Телефон не прошел validate_phone_number"""
+        logger.warning(f"Некорректный номер телефона от user_id={update.effective_user.id} (этап {transition.stage})")
 
-После подтверждения данных вы получите доступ к бесплатным материалам!
-            """
-            
-            # Используем send_or_edit_message для удаления предыдущих сообщений
-            logger.info(f"Отправляем просьбу указать телефон для user_id={user_id}")
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=phone_text
-            )
-            logger.info(f"✅ Просьба указать телефон отправлена")
-            
-        elif current_stage == 'phone_input':
-            # Пользователь вводит телефон
-            logger.info(f"Получен телефон от user_id={user_id}: {message_text}")
-            
-            # Валидация номера телефона
-            if not self.validate_phone_number(message_text):
-                logger.warning(f"Некорректный номер телефона от user_id={user_id}: {message_text}")
-                
-                error_text = """
+        error_text = """
 ❌ **Некорректный номер телефона**
 
 Пожалуйста, введите номер в правильном формате.
@@ -429,552 +328,364 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 • `8 911 792-93-94` (с пробелами и дефисами)
 
 Попробуйте ещё раз:
-                """
-                
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            # Номер валидный - сохраняем и переходим к подтверждению
-            logger.info(f"✅ Номер телефона валидный для user_id={user_id}")
-            self.db.update_user_data(user_id, 'phone', message_text)
-            self.db.update_user_stage(user_id, 'phone_confirmation')
-            
-            # Получаем обновленные данные из БД
-            updated_user_data = self.db.get_user(user_id)
-            user_name = updated_user_data.get('name', 'пользователь')
-            gender = updated_user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
-✅ **Благодарим за регистрацию!**
+        """
 
-Пожалуйста, подтвердите введенные данные:
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id,
+            text=error_text,
+            parse_mode='Markdown'
+        )
 
-👥 Пол: {gender_text}
-👤 Имя: {user_name}
-📱 Телефон: {message_text}
+    async def screen_use_buttons(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Текст на этапе подтверждения"""
+        await update.message.reply_text(
+            "⚠️ Пожалуйста, используйте кнопки выше для подтверждения или изменения данных."
+        )
 
-Всё верно?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_registration")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
-            logger.info(f"✅ Подтверждение отправлено")
-        
-        elif current_stage == 'confirmation':
-            # Если пользователь что-то пишет на этапе подтверждения
-            await update.message.reply_text(
-                "⚠️ Пожалуйста, используйте кнопки выше для подтверждения или изменения данных."
-            )
-        
-        elif current_stage == 'phone_confirmation':
-            # Если пользователь что-то пишет на этапе подтверждения (старая версия)
-            await update.message.reply_text(
-                "⚠️ Пожалуйста, используйте кнопки выше для подтверждения или изменения данных."
-            )
-        
-        elif current_stage == 'edit_profile_name':
-            # Ввод имени при редактировании профиля
-            logger.info(f"Получено имя при редактировании профиля от user_id={user_id}: {message_text}")
-            self.db.update_user_data(user_id, 'name', message_text)
-            self.db.update_user_stage(user_id, 'edit_profile_phone')
-            
-            # Просьба указать телефон
-            phone_text = f"""
-Приятно познакомиться, {message_text}! 😊
+    async def screen_ask_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Имя сохранено - просьба указать телефон (регистрация)"""
+        phone_text = f"""
+Приятно познакомиться, {transition.fields['name']}! 😊
 
-Для завершения редактирования профиля, пожалуйста, укажите ваш номер телефона.
+Для завершения регистрации, пожалуйста, укажите ваш номер телефона.
 
 📞 Формат: +7 (911) 792-93-94
-            """
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=phone_text
-            )
-            logger.info(f"✅ Просьба указать телефон при редактировании отправлена")
-        
-        elif current_stage == 'edit_profile_phone':
-            # Ввод телефона при редактировании профиля
-            logger.info(f"Получен телефон при редактировании профиля от user_id={user_id}: {message_text}")
-            
-            # Валидация номера телефона
-            if not self.validate_phone_number(message_text):
-                logger.warning(f"Некорректный номер телефона при редактировании профиля от user_id={user_id}")
-                
-                error_text = """
-❌ **Некорректный номер телефона**
-
-Пожалуйста, введите номер в правильном формате.
 
-📞 **Примеры корректных форматов:**
+После подтверждения данных вы получите доступ к бесплатным материалам!
+        """
 
-• `89117929394` (8 + 10 цифр)
-• `79117929394` (7 + 10 цифр)  
-• `+79117929394` (+7 + 10 цифр)
-• `+7 (911) 792-93-94` (с пробелами и скобками)
-• `8 911 792-93-94` (с пробелами и дефисами)
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id,
+            text=phone_text
+        )
 
-Попробуйте ещё раз:
-                """
-                
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            # Номер валидный - сохраняем и переходим к подтверждению
-            logger.info(f"✅ Номер телефона валидный при редактировании профиля для user_id={user_id}")
-            self.db.update_user_data(user_id, 'phone', message_text)
-            self.db.update_user_stage(user_id, 'edit_profile_confirmation')
-            
-            # Получаем обновленные данные из БД
-            updated_user_data = self.db.get_user(user_id)
-            user_name = updated_user_data.get('name', 'пользователь')
-            gender = updated_user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
-✅ **Профиль обновлен!**
+    async def screen_ask_profile_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Имя сохранено - просьба указать телефон (редактирование профиля)"""
+        phone_text = f"""
+Приятно познакомиться, {transition.fields['name']}! 😊
 
-Пожалуйста, подтвердите введенные данные:
+Для завершения редактирования профиля, пожалуйста, укажите ваш номер телефона.
 
-👥 Пол: {gender_text}
-👤 Имя: {user_name}
-📱 Телефон: {message_text}
+📞 Формат: +7 (911) 792-93-94
+        """
 
-Всё верно?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_profile_edit"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_profile")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
-            logger.info(f"✅ Подтверждение редактирования профиля отправлено")
-        
-        elif current_stage == 'edit_profile_confirmation':
-            # Если пользователь что-то пишет на этапе подтверждения редактирования
-            await update.message.reply_text(
-                "⚠️ Пожалуйста, используйте кнопки выше для подтверждения или изменения данных."
-            )
-        
-        elif current_stage == 'edit_name_simple':
-            # Редактирование имени (упрощенная регистрация)
-            # Валидация имени
-            is_valid, result = self.validate_name(message_text)
-            if not is_valid:
-                error_text = f"""
-❌ {result}
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id,
+            text=phone_text
+        )
 
-👤 Пожалуйста, введите ваше имя еще раз:
-• Минимум 2 символа
-• Максимум 50 символов
-• Должно содержать буквы
-                """
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            sanitized_name = result
-            self.db.update_user_data(user_id, 'name', sanitized_name)
-            self.db.update_user_stage(user_id, 'confirmation')
-            
-            # Получаем обновленные данные из БД
-            updated_user_data = self.db.get_user(user_id)
-            gender = updated_user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
-✅ **Имя обновлено!**
+    async def _send_data_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, title: str,
+                                      confirm_callback: str, edit_callback: str, with_phone: bool = True):
+        """Экран подтверждения введенных данных"""
+        phone_line = f"\n📱 Телефон: {user_data.get('phone') or 'Не указан'}" if with_phone else ""
+        confirmation_text = f"""
+✅ **{title}**
 
 Пожалуйста, подтвердите введенные данные:
 
-👥 Пол: {gender_text}
-👤 Имя: {sanitized_name}
+👥 Пол: {self._gender_text(user_data)}
+👤 Имя: {user_data.get('name') or 'пользователь'}{phone_line}
 
 Всё верно?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_simple_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_simple_registration")
-                ]
+        """
+
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Всё верно", callback_data=confirm_callback),
+                InlineKeyboardButton("✏️ Изменить", callback_data=edit_callback)
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
+        ]
+
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id,
+            text=confirmation_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def screen_confirm_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Подтверждение данных регистрации"""
+        await self._send_data_confirmation(update, context, user_data, transition.title,
+                                           'confirm_registration', 'edit_registration')
+
+    async def screen_confirm_profile_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Подтверждение отредактированного профиля"""
+        await self._send_data_confirmation(update, context, user_data, transition.title,
+                                           'confirm_profile_edit', 'edit_profile')
+
+    async def screen_confirm_simple_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_data, transition):
+        """Подтверждение упрощенной регистрации (без телефона)"""
+        await self._send_data_confirmation(update, context, user_data, transition.title,
+                                           'confirm_simple_registration', 'edit_simple_registration',
+                                           with_phone=False)
+
+    def register_callbacks(self, router: CallbackRouter):
+        """Регистрация обработчиков inline-кнопок пользователя"""
+        # Кнопки с аргументом: <префикс><значение>
+        router.add_prefix('gender_', self.callback_gender, choice('male', 'female'))
+        router.add_prefix('edit_profile_gender_', self.callback_edit_profile_gender, choice('male', 'female'))
+        router.add_prefix('product_', self.callback_product)
+        router.add_prefix('buy_product_', self.callback_buy_product)
+        router.add_prefix('add_cart_', self.callback_add_cart)
+        router.add_prefix('remove_cart_', self.callback_remove_cart)
+        router.add_prefix('add_fav_', self.callback_add_fav)
+        router.add_prefix('remove_fav_', self.callback_remove_fav)
+        router.add_prefix('order_details_', self.callback_order_details)
+        router.add_prefix('pay_order_', self.callback_pay_order)
+        
+        # Кнопки без аргументов: обработчик callback_<ключ>
+        for key in (
+            'main_menu', 'main_shop', 'main_materials', 'main_orders', 'main_profile', 'main_help',
+            'create_order_from_cart', 'clear_cart',
+            'edit_profile', 'delete_profile', 'confirm_delete_profile', 'confirm_profile_edit',
+            'start_registration', 'confirm_registration', 'edit_registration', 'back_to_confirmation',
+            'edit_name', 'edit_phone',
+            'confirm_simple_registration', 'edit_simple_registration', 'back_to_simple_confirmation',
+            'edit_gender', 'edit_name_simple',
+        ):
+            router.add(key, getattr(self, f'callback_{key}'))
+    
+    async def callback_gender(self, update: Update, context: ContextTypes.DEFAULT_TYPE, gender: str):
+        """Обработка выбора пола"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        gender_text = 'мужчина' if gender == 'male' else 'женщина'
+        
+        await self.db.update_user_fields(user_id, gender=gender, stage='name_input')
         
-        elif current_stage == 'edit_name':
-            # Редактирование имени
-            # Валидация имени
-            is_valid, result = self.validate_name(message_text)
-            if not is_valid:
-                error_text = f"""
-❌ {result}
+        # Удаляем предыдущее сообщение и отправляем новое с просьбой ввести имя
+        name_request_text = f"""
+Отлично! Вы выбрали: {gender_text}
 
-👤 Пожалуйста, введите ваше имя еще раз:
-• Минимум 2 символа
-• Максимум 50 символов
-• Должно содержать буквы
-                """
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            sanitized_name = result
-            self.db.update_user_data(user_id, 'name', sanitized_name)
-            self.db.update_user_stage(user_id, 'phone_confirmation')
-            
-            # Получаем обновленные данные из БД
-            updated_user_data = self.db.get_user(user_id)
-            phone = updated_user_data.get('phone', 'Не указан')
-            gender = updated_user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+Теперь, пожалуйста, введите ваше имя:
+        """
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=name_request_text,
+            query=query
+        )
+    
+    async def callback_product(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Обработка выбора продукта - показываем описание"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.show_product_details(chat_id, context, product_id, user_id, query=query)
+    
+    async def callback_buy_product(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Обработка покупки продукта - переходим к оплате"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.handle_product_purchase(chat_id, context, product_id, user_id)
+    
+    async def callback_add_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Добавление продукта в корзину"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        if await self.db.add_to_cart(user_id, product_id):
+            await query.answer("✅ Товар добавлен в корзину!", show_alert=False)
+            # Обновляем описание продукта с новыми кнопками
+            await self.show_product_details(chat_id, context, product_id, user_id, query=query)
+        else:
+            await query.answer("❌ Ошибка при добавлении в корзину", show_alert=True)
+    
+    async def callback_remove_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Удаление продукта из корзины"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        if await self.db.remove_from_cart(user_id, product_id):
+            await query.answer("✅ Товар удален из корзины", show_alert=False)
+            # Обновляем описание продукта с новыми кнопками
+            await self.show_product_details(chat_id, context, product_id, user_id, query=query)
+        else:
+            await query.answer("❌ Ошибка при удалении из корзины", show_alert=True)
+    
+    async def callback_add_fav(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Добавление продукта в избранное"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        if await self.db.add_to_favorites(user_id, product_id):
+            await query.answer("❤️ Товар добавлен в избранное!", show_alert=False)
+            # Обновляем описание продукта с новыми кнопками
+            await self.show_product_details(chat_id, context, product_id, user_id, query=query)
+        else:
+            await query.answer("❌ Ошибка при добавлении в избранное", show_alert=True)
+    
+    async def callback_remove_fav(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
+        """Удаление продукта из избранного"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        if await self.db.remove_from_favorites(user_id, product_id):
+            await query.answer("✅ Товар удален из избранного", show_alert=False)
+            # Обновляем описание продукта с новыми кнопками
+            await self.show_product_details(chat_id, context, product_id, user_id, query=query)
+        else:
+            await query.answer("❌ Ошибка при удалении из избранного", show_alert=True)
+    
+    async def callback_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать главное меню"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.show_main_menu(chat_id, user_id, context, query=query)
+    
+    async def callback_main_shop(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать продукты"""
+        query = update.callback_query
+        
+        await self.shop_command(update, context, query=query)
+    
+    async def callback_main_materials(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать бесплатные материалы"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        user_data = await self.db.get_user(user_id)
+        
+        # Логирование для отладки
+        logger.info(f"Запрос материалов от user_id={user_id}")
+        logger.info(f"user_data: name={user_data.get('name')}, phone={user_data.get('phone')}, stage={user_data.get('stage')}")
+        
+        # Проверяем полную регистрацию: имя, телефон и stage='registered'
+        is_registered = (
+            user_data and 
+            user_data.get('name') and 
+            user_data.get('phone') and
+            user_data.get('stage') == 'registered'
+        )
+        
+        logger.info(f"is_registered={is_registered}")
+        
+        if is_registered:
+            # Пользователь уже зарегистрирован - просто показываем материалы
+            logger.info("Показываем материалы зарегистрированному пользователю из главного меню")
+            await self.send_free_materials(chat_id, context, user_data['name'], is_registered=True, source='menu')
+        else:
+            # Пользователь НЕ зарегистрирован полностью - требуем завершить регистрацию
+            logger.info(f"Требуем завершить регистрацию. Текущий stage: {user_data.get('stage')}")
             
-            confirmation_text = f"""
-✅ **Имя обновлено!**
+            incomplete_text = """
+❌ **Доступ к материалам закрыт**
 
-Пожалуйста, подтвердите введенные данные:
+Для получения бесплатных материалов необходимо завершить регистрацию.
 
-👥 Пол: {gender_text}
-👤 Имя: {sanitized_name}
-📱 Телефон: {phone}
+📝 Это займет всего 1 минуту!
 
-Всё верно?
+Нажмите кнопку ниже, чтобы продолжить:
             """
             
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_registration")
-                ]
-            ]
+            keyboard = [[InlineKeyboardButton("📝 Завершить регистрацию", callback_data="start_registration")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await self.send_or_edit_message(
                 context=context,
                 chat_id=chat_id,
                 user_id=user_id,
-                text=confirmation_text,
+                text=incomplete_text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                query=query
             )
+    
+    async def callback_main_orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать заказы пользователя"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
         
-        elif current_stage == 'edit_phone':
-            # Редактирование телефона
-            logger.info(f"Редактирование телефона от user_id={user_id}: {message_text}")
-            
-            # Валидация номера телефона
-            if not self.validate_phone_number(message_text):
-                logger.warning(f"Некорректный номер телефона при редактировании от user_id={user_id}")
-                
-                error_text = """
-❌ **Некорректный номер телефона**
-
-Пожалуйста, введите номер в правильном формате.
-
-📞 **Примеры корректных форматов:**
-
-• `89117929394` (8 + 10 цифр)
-• `79117929394` (7 + 10 цифр)  
-• `+79117929394` (+7 + 10 цифр)
-• `+7 (911) 792-93-94` (с пробелами и скобками)
-• `8 911 792-93-94` (с пробелами и дефисами)
-
-Попробуйте ещё раз:
-                """
-                
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=error_text,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            # Номер валидный - обновляем
-            logger.info(f"✅ Номер телефона валидный при редактировании для user_id={user_id}")
-            self.db.update_user_data(user_id, 'phone', message_text)
-            self.db.update_user_stage(user_id, 'phone_confirmation')
-            
-            # Получаем обновленные данные из БД
-            updated_user_data = self.db.get_user(user_id)
-            name = updated_user_data.get('name', 'пользователь')
-            gender = updated_user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
-✅ **Телефон обновлен!**
-
-Пожалуйста, подтвердите введенные данные:
-
-👥 Пол: {gender_text}
-👤 Имя: {name}
-📱 Телефон: {message_text}
+        await self.show_orders_menu(chat_id, context, user_id, query=query)
+    
+    async def callback_order_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int):
+        """Показать детали заказа"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.show_order_details(chat_id, context, user_id, order_id, query=query)
+    
+    async def callback_pay_order(self, update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int):
+        """Оплата заказа"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.pay_order(chat_id, context, user_id, order_id)
+    
+    async def callback_create_order_from_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Создание заказа из корзины"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.create_order_from_cart(chat_id, context, user_id, query=query)
+    
+    async def callback_clear_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Очистка корзины"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        if await self.db.clear_cart(user_id):
+            await query.answer("✅ Корзина очищена", show_alert=False) if query else None
+            cart_text = """
+🛒 **Корзина очищена**
 
-Всё верно?
+Ваша корзина теперь пуста.
             """
-            
             keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_registration")
-                ]
+                [InlineKeyboardButton("💎 В каталог", callback_data="main_shop")],
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await self.send_or_edit_message(
                 context=context,
                 chat_id=chat_id,
                 user_id=user_id,
-                text=confirmation_text,
+                text=cart_text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                query=query
             )
+        else:
+            await query.answer("❌ Ошибка при очистке корзины", show_alert=True) if query else None
     
-    async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка callback запросов"""
+    async def callback_main_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать профиль пользователя"""
         query = update.callback_query
-        await query.answer()
-        
         user_id = query.from_user.id
         chat_id = query.message.chat_id
-        data = query.data
         
-        if data.startswith('gender_'):
-            # Обработка выбора пола
-            gender = 'male' if data == 'gender_male' else 'female'
-            gender_text = 'мужчина' if gender == 'male' else 'женщина'
-            
-            self.db.update_user_data(user_id, 'gender', gender)
-            self.db.update_user_stage(user_id, 'name_input')
-            
-            # Удаляем предыдущее сообщение и отправляем новое с просьбой ввести имя
-            name_request_text = f"""
-Отлично! Вы выбрали: {gender_text}
-
-Теперь, пожалуйста, введите ваше имя:
-            """
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=name_request_text,
-                query=query
-            )
-            
-        elif data.startswith('product_'):
-            # Обработка выбора продукта - показываем описание
-            product_id = data.split('_')[1]
-            await self.show_product_details(chat_id, context, product_id, user_id, query=query)
-        
-        elif data.startswith('buy_product_'):
-            # Обработка покупки продукта - переходим к оплате
-            product_id = data.split('_')[2]
-            await self.handle_product_purchase(chat_id, context, product_id, user_id)
-        
-        elif data.startswith('add_cart_'):
-            # Добавление продукта в корзину
-            product_id = int(data.split('_')[2])
-            if self.db.add_to_cart(user_id, product_id):
-                await query.answer("✅ Товар добавлен в корзину!", show_alert=False)
-                # Обновляем описание продукта с новыми кнопками
-                await self.show_product_details(chat_id, context, str(product_id), user_id, query=query)
-            else:
-                await query.answer("❌ Ошибка при добавлении в корзину", show_alert=True)
-        
-        elif data.startswith('remove_cart_'):
-            # Удаление продукта из корзины
-            product_id = int(data.split('_')[2])
-            if self.db.remove_from_cart(user_id, product_id):
-                await query.answer("✅ Товар удален из корзины", show_alert=False)
-                # Обновляем описание продукта с новыми кнопками
-                await self.show_product_details(chat_id, context, str(product_id), user_id, query=query)
-            else:
-                await query.answer("❌ Ошибка при удалении из корзины", show_alert=True)
-        
-        elif data.startswith('add_fav_'):
-            # Добавление продукта в избранное
-            product_id = int(data.split('_')[2])
-            if self.db.add_to_favorites(user_id, product_id):
-                await query.answer("❤️ Товар добавлен в избранное!", show_alert=False)
-                # Обновляем описание продукта с новыми кнопками
-                await self.show_product_details(chat_id, context, str(product_id), user_id, query=query)
-            else:
-                await query.answer("❌ Ошибка при добавлении в избранное", show_alert=True)
-        
-        elif data.startswith('remove_fav_'):
-            # Удаление продукта из избранного
-            product_id = int(data.split('_')[2])
-            if self.db.remove_from_favorites(user_id, product_id):
-                await query.answer("✅ Товар удален из избранного", show_alert=False)
-                # Обновляем описание продукта с новыми кнопками
-                await self.show_product_details(chat_id, context, str(product_id), user_id, query=query)
-            else:
-                await query.answer("❌ Ошибка при удалении из избранного", show_alert=True)
-            
-        elif data == 'main_menu':
-            # Показать главное меню
-            await self.show_main_menu(chat_id, user_id, context, query=query)
-            
-        elif data == 'main_shop':
-            # Показать продукты
-            await self.shop_command(update, context, query=query)
-            
-        elif data == 'main_materials':
-            # Показать бесплатные материалы
-            user_data = self.db.get_user(user_id)
-            
-            # Логирование для отладки
-            logger.info(f"Запрос материалов от user_id={user_id}")
-            logger.info(f"user_data: name={user_data.get('name')}, phone={user_data.get('phone')}, stage={user_data.get('stage')}")
-            
-            # Проверяем полную регистрацию: имя, телефон и stage='registered'
-            is_registered = (
-                user_data and 
-                user_data.get('name') and 
-                user_data.get('phone') and
-                user_data.get('stage') == 'registered'
-            )
-            
-            logger.info(f"is_registered={is_registered}")
-            
-            if is_registered:
-                # Пользователь уже зарегистрирован - просто показываем материалы
-                logger.info("Показываем материалы зарегистрированному пользователю из главного меню")
-                await self.send_free_materials(chat_id, context, user_data['name'], is_registered=True, source='menu')
-            else:
-                # Пользователь НЕ зарегистрирован полностью - требуем завершить регистрацию
-                logger.info(f"Требуем завершить регистрацию. Текущий stage: {user_data.get('stage')}")
-                
-                incomplete_text = """
-❌ **Доступ к материалам закрыт**
-
-Для получения бесплатных материалов необходимо завершить регистрацию.
-
-📝 Это займет всего 1 минуту!
-
-Нажмите кнопку ниже, чтобы продолжить:
-                """
-                
-                keyboard = [[InlineKeyboardButton("📝 Завершить регистрацию", callback_data="start_registration")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=incomplete_text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown',
-                    query=query
-                )
-            
-        elif data == 'main_orders':
-            # Показать заказы пользователя
-            await self.show_orders_menu(chat_id, context, user_id, query=query)
-        
-        elif data.startswith('order_details_'):
-            # Показать детали заказа
-            order_id = int(data.split('_')[2])
-            await self.show_order_details(chat_id, context, user_id, order_id, query=query)
-        
-        elif data.startswith('pay_order_'):
-            # Оплата заказа
-            order_id = int(data.split('_')[2])
-            await self.pay_order(chat_id, context, user_id, order_id)
-        
-        elif data == 'create_order_from_cart':
-            # Создание заказа из корзины
-            await self.create_order_from_cart(chat_id, context, user_id, query=query)
-        
-        elif data == 'clear_cart':
-            # Очистка корзины
-            if self.db.clear_cart(user_id):
-                await query.answer("✅ Корзина очищена", show_alert=False) if query else None
-                cart_text = """
-🛒 **Корзина очищена**
-
-Ваша корзина теперь пуста.
-                """
-                keyboard = [
-                    [InlineKeyboardButton("💎 В каталог", callback_data="main_shop")],
-                    [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=cart_text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown',
-                    query=query
-                )
-            else:
-                await query.answer("❌ Ошибка при очистке корзины", show_alert=True) if query else None
+        user_data = await self.db.get_user(user_id)
+        if user_data:
+            gender = user_data.get('gender', 'не указан')
+            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
             
-        elif data == 'main_profile':
-            # Показать профиль пользователя
-            user_data = self.db.get_user(user_id)
-            if user_data:
-                gender = user_data.get('gender', 'не указан')
-                gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-                
-                profile_text = f"""
+            profile_text = f"""
 👤 **Ваш профиль:**
 
 🆔 ID: `{user_data['user_id']}`
@@ -982,88 +693,98 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 👥 Пол: {gender_text}
 📱 Телефон: {user_data.get('phone', 'Не указан')}
 📅 Регистрация: {user_data.get('registration_date', 'Не указана')}
-                """
-            else:
-                profile_text = "❌ Профиль не найден."
-            
-            keyboard = [
-                [InlineKeyboardButton("✏️ Редактировать профиль", callback_data="edit_profile")],
-                [InlineKeyboardButton("🗑️ Удалить профиль", callback_data="delete_profile")],
-                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=profile_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+            """
+        else:
+            profile_text = "❌ Профиль не найден."
         
-        elif data == 'edit_profile':
-            # Начало редактирования профиля (тот же порядок, что и при регистрации)
-            logger.info(f"Начало редактирования профиля user_id={user_id}")
-            
-            # Устанавливаем stage для начала редактирования
-            self.db.update_user_stage(user_id, 'edit_profile_gender')
-            
-            edit_start_text = """
+        keyboard = [
+            [InlineKeyboardButton("✏️ Редактировать профиль", callback_data="edit_profile")],
+            [InlineKeyboardButton("🗑️ Удалить профиль", callback_data="delete_profile")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=profile_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_edit_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Начало редактирования профиля (тот же порядок, что и при регистрации)"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        logger.info(f"Начало редактирования профиля user_id={user_id}")
+        
+        # Устанавливаем stage для начала редактирования
+        await self.db.update_user_stage(user_id, 'edit_profile_gender')
+        
+        edit_start_text = """
 ✏️ **Редактирование профиля**
 
 Давайте обновим ваши данные. Начнем с выбора пола:
 
 Какого вы пола?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("👨 Мужчина", callback_data="edit_profile_gender_male"),
-                    InlineKeyboardButton("👩 Женщина", callback_data="edit_profile_gender_female")
-                ]
+        """
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("👨 Мужчина", callback_data="edit_profile_gender_male"),
+                InlineKeyboardButton("👩 Женщина", callback_data="edit_profile_gender_female")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=edit_start_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data.startswith('edit_profile_gender_'):
-            # Обработка выбора пола при редактировании профиля
-            gender = 'male' if data == 'edit_profile_gender_male' else 'female'
-            gender_text = 'мужчина' if gender == 'male' else 'женщина'
-            
-            self.db.update_user_data(user_id, 'gender', gender)
-            self.db.update_user_stage(user_id, 'edit_profile_name')
-            
-            name_request_text = f"""
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=edit_start_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_edit_profile_gender(self, update: Update, context: ContextTypes.DEFAULT_TYPE, gender: str):
+        """Обработка выбора пола при редактировании профиля"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        gender_text = 'мужчина' if gender == 'male' else 'женщина'
+        
+        await self.db.update_user_fields(user_id, gender=gender, stage='edit_profile_name')
+        
+        name_request_text = f"""
 Отлично! Вы выбрали: {gender_text}
 
 Теперь, пожалуйста, введите ваше имя:
-            """
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=name_request_text,
-                query=query
-            )
+        """
         
-        elif data == 'delete_profile':
-            # Запрос подтверждения удаления профиля
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь') if user_data else 'пользователь'
-            
-            delete_warning_text = f"""
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=name_request_text,
+            query=query
+        )
+    
+    async def callback_delete_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запрос подтверждения удаления профиля"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        user_data = await self.db.get_user(user_id)
+        user_name = user_data.get('name', 'пользователь') if user_data else 'пользователь'
+        
+        delete_warning_text = f"""
 ⚠️ **ВНИМАНИЕ! Удаление профиля**
 
 {user_name}, вы собираетесь удалить свой профиль.
@@ -1074,20 +795,61 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 • Избранные товары
 • Статус регистрации
 
-✅ **Что сохранится:**
-• История заказов (для отчетности)
-• Базовая информация (ID, username)
+✅ **Что сохранится:**
+• История заказов (для отчетности)
+• Базовая информация (ID, username)
+
+⚠️ **Это действие нельзя отменить!**
+
+Вы уверены, что хотите удалить профиль?
+        """
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Да, удалить", callback_data="confirm_delete_profile"),
+                InlineKeyboardButton("❌ Отмена", callback_data="main_profile")
+            ]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=delete_warning_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_confirm_delete_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подтверждение удаления профиля"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        logger.info(f"Удаление профиля user_id={user_id}")
+        
+        # Сброс профиля
+        success = await self.db.reset_user_profile(user_id)
+        
+        if success:
+            delete_success_text = """
+✅ **Профиль успешно удален!**
+
+Ваши регистрационные данные были удалены.
 
-⚠️ **Это действие нельзя отменить!**
+Вы можете:
+• 🚀 Пройти регистрацию заново через /start
+• 📚 Просматривать каталог продуктов
+• 🌐 Посетить наш веб-сайт
 
-Вы уверены, что хотите удалить профиль?
+Спасибо, что были с нами! 🙏
             """
             
             keyboard = [
-                [
-                    InlineKeyboardButton("✅ Да, удалить", callback_data="confirm_delete_profile"),
-                    InlineKeyboardButton("❌ Отмена", callback_data="main_profile")
-                ]
+                [InlineKeyboardButton("🚀 Начать регистрацию", callback_data="start_registration")],
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -1095,126 +857,24 @@ A: "👤 Мой профиль" → "Редактировать профиль".
                 context=context,
                 chat_id=chat_id,
                 user_id=user_id,
-                text=delete_warning_text,
+                text=delete_success_text,
                 reply_markup=reply_markup,
                 parse_mode='Markdown',
                 query=query
             )
-        
-        elif data == 'confirm_delete_profile':
-            # Подтверждение удаления профиля
-            logger.info(f"Удаление профиля user_id={user_id}")
-            
-            # Сброс профиля
-            success = self.db.reset_user_profile(user_id)
-            
-            if success:
-                delete_success_text = """
-✅ **Профиль успешно удален!**
-
-Ваши регистрационные данные были удалены.
-
-Вы можете:
-• 🚀 Пройти регистрацию заново через /start
-• 📚 Просматривать каталог продуктов
-• 🌐 Посетить наш веб-сайт
-
-Спасибо, что были с нами! 🙏
-                """
-                
-                keyboard = [
-                    [InlineKeyboardButton("🚀 Начать регистрацию", callback_data="start_registration")],
-                    [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=delete_success_text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown',
-                    query=query
-                )
-                logger.info(f"✅ Профиль user_id={user_id} успешно удален")
-            else:
-                error_text = """
+            logger.info(f"✅ Профиль user_id={user_id} успешно удален")
+        else:
+            error_text = """
 ❌ **Ошибка при удалении профиля**
 
 Произошла ошибка при попытке удалить профиль.
 
 Пожалуйста, попробуйте позже или обратитесь к администратору.
-                """
-                
-                keyboard = [
-                    [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
-                    [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await self.send_or_edit_message(
-                    context=context,
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    text=error_text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown',
-                    query=query
-                )
-                logger.error(f"❌ Ошибка при удалении профиля user_id={user_id}")
-            
-        elif data == 'main_help':
-            # Показать справку
-            help_text = """
-📖 **Справка по боту Екатерины - кризисного целителя**
-
-🤖 **О боте:**
-Я ваш персональный помощник, который поможет вам:
-• 📚 Получить доступ к бесплатным материалам
-• 💎 Ознакомиться с продуктами и услугами
-• 📋 Управлять заказами
-• 👤 Настроить профиль
-
-📱 **Основные команды:**
-• `/start` - Начать работу с ботом
-• `/help` - Показать эту справку
-• `/shop` - Открыть каталог продуктов
-
-🎯 **Как использовать:**
-1. Используйте кнопки меню для навигации
-2. Всегда можно вернуться в главное меню
-3. Для покупок выберите "💎 Продукты"
-4. Бесплатные материалы доступны после регистрации
-
-❓ **Частые вопросы:**
-
-**Q: Как зарегистрироваться?**
-A: Нажмите /start и следуйте инструкциям. Регистрация займет 1 минуту.
-
-**Q: Где найти бесплатные материалы?**
-A: После регистрации они будут доступны в разделе "📚 Бесплатные материалы".
-
-**Q: Как купить продукт?**
-A: Выберите "💎 Продукты" → выберите продукт → "Купить" → оплатите.
-
-**Q: Как посмотреть мои заказы?**
-A: В главном меню выберите "📋 Мои заказы".
-
-**Q: Как изменить профиль?**
-A: "👤 Мой профиль" → "Редактировать профиль".
-
-🌐 **Веб-сайт:** https://telegram-bot-kate.vercel.app
-
-💬 **Нужна помощь?**
-Напишите администратору через веб-сайт или используйте форму обратной связи.
             """
             
             keyboard = [
-                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")],
-                [InlineKeyboardButton("💎 Продукты", callback_data="main_shop")],
-                [InlineKeyboardButton("📚 Материалы", callback_data="main_materials")],
-                [InlineKeyboardButton("🌐 Веб-сайт", url="https://telegram-bot-kate.vercel.app")]
+                [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -1222,106 +882,138 @@ A: "👤 Мой профиль" → "Редактировать профиль".
                 context=context,
                 chat_id=chat_id,
                 user_id=user_id,
-                text=help_text,
+                text=error_text,
                 reply_markup=reply_markup,
                 parse_mode='Markdown',
                 query=query
             )
+            logger.error(f"❌ Ошибка при удалении профиля user_id={user_id}")
+    
+    async def callback_main_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать справку"""
+        query = update.callback_query
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=query.message.chat_id,
+            user_id=query.from_user.id,
+            text=self.screens.help.text,
+            reply_markup=self.screens.help.reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_confirm_simple_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подтверждение упрощенной регистрации (без телефона)"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
         
-        elif data == 'confirm_simple_registration':
-            # Подтверждение упрощенной регистрации (без телефона)
-            logger.info(f"Подтверждение упрощенной регистрации user_id={user_id}")
-            self.db.update_user_stage(user_id, 'registered')
-            
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь')
-            
-            logger.info(f"После update_user_stage: name={user_name}, stage={user_data.get('stage')}")
-            
-            success_text = f"""
+        logger.info(f"Подтверждение упрощенной регистрации user_id={user_id}")
+        user_data = await self.db.update_user_fields(user_id, stage='registered')
+        user_name = user_data.get('name', 'пользователь')
+        
+        logger.info(f"После update_user_fields: name={user_name}, stage={user_data.get('stage')}")
+        
+        success_text = f"""
 ✅ **{user_name}, отлично! Регистрация завершена!**
 
 🎁 Сейчас вы получите доступ к бесплатным материалам...
-            """
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=success_text,
-                parse_mode='Markdown'
-            )
-            
-            # Отправляем бесплатные материалы ПОСЛЕ регистрации
-            logger.info(f"Отправка материалов с is_registered=True")
-            await self.send_free_materials(chat_id, context, user_name, is_registered=True)
+        """
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=success_text,
+            parse_mode='Markdown'
+        )
+        
+        # Отправляем бесплатные материалы ПОСЛЕ регистрации
+        logger.info(f"Отправка материалов с is_registered=True")
+        await self.send_free_materials(chat_id, context, user_name, is_registered=True)
+    
+    async def callback_edit_simple_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Редактирование данных упрощенной регистрации"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
         
-        elif data == 'edit_simple_registration':
-            # Редактирование данных упрощенной регистрации
-            edit_text = """
+        edit_text = """
 ✏️ **Что вы хотите изменить?**
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("👥 Изменить пол", callback_data="edit_gender")],
-                [InlineKeyboardButton("👤 Изменить имя", callback_data="edit_name_simple")],
-                [InlineKeyboardButton("◀️ Назад", callback_data="back_to_simple_confirmation")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=edit_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        """
         
-        elif data == 'edit_gender':
-            # Запрос нового пола
-            self.db.update_user_stage(user_id, 'gender_selection')
-            
-            gender_text = """
+        keyboard = [
+            [InlineKeyboardButton("👥 Изменить пол", callback_data="edit_gender")],
+            [InlineKeyboardButton("👤 Изменить имя", callback_data="edit_name_simple")],
+            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_simple_confirmation")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=edit_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_edit_gender(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запрос нового пола"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.db.update_user_stage(user_id, 'gender_selection')
+        
+        gender_text = """
 👥 **Выберите ваш пол:**
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("👨 Мужчина", callback_data="gender_male"),
-                    InlineKeyboardButton("👩 Женщина", callback_data="gender_female")
-                ],
-                [InlineKeyboardButton("◀️ Назад", callback_data="back_to_simple_confirmation")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=gender_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        """
         
-        elif data == 'edit_name_simple':
-            # Запрос нового имени
-            self.db.update_user_stage(user_id, 'edit_name_simple')
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="👤 **Введите ваше новое имя:**",
-                parse_mode='Markdown'
-            )
+        keyboard = [
+            [
+                InlineKeyboardButton("👨 Мужчина", callback_data="gender_male"),
+                InlineKeyboardButton("👩 Женщина", callback_data="gender_female")
+            ],
+            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_simple_confirmation")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data == 'back_to_simple_confirmation':
-            # Возврат к подтверждению
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь')
-            gender = user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=gender_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_edit_name_simple(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запрос нового имени"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.db.update_user_stage(user_id, 'edit_name_simple')
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="👤 **Введите ваше новое имя:**",
+            parse_mode='Markdown'
+        )
+    
+    async def callback_back_to_simple_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Возврат к подтверждению"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        user_data = await self.db.get_user(user_id)
+        user_name = user_data.get('name', 'пользователь')
+        gender = user_data.get('gender', 'не указан')
+        gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+        
+        confirmation_text = f"""
 ✅ **Благодарим за регистрацию!**
 
 Пожалуйста, подтвердите введенные данные:
@@ -1330,42 +1022,44 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 👤 Имя: {user_name}
 
 Всё верно?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_simple_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_simple_registration")
-                ]
+        """
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Всё верно", callback_data="confirm_simple_registration"),
+                InlineKeyboardButton("✏️ Изменить", callback_data="edit_simple_registration")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            self.db.update_user_stage(user_id, 'confirmation')
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data == 'confirm_registration':
-            # Подтверждение регистрации
-            logger.info(f"Подтверждение регистрации user_id={user_id}")
-            self.db.update_user_stage(user_id, 'registered')
-            
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь')
-            phone = user_data.get('phone', 'Не указан')
-            gender = user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            logger.info(f"После update_user_stage: name={user_name}, phone={phone}, gender={gender_text}, stage={user_data.get('stage')}")
-            
-            success_text = f"""
+        await self.db.update_user_stage(user_id, 'confirmation')
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=confirmation_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_confirm_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подтверждение регистрации"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        logger.info(f"Подтверждение регистрации user_id={user_id}")
+        user_data = await self.db.update_user_fields(user_id, stage='registered')
+        user_name = user_data.get('name', 'пользователь')
+        phone = user_data.get('phone', 'Не указан')
+        gender = user_data.get('gender', 'не указан')
+        gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+        
+        logger.info(f"После update_user_fields: name={user_name}, phone={phone}, gender={gender_text}, stage={user_data.get('stage')}")
+        
+        success_text = f"""
 ✅ **{user_name}, отлично! Регистрация завершена!**
 
 Ваши данные:
@@ -1374,30 +1068,32 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 📱 Телефон: {phone}
 
 🎁 Сейчас вы получите доступ к бесплатным материалам...
-            """
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=success_text,
-                parse_mode='Markdown'
-            )
-            
-            # Отправляем бесплатные материалы ПОСЛЕ регистрации
-            logger.info(f"Отправка материалов с is_registered=True")
-            await self.send_free_materials(chat_id, context, user_name, is_registered=True)
-        
-        elif data == 'confirm_profile_edit':
-            # Подтверждение редактирования профиля
-            logger.info(f"Подтверждение редактирования профиля user_id={user_id}")
-            self.db.update_user_stage(user_id, 'registered')
-            
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь')
-            phone = user_data.get('phone', 'Не указан')
-            gender = user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            success_text = f"""
+        """
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=success_text,
+            parse_mode='Markdown'
+        )
+        
+        # Отправляем бесплатные материалы ПОСЛЕ регистрации
+        logger.info(f"Отправка материалов с is_registered=True")
+        await self.send_free_materials(chat_id, context, user_name, is_registered=True)
+    
+    async def callback_confirm_profile_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подтверждение редактирования профиля"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        logger.info(f"Подтверждение редактирования профиля user_id={user_id}")
+        user_data = await self.db.update_user_fields(user_id, stage='registered')
+        user_name = user_data.get('name', 'пользователь')
+        phone = user_data.get('phone', 'Не указан')
+        gender = user_data.get('gender', 'не указан')
+        gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+        
+        success_text = f"""
 ✅ **{user_name}, профиль успешно обновлен!**
 
 Ваши обновленные данные:
@@ -1406,106 +1102,126 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 📱 Телефон: {phone}
 
 Изменения сохранены!
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
-                [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=success_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
-            logger.info(f"✅ Профиль обновлен для user_id={user_id}")
+        """
+        
+        keyboard = [
+            [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data == 'edit_registration':
-            # Выбор что редактировать
-            edit_text = """
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=success_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+        logger.info(f"✅ Профиль обновлен для user_id={user_id}")
+    
+    async def callback_edit_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выбор что редактировать"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        edit_text = """
 ✏️ **Что вы хотите изменить?**
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("👥 Изменить пол", callback_data="edit_gender")],
-                [InlineKeyboardButton("👤 Изменить имя", callback_data="edit_name")],
-                [InlineKeyboardButton("📱 Изменить телефон", callback_data="edit_phone")],
-                [InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirmation")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=edit_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        """
         
-        elif data == 'edit_name':
-            # Запрос нового имени
-            self.db.update_user_stage(user_id, 'edit_name')
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="👤 **Введите ваше новое имя:**"
-            )
+        keyboard = [
+            [InlineKeyboardButton("👥 Изменить пол", callback_data="edit_gender")],
+            [InlineKeyboardButton("👤 Изменить имя", callback_data="edit_name")],
+            [InlineKeyboardButton("📱 Изменить телефон", callback_data="edit_phone")],
+            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirmation")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data == 'edit_phone':
-            # Запрос нового телефона
-            self.db.update_user_stage(user_id, 'edit_phone')
-            
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="📱 **Введите ваш новый номер телефона:**"
-            )
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=edit_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_edit_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запрос нового имени"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
         
-        elif data == 'start_registration':
-            # Начать регистрацию
-            self.db.update_user_stage(user_id, 'gender_selection')
-            
-            welcome_text = f"""
+        await self.db.update_user_stage(user_id, 'edit_name')
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="👤 **Введите ваше новое имя:**"
+        )
+    
+    async def callback_edit_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запрос нового телефона"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.db.update_user_stage(user_id, 'edit_phone')
+        
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="📱 **Введите ваш новый номер телефона:**"
+        )
+    
+    async def callback_start_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Начать регистрацию"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        await self.db.update_user_stage(user_id, 'gender_selection')
+        
+        welcome_text = f"""
 🌟 **Давайте познакомимся!**
 
 Для доступа ко всем функциям бота нужно пройти быструю регистрацию (1 минута).
 
 Какого вы пола?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("👨 Мужчина", callback_data="gender_male"),
-                    InlineKeyboardButton("👩 Женщина", callback_data="gender_female")
-                ]
+        """
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("👨 Мужчина", callback_data="gender_male"),
+                InlineKeyboardButton("👩 Женщина", callback_data="gender_female")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=welcome_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif data == 'back_to_confirmation':
-            # Возврат к экрану подтверждения
-            user_data = self.db.get_user(user_id)
-            user_name = user_data.get('name', 'пользователь')
-            phone = user_data.get('phone', 'Не указан')
-            gender = user_data.get('gender', 'не указан')
-            gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
-            
-            confirmation_text = f"""
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=welcome_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
+    
+    async def callback_back_to_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Возврат к экрану подтверждения"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        chat_id = query.message.chat_id
+        
+        user_data = await self.db.get_user(user_id)
+        user_name = user_data.get('name', 'пользователь')
+        phone = user_data.get('phone', 'Не указан')
+        gender = user_data.get('gender', 'не указан')
+        gender_text = 'Мужчина' if gender == 'male' else 'Женщина' if gender == 'female' else 'Не указан'
+        
+        confirmation_text = f"""
 ✅ **Благодарим за регистрацию!**
 
 Пожалуйста, подтвердите введенные данные:
@@ -1515,27 +1231,27 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 📱 Телефон: {phone}
 
 Всё верно?
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅ Всё верно", callback_data="confirm_registration"),
-                    InlineKeyboardButton("✏️ Изменить", callback_data="edit_registration")
-                ]
+        """
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Всё верно", callback_data="confirm_registration"),
+                InlineKeyboardButton("✏️ Изменить", callback_data="edit_registration")
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            self.db.update_user_stage(user_id, 'phone_confirmation')
-            
-            await self.send_or_edit_message(
-                context=context,
-                chat_id=chat_id,
-                user_id=user_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown',
-                query=query
-            )
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await self.db.update_user_stage(user_id, 'phone_confirmation')
+        
+        await self.send_or_edit_message(
+            context=context,
+            chat_id=chat_id,
+            user_id=user_id,
+            text=confirmation_text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown',
+            query=query
+        )
     
     async def ask_for_name(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         """Запрос имени пользователя"""
@@ -1556,52 +1272,13 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             is_registered: Зарегистрирован ли пользователь
             source: Источник запроса - 'registration' (после регистрации) или 'menu' (из главного меню)
         """
-        # Разные тексты в зависимости от источника
-        if source == 'registration':
-            # Сообщение после регистрации
-            materials_text = f"""
-🎉 **{user_name}, поздравляем с завершением регистрации!**
-
-{FREE_MATERIALS['welcome_message']}
-
-🎁 Ниже вы найдете бесплатные материалы, которые помогут вам начать:
-
-Нажмите на кнопки ниже, чтобы открыть материалы:
-            """
-        else:
-            # Сообщение из главного меню
-            materials_text = f"""
-📚 **Бесплатные материалы**
-
-{FREE_MATERIALS['welcome_message']}
-
-Выберите материал, который вас интересует:
-            """
-        
-        # Создаем кнопки со ссылками на материалы
-        keyboard = []
-        for material in FREE_MATERIALS['materials']:
-            keyboard.append([InlineKeyboardButton(
-                material['title'],
-                url=material['url']
-            )])
-        
-        # Добавляем кнопку с анонимным опросом
-        keyboard.append([InlineKeyboardButton(
-            "📝 Анонимный опрос",
-            url=ANONYMOUS_QUESTION_LINK
-        )])
-        
-        # Если пользователь уже зарегистрирован, добавляем кнопку "Главное меню"
-        if is_registered:
-            keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Тексты и клавиатуры собраны заранее, подставляется только имя
+        screen = self.screens.materials(source, is_registered)
         
         await context.bot.send_message(
             chat_id=chat_id,
-            text=materials_text,
-            reply_markup=reply_markup,
+            text=screen.render(user_name=user_name),
+            reply_markup=screen.reply_markup,
             parse_mode='Markdown'
         )
         
@@ -1616,13 +1293,13 @@ A: "👤 Мой профиль" → "Редактировать профиль".
     
     async def send_products_menu(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, user_name: str):
         """Отправка меню продуктов"""
-        products = self.db.get_products()
+        products = await self.db.get_products()
         
         if not products:
             # Добавляем базовые продукты
-            self.db.add_product("Базовый курс", 5000, "Полный курс по основам метода")
-            self.db.add_product("Продвинутый курс", 10000, "Углубленное изучение продвинутых техник")
-            products = self.db.get_products()
+            await self.db.add_product("Базовый курс", to_kopecks(5000), "Полный курс по основам метода")
+            await self.db.add_product("Продвинутый курс", to_kopecks(10000), "Углубленное изучение продвинутых техник")
+            products = await self.db.get_products()
         
         products_text = f"""
 {user_name}, отлично! Теперь давайте посмотрим на наши платные продукты:
@@ -1633,12 +1310,12 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         for product in products:
             products_text += f"""
 💎 {product['name']}
-💰 Цена: {product['price']} руб.
+💰 Цена: {format_money(product['price'])}
 📝 {product['description']}
 
 """
             keyboard.append([InlineKeyboardButton(
-                f"Купить {product['name']} - {product['price']} руб.",
+                f"Купить {product['name']} - {format_money(product['price'])}",
                 callback_data=f"product_{product['id']}"
             )])
         
@@ -1663,81 +1340,41 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             parse_mode='Markdown'
         )
     
-    async def show_product_details(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, product_id: str, user_id: int, query=None):
+    async def show_product_details(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, product_id: int, user_id: int, query=None):
         """Показать описание продукта"""
-        products = self.db.get_products()
-        selected_product = None
-        
-        for product in products:
-            if str(product['id']) == product_id:
-                selected_product = product
-                break
+        # Карточка продукта строится один раз на версию каталога
+        catalog_version = await self.db.get_catalog_version()
+        screen = self.screens.product(product_id, catalog_version)
         
-        if not selected_product:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Продукт не найден."
-            )
-            return
+        if screen is None:
+            selected_product = await self.db.get_product(product_id)
+            
+            if not selected_product:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="❌ Продукт не найден."
+                )
+                return
+            
+            screen = self.screens.build_product(selected_product, catalog_version)
         
         # Проверяем, есть ли продукт в корзине и избранном
-        in_cart = self.db.is_in_cart(user_id, int(product_id))
-        in_favorites = self.db.is_in_favorites(user_id, int(product_id))
-        
-        # Формируем описание продукта
-        product_details = f"""
-📦 **{selected_product['name']}**
-
-💰 **Цена:** {selected_product['price']} руб.
-
-📝 **Описание:**
-{selected_product.get('description', 'Описание отсутствует')}
-
-Выберите действие:
-        """
-        
-        keyboard = []
-        
-        # Кнопка корзины
-        if in_cart:
-            keyboard.append([InlineKeyboardButton("🛒 Удалить из корзины", callback_data=f"remove_cart_{product_id}")])
-        else:
-            keyboard.append([InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"add_cart_{product_id}")])
-        
-        # Кнопка избранного
-        if in_favorites:
-            keyboard.append([InlineKeyboardButton("❤️ Удалить из избранного", callback_data=f"remove_fav_{product_id}")])
-        else:
-            keyboard.append([InlineKeyboardButton("🤍 Добавить в избранное", callback_data=f"add_fav_{product_id}")])
-        
-        # Кнопка покупки
-        keyboard.append([InlineKeyboardButton("💳 Купить", callback_data=f"buy_product_{product_id}")])
-        
-        # Навигация
-        keyboard.append([InlineKeyboardButton("◀️ Назад в каталог", callback_data="main_shop")])
-        keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        in_cart = await self.db.is_in_cart(user_id, product_id)
+        in_favorites = await self.db.is_in_favorites(user_id, product_id)
         
         await self.send_or_edit_message(
             context=context,
             chat_id=chat_id,
             user_id=user_id,
-            text=product_details,
-            reply_markup=reply_markup,
+            text=screen.text,
+            reply_markup=screen.reply_markup(in_cart, in_favorites),
             parse_mode='Markdown',
             query=query
         )
     
-    async def handle_product_purchase(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, product_id: str, user_id: int):
+    async def handle_product_purchase(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, product_id: int, user_id: int):
         """Обработка покупки продукта - переход к оплате"""
-        products = self.db.get_products()
-        selected_product = None
-        
-        for product in products:
-            if str(product['id']) == product_id:
-                selected_product = product
-                break
+        selected_product = await self.db.get_product(product_id)
         
         if not selected_product:
             await context.bot.send_message(
@@ -1760,14 +1397,14 @@ A: "👤 Мой профиль" → "Редактировать профиль".
                     self.message = FakeMessage(chat_id)
             
             fake_update = FakeUpdate(chat_id)
-            await self.payment_handler.send_invoice(fake_update, context, int(product_id))
+            await self.payment_handler.send_invoice(fake_update, context, product_id)
         else:
             # Если платежей нет - показываем информацию для связи с админом
             payment_text = f"""
 💳 **Оформление заказа**
 
 📦 Продукт: {selected_product['name']}
-💰 Цена: {selected_product['price']} руб.
+💰 Цена: {format_money(selected_product['price'])}
 
 Для завершения покупки свяжитесь с администратором:
 📧 Email: admin@example.com
@@ -1794,50 +1431,30 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         chat_id = update.effective_chat.id
         user_id = update.effective_user.id
         
-        # Получаем продукты из базы
-        products = self.db.get_products()
-        
-        if not products:
-            # Добавляем базовые продукты, если их нет
-            self.db.add_product("Базовый курс", 5000, "Полный курс по основам метода работы с кризисными ситуациями")
-            self.db.add_product("Продвинутый курс", 10000, "Углубленное изучение продвинутых техник психологической помощи")
-            self.db.add_product("Индивидуальная консультация", 3000, "Персональная консультация 60 минут")
-            products = self.db.get_products()
-        
-        # Формируем текст каталога
-        catalog_text = """
-💎 **Каталог продуктов и услуг**
-
-Выберите продукт для покупки:
-
-"""
-        
-        keyboard = []
-        for product in products:
-            catalog_text += f"""
-📦 **{product['name']}**
-💰 {product['price']} руб.
-📝 {product['description']}
-
-"""
-            # Добавляем кнопку для каждого продукта
-            keyboard.append([InlineKeyboardButton(
-                f"💳 {product['name']} - {product['price']} руб.",
-                callback_data=f"product_{product['id']}"
-            )])
-        
-        # Добавляем дополнительные кнопки
-        keyboard.append([InlineKeyboardButton("🌐 Веб-сайт", url="https://telegram-bot-kate.vercel.app")])
-        keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
+        # Экран каталога перестраивается только при смене версии каталога
+        catalog_version = await self.db.get_catalog_version()
+        screen = self.screens.catalog(catalog_version)
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        if screen is None:
+            # Получаем продукты из базы
+            products = await self.db.get_products()
+            
+            if not products:
+                # Добавляем базовые продукты, если их нет
+                await self.db.add_product("Базовый курс", to_kopecks(5000), "Полный курс по основам метода работы с кризисными ситуациями")
+                await self.db.add_product("Продвинутый курс", to_kopecks(10000), "Углубленное изучение продвинутых техник психологической помощи")
+                await self.db.add_product("Индивидуальная консультация", to_kopecks(3000), "Персональная консультация 60 минут")
+                products = await self.db.get_products()
+                catalog_version = await self.db.get_catalog_version()
+            
+            screen = self.screens.build_catalog(products, catalog_version)
         
         await self.send_or_edit_message(
             context=context,
             chat_id=chat_id,
             user_id=user_id,
-            text=catalog_text,
-            reply_markup=reply_markup,
+            text=screen.text,
+            reply_markup=screen.reply_markup,
             parse_mode='Markdown',
             query=query
         )
@@ -1847,7 +1464,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
         
-        cart_items = self.db.get_cart(user_id)
+        cart_items = await self.db.get_cart(user_id)
         
         if not cart_items:
             cart_text = """
@@ -1866,10 +1483,10 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             for item in cart_items:
                 cart_text += f"""
 📦 **{item['name']}**
-💰 {item['price']} руб. × {item['quantity']} = {item['price'] * item['quantity']} руб.
+💰 {format_money(item['price'])} × {item['quantity']} = {format_money(item['price'] * item['quantity'])}
 """
             
-            cart_text += f"\n💵 **Итого:** {total} руб."
+            cart_text += f"\n💵 **Итого:** {format_money(total)}"
             
             keyboard = [
                 [InlineKeyboardButton("💳 Оформить заказ", callback_data="create_order_from_cart")],
@@ -1889,8 +1506,8 @@ A: "👤 Мой профиль" → "Редактировать профиль".
     
     async def show_orders_menu(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, user_id: int, query=None):
         """Показать меню заказов"""
-        orders = self.db.get_user_orders(user_id)
-        cart_items = self.db.get_cart(user_id)
+        orders = await self.db.get_user_orders(user_id)
+        cart_items = await self.db.get_cart(user_id)
         
         if not orders and not cart_items:
             orders_text = """
@@ -1912,13 +1529,13 @@ A: "👤 Мой профиль" → "Редактировать профиль".
                 orders_text += "📦 **Прошлые заказы:**\n\n"
                 for order in orders[:10]:  # Показываем последние 10 заказов
                     status_emoji = "✅" if order['status'] == 'paid' else "⏳" if order['status'] == 'pending' else "❌"
-                    orders_text += f"{status_emoji} Заказ #{order['id']} - {order['total_amount']} руб. ({order['status']})\n"
+                    orders_text += f"{status_emoji} Заказ #{order['id']} - {format_money(order['total_amount'])} ({order['status']})\n"
                     orders_text += f"   📅 {order['order_date']}\n\n"
             
             # Если есть товары в корзине, предлагаем оформить заказ
             if cart_items:
                 total = sum(item['price'] * item['quantity'] for item in cart_items)
-                orders_text += f"\n🛒 **В корзине:** {len(cart_items)} товар(ов) на сумму {total} руб.\n"
+                orders_text += f"\n🛒 **В корзине:** {len(cart_items)} товар(ов) на сумму {format_money(total)}\n"
             
             keyboard = []
             
@@ -1926,7 +1543,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             if orders:
                 for order in orders[:5]:  # Показываем кнопки для первых 5 заказов
                     keyboard.append([InlineKeyboardButton(
-                        f"📦 Заказ #{order['id']} - {order['total_amount']} руб.",
+                        f"📦 Заказ #{order['id']} - {format_money(order['total_amount'])}",
                         callback_data=f"order_details_{order['id']}"
                     )])
             
@@ -1950,7 +1567,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
     
     async def show_order_details(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, user_id: int, order_id: int, query=None):
         """Показать детали заказа"""
-        order = self.db.get_order(order_id)
+        order = await self.db.get_order(order_id)
         
         if not order or order['user_id'] != user_id:
             await context.bot.send_message(
@@ -1959,16 +1576,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             )
             return
         
-        # Парсим данные заказа
-        order_items = []
-        if order.get('data'):
-            try:
-                if isinstance(order['data'], str):
-                    order_items = json.loads(order['data'])
-                else:
-                    order_items = order['data']
-            except:
-                order_items = []
+        order_items = await self.db.get_order_items(order_id)
         
         status_text = {
             'pending': '⏳ Ожидает оплаты',
@@ -1980,7 +1588,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 📦 **Заказ #{order_id}**
 
 📅 Дата: {order['order_date']}
-💰 Сумма: {order['total_amount']} руб.
+💰 Сумма: {format_money(order['total_amount'])}
 📊 Статус: {status_text}
 
 📋 **Состав заказа:**
@@ -1988,11 +1596,8 @@ A: "👤 Мой профиль" → "Редактировать профиль".
         
         if order_items:
             for item in order_items:
-                if isinstance(item, dict):
-                    product_name = item.get('name', 'Неизвестный товар')
-                    quantity = item.get('quantity', 1)
-                    price = item.get('price', 0)
-                    order_details += f"• {product_name} × {quantity} = {price * quantity} руб.\n"
+                product_name = item['name'] or 'Неизвестный товар'
+                order_details += f"• {product_name} × {item['quantity']} = {format_money(item['unit_price'] * item['quantity'])}\n"
         else:
             order_details += "• Детали недоступны\n"
         
@@ -2019,48 +1624,27 @@ A: "👤 Мой профиль" → "Редактировать профиль".
     
     async def create_order_from_cart(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, user_id: int, query=None):
         """Создание заказа из корзины"""
-        cart_items = self.db.get_cart(user_id)
+        # Снимок корзины, заказ и очистка корзины - одна транзакция
+        order = await self.db.checkout_cart(user_id)
         
-        if not cart_items:
+        if not order and not await self.db.get_cart(user_id):
             await query.answer("❌ Корзина пуста", show_alert=True) if query else None
             return
         
-        # Вычисляем общую сумму
-        total = sum(item['price'] * item['quantity'] for item in cart_items)
-        
-        # Формируем данные заказа
-        order_items = []
-        for item in cart_items:
-            order_items.append({
-                'product_id': item['product_id'],
-                'name': item['name'],
-                'price': item['price'],
-                'quantity': item['quantity']
-            })
-        
-        # Создаем заказ
-        order_data = {
-            'user_id': user_id,
-            'total_amount': total,
-            'status': 'pending',
-            'items': order_items
-        }
-        
-        order_id = self.db.add_order(order_data)
-        
-        if order_id:
-            # Очищаем корзину
-            self.db.clear_cart(user_id)
+        if order:
+            order_id = order['id']
+            total = order['total_amount']
+            order_items = order['data']['items']
             
             success_text = f"""
 ✅ **Заказ #{order_id} создан!**
 
-💰 Сумма заказа: {total} руб.
+💰 Сумма заказа: {format_money(total)}
 
 📋 Состав заказа:
 """
             for item in order_items:
-                success_text += f"• {item['name']} × {item['quantity']} = {item['price'] * item['quantity']} руб.\n"
+                success_text += f"• {item['name']} × {item['quantity']} = {format_money(item['price'] * item['quantity'])}\n"
             
             success_text += "\n💳 Вы можете оплатить заказ сейчас или позже."
             
@@ -2088,7 +1672,7 @@ A: "👤 Мой профиль" → "Редактировать профиль".
     
     async def pay_order(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, user_id: int, order_id: int):
         """Оплата заказа"""
-        order = self.db.get_order(order_id)
+        order = await self.db.get_order(order_id)
         
         if not order or order['user_id'] != user_id:
             await context.bot.send_message(
@@ -2110,14 +1694,14 @@ A: "👤 Мой профиль" → "Редактировать профиль".
             # Пока просто обновляем статус (в реальности здесь будет вызов платежной системы)
             await context.bot.send_message(
                 chat_id=chat_id,
-                text=f"💳 Оплата заказа #{order_id} на сумму {order['total_amount']} руб.\n\nПлатежная система будет подключена позже."
+                text=f"💳 Оплата заказа #{order_id} на сумму {format_money(order['total_amount'])}\n\nПлатежная система будет подключена позже."
             )
         else:
             # Если платежей нет - показываем информацию для связи с админом
             payment_text = f"""
 💳 **Оплата заказа #{order_id}**
 
-💰 Сумма к оплате: {order['total_amount']} руб.
+💰 Сумма к оплате: {format_money(order['total_amount'])}
 
 Для оплаты свяжитесь с администратором:
 📧 Email: admin@example.com
@@ -2152,8 +1736,103 @@ A: "👤 Мой профиль" → "Редактировать профиль".
 class AdminHandlers:
     """Обработчики админ-команд"""
     
-    def __init__(self, database: Database):
+    def __init__(self, database: Storage, screens: ScreenCache = None):
         self.db = database
+        self.screens = screens or ScreenCache()
+        self.callbacks = None
+    
+    def register_callbacks(self, router: CallbackRouter):
+        """Регистрация обработчиков кнопок админ-панели"""
+        self.callbacks = router
+        router.add('admin_stats', self.callback_admin_stats)
+        router.add('admin_users', self.callback_admin_users)
+        router.add('admin_meeting', self.callback_admin_meeting)
+        router.add('admin_offer', self.callback_admin_offer)
+    
+    async def _check_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Проверка, что кнопку админ-панели нажал администратор"""
+        if update.callback_query.from_user.id == ADMIN_ID:
+            return True
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="❌ У вас нет доступа к админ-панели."
+        )
+        return False
+    
+    async def callback_admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Статистика магазина и реестр кнопок без обработчиков"""
+        if not await self._check_admin_callback(update, context):
+            return
+        
+        counters = await self.db.get_stats_counters()
+        orders_by_status = counters.get('orders', {})
+        revenue_by_status = counters.get('revenue', {})
+        paid_orders = sum(orders_by_status.get(status, 0) for status in PAID_ORDER_STATUSES)
+        paid_revenue = sum(revenue_by_status.get(status, 0) for status in PAID_ORDER_STATUSES)
+        
+        stats_text = f"""
+📊 Статистика
+
+👥 Пользователей: {counters.get('users', {}).get('', 0)}
+🆕 Новых за сегодня: {sum(counters.get('signups', {}).values())}
+💎 Активных продуктов: {counters.get('products_active', {}).get('', 0)}
+📦 Заказов: {sum(orders_by_status.values())} (оплачено: {paid_orders})
+💰 Выручка: {format_money(paid_revenue)}
+        """
+        
+        session_cache = getattr(self.db, 'session_cache', None)
+        if session_cache:
+            cache_stats = session_cache.stats()
+            stats_text += (
+                f"\n🧠 Кэш сессий: {cache_stats['size']}/{cache_stats['max_size']}, "
+                f"попаданий {cache_stats['hit_rate']:.0%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})\n"
+            )
+        
+        if self.callbacks:
+            unrouted = self.callbacks.report()['unrouted']
+            if unrouted:
+                stats_text += "\n⚠️ Кнопки без обработчика:\n" + "\n".join(
+                    f"{data}: {count}" for data, count in list(unrouted.items())[:10]
+                )
+        
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=stats_text)
+    
+    async def callback_admin_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Последние зарегистрировавшиеся пользователи"""
+        if not await self._check_admin_callback(update, context):
+            return
+        
+        total = await self.db.count_users()
+        users, _ = await self.db.list_users(limit=20)
+        
+        lines = [f"👥 Пользователи ({total}), последние {len(users)}:", ""]
+        for user in users:
+            name = user.get('name') or user.get('first_name') or user.get('username') or '—'
+            lines.append(f"{user['user_id']} - {name} ({user.get('stage')}, {user.get('registration_date')})")
+        
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="\n".join(lines))
+    
+    async def callback_admin_meeting(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подсказка по команде /meeting"""
+        if not await self._check_admin_callback(update, context):
+            return
+        
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="🎯 Приглашение на встречу отправляется командой:\n"
+                 "/meeting <название> | <описание> | <дата> | [ссылка]"
+        )
+    
+    async def callback_admin_offer(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Подсказка по команде /offer"""
+        if not await self._check_admin_callback(update, context):
+            return
+        
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="🔥 Специальное предложение отправляется командой:\n"
+                 "/offer <название> | <описание> | [скидка] | [действует до]"
+        )
     
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /admin"""
@@ -2166,25 +1845,10 @@ class AdminHandlers:
             )
             return
         
-        # Админ-панель
-        admin_text = """
-🔧 Админ-панель
-
-Выберите действие:
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-            [InlineKeyboardButton("👥 Список пользователей", callback_data="admin_users")],
-            [InlineKeyboardButton("🎯 Приглашение на встречу", callback_data="admin_meeting")],
-            [InlineKeyboardButton("🔥 Специальное предложение", callback_data="admin_offer")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=admin_text,
-            reply_markup=reply_markup
+            text=self.screens.admin_panel.text,
+            reply_markup=self.screens.admin_panel.reply_markup
         )
     
     async def meeting_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2303,13 +1967,12 @@ class AdminHandlers:
             """
             
             # Отправляем всем пользователям
-            users = self.db.get_all_users()
             sent_count = 0
             
-            for user in users:
+            async for recipient_id in self.db.iter_user_ids('all'):
                 try:
                     await context.bot.send_message(
-                        chat_id=user['user_id'],
+                        chat_id=recipient_id,
                         text=invitation_text
                     )
                     sent_count += 1
@@ -2345,13 +2008,12 @@ class AdminHandlers:
             """
             
             # Отправляем всем пользователям
-            users = self.db.get_all_users()
             sent_count = 0
             
-            for user in users:
+            async for recipient_id in self.db.iter_user_ids('all'):
                 try:
                     await context.bot.send_message(
-                        chat_id=user['user_id'],
+                        chat_id=recipient_id,
                         text=offer_text
                     )
                     sent_count += 1
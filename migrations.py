@@ -0,0 +1,486 @@
+"""
+Версионированные миграции схемы базы данных
+
+Текущая версия схемы хранится в таблице schema_version. Каждая миграция -
+пронумерованный шаг, который применяется ровно один раз. Если база уже
+на последней версии, migrate() ограничивается одним SELECT и не выполняет
+никакого DDL.
+
+Чтобы изменить схему, добавьте новую функцию-шаг и запись в MIGRATIONS
+со следующим номером версии. Уже выпущенные шаги не редактируются.
+"""
+
+import json
+import sqlite3
+from typing import Callable, List, Tuple
+
+
+def _create_base_schema(cursor: sqlite3.Cursor):
+    """Базовые таблицы бота"""
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            gender TEXT,
+            name TEXT,
+            phone TEXT,
+            email TEXT,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            stage TEXT DEFAULT 'start',
+            last_message_id INTEGER,
+            data JSON
+        )
+    ''')
+    
+    # Таблица платных продуктов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            description TEXT,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    
+    # Таблица заказов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            total_amount REAL,
+            status TEXT DEFAULT 'pending',
+            order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data TEXT
+        )
+    ''')
+    
+    # Таблица уведомлений
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            target_audience TEXT DEFAULT 'all',
+            scheduled_date TIMESTAMP,
+            sent_date TIMESTAMP,
+            is_sent BOOLEAN DEFAULT 0
+        )
+    ''')
+    
+    # Таблица корзины
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cart (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, product_id)
+        )
+    ''')
+    
+    # Таблица избранного
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, product_id)
+        )
+    ''')
+
+
+def _add_last_message_id(cursor: sqlite3.Cursor):
+    """Поле users.last_message_id для баз, созданных до его появления"""
+    if 'last_message_id' not in _table_columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN last_message_id INTEGER')
+
+
+def _create_hot_indexes(cursor: sqlite3.Cursor):
+    """Вторичные индексы под горячие запросы (см. database.HOT_QUERIES)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_date ON orders (user_id, order_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_stage_registration ON users (stage, registration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registration ON users (registration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_pending ON notifications (is_sent, scheduled_date)')
+
+
+def _create_catalog_version(cursor: sqlite3.Cursor):
+    """Версия каталога продуктов: растет при любом изменении таблицы products"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)')
+    
+    # Триггеры ловят и изменения в обход Database (например, из админ-API)
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_{event.lower()}_version
+            AFTER {event} ON products
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _create_order_items(cursor: sqlite3.Cursor):
+    """Нормализованные позиции заказов с переносом из JSON orders.data"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER,
+            name TEXT,
+            unit_price REAL NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
+    # Покрывающий индекс под GROUP BY product_id в статистике продаж
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_order_items_product '
+        'ON order_items (product_id, quantity, unit_price)'
+    )
+    
+    # Перенос позиций существующих заказов
+    cursor.execute('''
+        SELECT o.id, o.total_amount, o.data
+        FROM orders o
+        WHERE o.data IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = o.id)
+    ''')
+    items = []
+    for order_id, total_amount, raw in cursor.fetchall():
+        try:
+            order_data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(order_data, dict):
+            continue
+        
+        if isinstance(order_data.get('items'), list):
+            # Заказ из корзины: список позиций
+            for item in order_data['items']:
+                if isinstance(item, dict):
+                    items.append((
+                        order_id, item.get('product_id'), item.get('name'),
+                        item.get('price') or 0, item.get('quantity') or 1
+                    ))
+        elif order_data.get('product_id'):
+            # Оплата одного продукта (create_order): сумма заказа = цена
+            items.append((order_id, order_data['product_id'], None, total_amount or 0, 1))
+    
+    cursor.executemany('''
+        INSERT INTO order_items (order_id, product_id, name, unit_price, quantity)
+        VALUES (?, ?, ?, ?, ?)
+    ''', items)
+    
+    # Названия для позиций, где их не было в JSON
+    cursor.execute('''
+        UPDATE order_items
+        SET name = (SELECT p.name FROM products p WHERE p.id = order_items.product_id)
+        WHERE name IS NULL
+    ''')
+
+
+def _convert_money_column(cursor: sqlite3.Cursor, table: str, column: str):
+    """REAL-колонка в рублях -> INTEGER-колонка в копейках (то же имя)"""
+    if column not in _table_columns(cursor, table):
+        return
+    legacy = f'{column}_rub'
+    cursor.execute(f'ALTER TABLE {table} RENAME COLUMN {column} TO {legacy}')
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+    cursor.execute(f'UPDATE {table} SET {column} = CAST(ROUND(COALESCE({legacy}, 0) * 100) AS INTEGER)')
+    cursor.execute(f'ALTER TABLE {table} DROP COLUMN {legacy}')
+
+
+def _money_to_kopecks(cursor: sqlite3.Cursor):
+    """Денежные суммы в целых копейках вместо REAL-рублей (см. money.py)"""
+    # Индекс с unit_price мешает удалить старую колонку - пересоздаем
+    cursor.execute('DROP INDEX IF EXISTS idx_order_items_product')
+    _convert_money_column(cursor, 'products', 'price')
+    _convert_money_column(cursor, 'orders', 'total_amount')
+    _convert_money_column(cursor, 'order_items', 'unit_price')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_order_items_product '
+        'ON order_items (product_id, quantity, unit_price)'
+    )
+    
+    # Суммы в JSON-деталях заказов
+    cursor.execute('SELECT id, data FROM orders WHERE data IS NOT NULL')
+    updates = []
+    for order_id, raw in cursor.fetchall():
+        try:
+            order_data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(order_data, dict):
+            continue
+        if isinstance(order_data.get('total_amount'), (int, float)):
+            order_data['total_amount'] = round(order_data['total_amount'] * 100)
+        for item in order_data.get('items') or []:
+            if isinstance(item, dict) and isinstance(item.get('price'), (int, float)):
+                item['price'] = round(item['price'] * 100)
+        updates.append((json.dumps(order_data), order_id))
+    cursor.executemany('UPDATE orders SET data = ? WHERE id = ?', updates)
+
+
+# Тело триггера: прибавить delta к счетчику (metric, key)
+_BUMP_COUNTER = '''
+    INSERT INTO stats_counters (metric, key, value) VALUES ({metric}, {key}, {delta})
+    ON CONFLICT (metric, key) DO UPDATE SET value = value + excluded.value;
+'''
+
+
+def _bump(metric: str, key: str = "''", delta: str = '1') -> str:
+    """SQL увеличения счетчика для тела триггера"""
+    return _BUMP_COUNTER.format(
+        metric=f"'{metric}'", key=f"COALESCE({key}, '')", delta=f"COALESCE({delta}, 0)"
+    )
+
+
+def _create_stats_counters(cursor: sqlite3.Cursor):
+    """
+    Счетчики для дашборда, поддерживаемые триггерами
+    
+    metric/key: users, signups/<дата>, products_active, orders/<статус>,
+    revenue/<статус> (копейки), order_items/{lines,units,orders},
+    product_units/<id>, product_revenue/<id>, product_orders/<id>.
+    Триггеры учитывают и изменения в обход Database.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL DEFAULT '',
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, key)
+        ) WITHOUT ROWID
+    ''')
+    
+    triggers = {
+        # Пользователи и регистрации по дням (UTC, как CURRENT_TIMESTAMP)
+        'trg_stats_users_insert': (
+            'AFTER INSERT ON users',
+            _bump('users') + _bump('signups', 'date(NEW.registration_date)')
+        ),
+        'trg_stats_users_delete': (
+            'AFTER DELETE ON users',
+            _bump('users', delta='-1') + _bump('signups', 'date(OLD.registration_date)', '-1')
+        ),
+        # Активные продукты
+        'trg_stats_products_insert': (
+            'AFTER INSERT ON products WHEN NEW.is_active',
+            _bump('products_active')
+        ),
+        'trg_stats_products_delete': (
+            'AFTER DELETE ON products WHEN OLD.is_active',
+            _bump('products_active', delta='-1')
+        ),
+        'trg_stats_products_update': (
+            'AFTER UPDATE OF is_active ON products WHEN NEW.is_active IS NOT OLD.is_active',
+            _bump('products_active', delta='CASE WHEN NEW.is_active THEN 1 ELSE -1 END')
+        ),
+        # Заказы и выручка по статусам
+        'trg_stats_orders_insert': (
+            'AFTER INSERT ON orders',
+            _bump('orders', 'NEW.status') + _bump('revenue', 'NEW.status', 'NEW.total_amount')
+        ),
+        'trg_stats_orders_delete': (
+            'AFTER DELETE ON orders',
+            _bump('orders', 'OLD.status', '-1') + _bump('revenue', 'OLD.status', '-OLD.total_amount')
+        ),
+        'trg_stats_orders_update': (
+            'AFTER UPDATE OF status, total_amount ON orders',
+            _bump('orders', 'OLD.status', '-1') + _bump('revenue', 'OLD.status', '-OLD.total_amount')
+            + _bump('orders', 'NEW.status') + _bump('revenue', 'NEW.status', 'NEW.total_amount')
+        ),
+        # Позиции заказов и продажи по продуктам (позиции не редактируются)
+        'trg_stats_order_items_insert': (
+            'AFTER INSERT ON order_items',
+            _bump('order_items', "'lines'") + _bump('order_items', "'units'", 'NEW.quantity')
+            + _bump('order_items', "'orders'",
+                    '(SELECT COUNT(*) = 1 FROM order_items WHERE order_id = NEW.order_id)')
+            + _bump('product_units', 'NEW.product_id', 'NEW.quantity')
+            + _bump('product_revenue', 'NEW.product_id', 'NEW.unit_price * NEW.quantity')
+            + _bump('product_orders', 'NEW.product_id',
+                    '(SELECT COUNT(*) = 1 FROM order_items WHERE order_id = NEW.order_id '
+                    'AND product_id IS NEW.product_id)')
+        ),
+        'trg_stats_order_items_delete': (
+            'AFTER DELETE ON order_items',
+            _bump('order_items', "'lines'", '-1') + _bump('order_items', "'units'", '-OLD.quantity')
+            + _bump('order_items', "'orders'",
+                    '-(NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = OLD.order_id))')
+            + _bump('product_units', 'OLD.product_id', '-OLD.quantity')
+            + _bump('product_revenue', 'OLD.product_id', '-OLD.unit_price * OLD.quantity')
+            + _bump('product_orders', 'OLD.product_id',
+                    '-(NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = OLD.order_id '
+                    'AND product_id IS OLD.product_id))')
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+    
+    # Начальные значения по уже накопленным данным
+    cursor.execute('DELETE FROM stats_counters')
+    for sql in (
+        "SELECT 'users', '', COUNT(*) FROM users",
+        "SELECT 'signups', COALESCE(date(registration_date), ''), COUNT(*) FROM users GROUP BY date(registration_date)",
+        "SELECT 'products_active', '', COUNT(*) FROM products WHERE is_active",
+        "SELECT 'orders', COALESCE(status, ''), COUNT(*) FROM orders GROUP BY status",
+        "SELECT 'revenue', COALESCE(status, ''), COALESCE(SUM(total_amount), 0) FROM orders GROUP BY status",
+        "SELECT 'order_items', 'lines', COUNT(*) FROM order_items",
+        "SELECT 'order_items', 'units', COALESCE(SUM(quantity), 0) FROM order_items",
+        "SELECT 'order_items', 'orders', COUNT(DISTINCT order_id) FROM order_items",
+        "SELECT 'product_units', COALESCE(product_id, ''), SUM(quantity) FROM order_items GROUP BY product_id",
+        "SELECT 'product_revenue', COALESCE(product_id, ''), SUM(unit_price * quantity) FROM order_items GROUP BY product_id",
+        "SELECT 'product_orders', COALESCE(product_id, ''), COUNT(DISTINCT order_id) FROM order_items GROUP BY product_id",
+    ):
+        cursor.execute(f'INSERT INTO stats_counters (metric, key, value) {sql}')
+
+
+def _create_daily_rollups(cursor: sqlite3.Cursor):
+    """Дневные агрегаты для графиков аналитики (см. database.DailyStatsRollup)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            day TEXT PRIMARY KEY,
+            registrations INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_order_stats (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            completed_orders INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    
+    # Последний закрытый (окончательно посчитанный) день
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            closed_through TEXT
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO daily_stats_state (id, closed_through) VALUES (1, NULL)')
+    
+    # Закрытые дни, которые изменились задним числом и ждут пересчета
+    cursor.execute('CREATE TABLE IF NOT EXISTS rollup_dirty_days (day TEXT PRIMARY KEY) WITHOUT ROWID')
+    
+    # Диапазонные выборки заказов по дате для пересчета дня
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (order_date)')
+    
+    mark = 'INSERT OR IGNORE INTO rollup_dirty_days (day) VALUES ({day});'
+    past = "WHEN date({column}) < date('now')"
+    triggers = {
+        'trg_rollup_users_insert': (
+            'AFTER INSERT ON users ' + past.format(column='NEW.registration_date'),
+            mark.format(day='date(NEW.registration_date)')
+        ),
+        'trg_rollup_users_delete': (
+            'AFTER DELETE ON users',
+            mark.format(day='date(OLD.registration_date)')
+        ),
+        'trg_rollup_orders_insert': (
+            'AFTER INSERT ON orders ' + past.format(column='NEW.order_date'),
+            mark.format(day='date(NEW.order_date)')
+        ),
+        'trg_rollup_orders_update': (
+            'AFTER UPDATE OF status, total_amount, order_date ON orders',
+            mark.format(day='date(OLD.order_date)') + mark.format(day='date(NEW.order_date)')
+        ),
+        'trg_rollup_orders_delete': (
+            'AFTER DELETE ON orders',
+            mark.format(day='date(OLD.order_date)')
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+def _create_listing_indexes(cursor: sqlite3.Cursor):
+    """Индексы под фильтры и сортировки списков админки (database.list_*)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders (status, order_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_stage_activity ON users (stage, last_activity)')
+
+
+# (версия, описание, шаг) - строго по возрастанию версии
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, 'Базовая схема', _create_base_schema),
+    (2, 'Поле users.last_message_id', _add_last_message_id),
+    (3, 'Индексы горячих запросов', _create_hot_indexes),
+    (4, 'Версия каталога продуктов', _create_catalog_version),
+    (5, 'Таблица позиций заказов order_items', _create_order_items),
+    (6, 'Денежные суммы в копейках', _money_to_kopecks),
+    (7, 'Счетчики дашборда stats_counters', _create_stats_counters),
+    (8, 'Дневные агрегаты аналитики', _create_daily_rollups),
+    (9, 'Индексы списков админки', _create_listing_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _table_columns(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    """Список колонок таблицы"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cursor.fetchall()]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0 - миграции еще не применялись)"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0  # Таблицы schema_version еще нет
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Применение недостающих миграций
+    
+    Все шаги выполняются в одной транзакции BEGIN IMMEDIATE, поэтому
+    процессы бота и API, стартующие одновременно, не применят одну
+    миграцию дважды. Коммит - на стороне вызывающего (ConnectionPool.writer).
+    
+    Returns:
+        Версия схемы после миграции
+    """
+    # Быстрый путь: схема актуальна, DDL не нужен
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return LATEST_VERSION
+    
+    conn.execute('BEGIN IMMEDIATE')
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Повторная проверка под блокировкой записи
+    current = get_schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(cursor)
+        cursor.execute(
+            'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+            (version, description)
+        )
+        print(f"Применена миграция {version}: {description}")
+    
+    return max(current, LATEST_VERSION)
@@ -0,0 +1,33 @@
+"""
+Денежные суммы
+
+Все суммы (products.price, orders.total_amount, order_items.unit_price)
+хранятся и считаются в целых копейках - так же, как их принимает Telegram
+Payments. В рубли они переводятся только на границах: при выводе
+пользователю (format_money) и в JSON API для веб-админки.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Union
+
+
+def to_kopecks(rubles: Union[int, float, str, Decimal]) -> int:
+    """Рубли -> целые копейки (с округлением до копейки)"""
+    amount = Decimal(str(rubles)) * 100
+    return int(amount.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_kopecks(kopecks: int) -> Union[int, float]:
+    """Копейки -> рубли для API (целое число, если копеек нет)"""
+    rubles, rest = divmod(int(kopecks), 100)
+    return rubles if not rest else kopecks / 100
+
+
+def format_money(kopecks: int) -> str:
+    """Сумма в копейках для показа пользователю: "5000 руб.", "990.50 руб." """
+    kopecks = int(kopecks or 0)
+    sign = '-' if kopecks < 0 else ''
+    rubles, rest = divmod(abs(kopecks), 100)
+    if rest:
+        return f"{sign}{rubles}.{rest:02d} руб."
+    return f"{sign}{rubles} руб."
@@ -5,6 +5,7 @@
 import logging
 from telegram import Update, LabeledPrice, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from money import format_money
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +18,7 @@ class PaymentHandler:
         
         Args:
             payment_token: Токен провайдера платежей от @BotFather
-            database: Экземпляр базы данных
+            database: Хранилище (storage.Storage)
         """
         self.payment_token = payment_token
         self.db = database
@@ -39,13 +40,7 @@ class PaymentHandler:
         chat_id = update.effective_chat.id
         
         # Получаем информацию о продукте
-        products = self.db.get_products()
-        product = None
-        
-        for p in products:
-            if p['id'] == product_id:
-                product = p
-                break
+        product = await self.db.get_product(product_id)
         
         if not product:
             await context.bot.send_message(
@@ -61,9 +56,8 @@ class PaymentHandler:
         # Payload - данные, которые вернутся при успешной оплате
         payload = f"product_{product_id}"
         
-        # Цена в копейках (ЮКасса работает в копейках)
-        # Важно: amount должен быть целым числом (int)
-        prices = [LabeledPrice(label=product['name'], amount=int(product['price'] * 100))]
+        # Цена уже хранится в копейках (ЮКасса работает в копейках)
+        prices = [LabeledPrice(label=product['name'], amount=product['price'])]
         
         # Отправляем инвойс
         try:
@@ -137,13 +131,7 @@ class PaymentHandler:
         product_id = int(payload.split('_')[1])
         
         # Получаем информацию о продукте
-        products = self.db.get_products()
-        product = None
-        
-        for p in products:
-            if p['id'] == product_id:
-                product = p
-                break
+        product = await self.db.get_product(product_id)
         
         if not product:
             await context.bot.send_message(
@@ -154,10 +142,10 @@ class PaymentHandler:
         
         # Сохраняем заказ в базу данных
         try:
-            order_id = self.db.create_order(
+            order_id = await self.db.create_order(
                 user_id=user_id,
                 product_id=product_id,
-                amount=int(payment.total_amount // 100),  # Конвертируем из копеек в рубли
+                amount=payment.total_amount,  # В копейках, как и в базе
                 payment_id=payment.telegram_payment_charge_id
             )
             
@@ -170,7 +158,7 @@ class PaymentHandler:
 📦 **Детали заказа:**
 🆔 Номер заказа: #{order_id}
 💎 Продукт: {product['name']}
-💰 Сумма: {int(payment.total_amount // 100)} руб.
+💰 Сумма: {format_money(payment.total_amount)}
 
 📧 Мы отправили подробную информацию на email: {payment.order_info.email}
 
@@ -0,0 +1,243 @@
+"""
+Компактные типизированные записи строк базы данных
+
+Записи используют __slots__ (без __dict__ на каждый объект) и строятся
+напрямую из кортежа строки через row_factory курсора. JSON-поле data
+декодируется лениво - только при первом обращении.
+
+Для совместимости с кодом, работавшим со словарями, записи поддерживают
+record['field'], record.get('field'), 'field' in record и dict(record).
+"""
+
+import json
+from typing import Any, Dict, Tuple
+
+# Признак того, что поле data еще не декодировано
+_NOT_LOADED = object()
+
+
+def _decode_json(raw):
+    """Декодирование JSON-поля по правилам Database (ошибка -> {})"""
+    if not raw:
+        return raw
+    if not isinstance(raw, (str, bytes)):
+        return raw
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+
+
+class Record:
+    """Базовый класс записи с доступом в стиле словаря"""
+    
+    __slots__ = ()
+    
+    # Порядок полей совпадает с порядком колонок в COLUMNS
+    FIELDS: Tuple[str, ...] = ()
+    COLUMNS = ''
+    
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """row_factory для sqlite3: строка -> запись"""
+        return cls(*row)
+    
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+    
+    def keys(self) -> Tuple[str, ...]:
+        return self.FIELDS
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)
+        return f'{type(self).__name__}({fields})'
+
+
+class UserRecord(Record):
+    """Пользователь (таблица users)"""
+    
+    __slots__ = (
+        'user_id', 'username', 'first_name', 'last_name', 'gender', 'name',
+        'phone', 'email', 'registration_date', 'last_activity', 'stage',
+        'last_message_id', '_raw_data', '_data'
+    )
+    
+    FIELDS = (
+        'user_id', 'username', 'first_name', 'last_name', 'gender', 'name',
+        'phone', 'email', 'registration_date', 'last_activity', 'stage',
+        'last_message_id', 'data'
+    )
+    COLUMNS = ', '.join(FIELDS)
+    
+    def __init__(self, user_id, username=None, first_name=None, last_name=None,
+                 gender=None, name=None, phone=None, email=None,
+                 registration_date=None, last_activity=None, stage=None,
+                 last_message_id=None, data=None):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.gender = gender
+        self.name = name
+        self.phone = phone
+        self.email = email
+        self.registration_date = registration_date
+        self.last_activity = last_activity
+        self.stage = stage
+        self.last_message_id = last_message_id
+        self._raw_data = data
+        self._data = _NOT_LOADED
+    
+    @property
+    def data(self):
+        if self._data is _NOT_LOADED:
+            self._data = _decode_json(self._raw_data)
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+
+class OrderRecord(Record):
+    """Заказ (таблица orders), сумма в копейках"""
+    
+    __slots__ = ('id', 'user_id', 'total_amount', 'status', 'order_date', '_raw_data', '_data')
+    
+    FIELDS = ('id', 'user_id', 'total_amount', 'status', 'order_date', 'data')
+    COLUMNS = ', '.join(FIELDS)
+    
+    def __init__(self, id, user_id=None, total_amount=None, status=None, order_date=None, data=None):
+        self.id = id
+        self.user_id = user_id
+        self.total_amount = total_amount
+        self.status = status
+        self.order_date = order_date
+        self._raw_data = data
+        self._data = _NOT_LOADED
+    
+    @property
+    def data(self):
+        if self._data is _NOT_LOADED:
+            self._data = _decode_json(self._raw_data)
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+
+class OrderItemRecord(Record):
+    """Позиция заказа (таблица order_items), цена в копейках"""
+    
+    __slots__ = ('id', 'order_id', 'product_id', 'name', 'unit_price', 'quantity')
+    
+    FIELDS = __slots__
+    COLUMNS = ', '.join(FIELDS)
+    
+    def __init__(self, id, order_id, product_id=None, name=None, unit_price=0, quantity=1):
+        self.id = id
+        self.order_id = order_id
+        self.product_id = product_id
+        self.name = name
+        self.unit_price = unit_price
+        self.quantity = quantity
+
+
+class ProductRecord(Record):
+    """Продукт (таблица products), цена в копейках"""
+    
+    __slots__ = ('id', 'name', 'price', 'description', 'is_active')
+    
+    FIELDS = __slots__
+    COLUMNS = ', '.join(FIELDS)
+    
+    def __init__(self, id, name=None, price=None, description=None, is_active=1):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.description = description
+        self.is_active = is_active
+
+
+class CartItem(Record):
+    """Позиция корзины вместе с данными продукта"""
+    
+    __slots__ = ('id', 'user_id', 'product_id', 'quantity', 'added_date', 'name', 'price', 'description')
+    
+    FIELDS = __slots__
+    COLUMNS = 'c.id, c.user_id, c.product_id, c.quantity, c.added_date, p.name, p.price, p.description'
+    
+    def __init__(self, id, user_id, product_id, quantity=1, added_date=None,
+                 name=None, price=None, description=None):
+        self.id = id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.quantity = quantity
+        self.added_date = added_date
+        self.name = name
+        self.price = price
+        self.description = description
+
+
+class FavoriteItem(Record):
+    """Позиция избранного вместе с данными продукта"""
+    
+    __slots__ = ('id', 'user_id', 'product_id', 'added_date', 'name', 'price', 'description')
+    
+    FIELDS = __slots__
+    COLUMNS = 'f.id, f.user_id, f.product_id, f.added_date, p.name, p.price, p.description'
+    
+    def __init__(self, id, user_id, product_id, added_date=None,
+                 name=None, price=None, description=None):
+        self.id = id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.added_date = added_date
+        self.name = name
+        self.price = price
+        self.description = description
+
+
+class NotificationRecord(Record):
+    """Уведомление (таблица notifications)"""
+    
+    __slots__ = ('id', 'title', 'message', 'target_audience', 'scheduled_date', 'sent_date', 'is_sent')
+    
+    FIELDS = __slots__
+    COLUMNS = ', '.join(FIELDS)
+    
+    def __init__(self, id, title=None, message=None, target_audience='all',
+                 scheduled_date=None, sent_date=None, is_sent=0):
+        self.id = id
+        self.title = title
+        self.message = message
+        self.target_audience = target_audience
+        self.scheduled_date = scheduled_date
+        self.sent_date = sent_date
+        self.is_sent = is_sent
@@ -1,13 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Optional, Dict
-from datetime import datetime
-import json
+from datetime import datetime, timedelta, timezone
 import os
-from database import Database
-from config import ADMIN_ID, DATABASE_PATH
+from database import ANALYTICS_METRICS, USER_SORTS, ORDER_SORTS
+from storage import create_storage
+from money import from_kopecks, to_kopecks
+from config import ADMIN_ID, DATABASE_PATH, DATABASE_URL, DATABASE_POOL_SIZE
 
 # Инициализация FastAPI
 app = FastAPI(
@@ -30,10 +31,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Инициализация базы данных
-db = Database(DATABASE_PATH)
+# Хранилище - то же, что у бота. SQLite-база открывается в режиме
+# читателя: запросы дашборда не берут блокировок записи и не задерживают
+# оформление заказов в боте, а буфер и пересчет статистики ведет бот
+db = create_storage(
+    DATABASE_URL,
+    DATABASE_PATH,
+    pool_size=DATABASE_POOL_SIZE,
+    read_only=True
+)
+
+@app.on_event("shutdown")
+async def close_storage():
+    """Закрытие соединений с базой при остановке API"""
+    await db.close()
 
-# Модели данных
+# Модели данных (суммы в API - в рублях, в базе - в копейках)
 class ProductCreate(BaseModel):
     name: str
     price: int
@@ -51,10 +64,35 @@ class UserUpdate(BaseModel):
     phone: Optional[str] = None
 
 class NotificationCreate(BaseModel):
+    title: Optional[str] = None
     message: str
     target_audience: Optional[str] = "all"
     send_time: Optional[str] = None
 
+def with_rubles(record, *fields) -> dict:
+    """Запись -> словарь для ответа API с суммами fields в рублях"""
+    item = dict(record)
+    for field in fields:
+        if item.get(field) is not None:
+            item[field] = from_kopecks(item[field])
+    return item
+
+# Максимальный размер страницы списков
+MAX_PAGE_SIZE = 200
+
+def check_list_params(sort: str, allowed_sorts, order: str, from_date: Optional[str], to_date: Optional[str]):
+    """Проверка параметров сортировки и дат для списков (HTTP 400)"""
+    if sort not in allowed_sorts:
+        raise HTTPException(status_code=400, detail=f"Неверный ключ сортировки. Доступные: {sorted(allowed_sorts)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Неверный порядок сортировки. Доступные: asc, desc")
+    for value in (from_date, to_date):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+
 # Простая аутентификация
 security = HTTPBearer()
 
@@ -84,55 +122,126 @@ async def health():
 async def get_dashboard_stats(admin: bool = Depends(verify_admin)):
     """Получение основной статистики для дашборда"""
     try:
-        users = db.get_all_users()
-        orders = db.execute_query("SELECT * FROM orders")
-        products = db.get_products()
+        # Счетчики поддерживаются триггерами - чтение не зависит от объема данных
+        counters = await db.get_stats_counters()
+        orders_by_status = counters.get('orders', {})
+        revenue_by_status = counters.get('revenue', {})
+        order_items = counters.get('order_items', {})
+        product_units = counters.get('product_units', {})
+        product_revenue = counters.get('product_revenue', {})
+        product_orders = counters.get('product_orders', {})
         
         # Подсчет статистики
-        total_users = len(users)
-        total_orders = len(orders)
-        total_products = len(products)
+        total_users = counters.get('users', {}).get('', 0)
+        total_orders = sum(orders_by_status.values())
+        total_products = counters.get('products_active', {}).get('', 0)
         
         # Доходы
-        total_revenue = sum(order.get('total_amount', 0) for order in orders if order.get('status') == 'completed')
+        total_revenue = revenue_by_status.get('completed', 0)
         
-        # Новые пользователи за сегодня
-        today = datetime.now().strftime('%Y-%m-%d')
-        new_users_today = len([u for u in users if u.get('registration_date', '').startswith(today)])
+        # Новые пользователи за сегодня (UTC)
+        new_users_today = sum(counters.get('signups', {}).values())
         
         # Популярные продукты
-        product_sales = {}
-        for order in orders:
-            if order.get('data'):
-                try:
-                    order_data = json.loads(order['data'])
-                    items = order_data.get('items', [])
-                    for item in items:
-                        product_id = item.get('product_id')
-                        if product_id:
-                            product_sales[product_id] = product_sales.get(product_id, 0) + item.get('quantity', 1)
-                except:
-                    pass
+        product_stats = sorted(
+            (
+                {
+                    "product_id": int(product_id),
+                    "units_sold": units,
+                    "revenue": from_kopecks(product_revenue.get(product_id, 0)),
+                    "orders": product_orders.get(product_id, 0)
+                }
+                for product_id, units in product_units.items()
+                if product_id and units > 0
+            ),
+            key=lambda row: row["units_sold"],
+            reverse=True
+        )
+        product_sales = {row["product_id"]: row["units_sold"] for row in product_stats}
+        
+        orders_with_items = order_items.get('orders', 0)
         
         return {
             "total_users": total_users,
             "total_orders": total_orders,
             "total_products": total_products,
-            "total_revenue": total_revenue,
+            "total_revenue": from_kopecks(total_revenue),
             "new_users_today": new_users_today,
-            "product_sales": product_sales
+            "product_sales": product_sales,
+            "product_stats": product_stats,
+            "units_sold": order_items.get('units', 0),
+            "avg_basket_size": order_items.get('lines', 0) / orders_with_items if orders_with_items else 0,
+            "orders_by_status": orders_by_status,
+            "revenue_by_status": {status: from_kopecks(amount) for status, amount in revenue_by_status.items()}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения статистики: {str(e)}")
 
+@app.get("/api/analytics/timeseries")
+async def get_timeseries(
+    metric: str = "registrations",
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    period: str = "day",
+    admin: bool = Depends(verify_admin)
+):
+    """
+    Временной ряд метрики по дням или неделям (из дневных агрегатов)
+    
+    metric: registrations, active_users, orders, completed_orders, revenue;
+    from/to: YYYY-MM-DD (по умолчанию - последние 30 дней); period: day, week
+    """
+    if metric not in ANALYTICS_METRICS:
+        raise HTTPException(status_code=400, detail=f"Неизвестная метрика. Доступные: {list(ANALYTICS_METRICS)}")
+    if period not in ("day", "week"):
+        raise HTTPException(status_code=400, detail="Неверный период. Доступные: day, week")
+    
+    try:
+        date_to = datetime.strptime(to_date, "%Y-%m-%d") if to_date else datetime.now(timezone.utc).replace(tzinfo=None)
+        date_from = datetime.strptime(from_date, "%Y-%m-%d") if from_date else date_to - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="Начало периода позже его конца")
+    
+    try:
+        series = await db.get_timeseries(metric, date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d"), period)
+        if metric == "revenue":
+            series = [{"date": point["date"], "value": from_kopecks(point["value"])} for point in series]
+        return {"metric": metric, "period": period, "series": series}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка получения временного ряда: {str(e)}")
+
 # === УПРАВЛЕНИЕ ПОЛЬЗОВАТЕЛЯМИ ===
 
 @app.get("/api/users")
-async def get_users(admin: bool = Depends(verify_admin)):
-    """Получение списка всех пользователей"""
+async def get_users(
+    stage: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    sort: str = "registration_date",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    admin: bool = Depends(verify_admin)
+):
+    """
+    Страница списка пользователей (keyset-пагинация)
+    
+    Фильтры: stage, from/to (дата регистрации, YYYY-MM-DD); sort:
+    registration_date, last_activity, user_id; order: asc/desc. Следующая
+    страница - с параметром cursor=next_cursor из ответа.
+    """
+    check_list_params(sort, USER_SORTS, order, from_date, to_date)
     try:
-        users = db.get_all_users()
-        return {"users": users}
+        users, next_cursor = await db.list_users(
+            stage=stage, date_from=from_date, date_to=to_date,
+            sort=sort, descending=order == "desc", cursor=cursor, limit=limit
+        )
+        total = await db.count_users(stage=stage, date_from=from_date, date_to=to_date)
+        return {"users": users, "next_cursor": next_cursor, "total": total}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения пользователей: {str(e)}")
 
@@ -140,14 +249,14 @@ async def get_users(admin: bool = Depends(verify_admin)):
 async def get_user(user_id: int, admin: bool = Depends(verify_admin)):
     """Получение информации о пользователе"""
     try:
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
         # Получаем заказы пользователя
-        orders = db.get_user_orders(user_id)
+        orders = await db.get_user_orders(user_id)
         
-        return {"user": user, "orders": orders}
+        return {"user": user, "orders": [with_rubles(order, 'total_amount') for order in orders]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения пользователя: {str(e)}")
 
@@ -155,7 +264,7 @@ async def get_user(user_id: int, admin: bool = Depends(verify_admin)):
 async def update_user(user_id: int, user_data: UserUpdate, admin: bool = Depends(verify_admin)):
     """Обновление информации о пользователе"""
     try:
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
@@ -171,7 +280,7 @@ async def update_user(user_id: int, user_data: UserUpdate, admin: bool = Depends
             update_fields['phone'] = user_data.phone
         
         if update_fields:
-            db.update_user(user_id, **update_fields)
+            await db.update_user_fields(user_id, **update_fields)
         
         return {"message": "Пользователь обновлен", "user_id": user_id}
     except Exception as e:
@@ -183,8 +292,8 @@ async def update_user(user_id: int, user_data: UserUpdate, admin: bool = Depends
 async def get_products():
     """Получение списка всех продуктов (публичный доступ)"""
     try:
-        products = db.get_products()
-        return {"products": products}
+        products = await db.get_products()
+        return {"products": [with_rubles(product, 'price') for product in products]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения продуктов: {str(e)}")
 
@@ -192,8 +301,8 @@ async def get_products():
 async def get_admin_products(admin: bool = Depends(verify_admin)):
     """Получение списка всех продуктов (только для админа)"""
     try:
-        products = db.get_products()
-        return {"products": products}
+        products = await db.get_products()
+        return {"products": [with_rubles(product, 'price') for product in products]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения продуктов: {str(e)}")
 
@@ -201,7 +310,7 @@ async def get_admin_products(admin: bool = Depends(verify_admin)):
 async def create_product(product: ProductCreate, admin: bool = Depends(verify_admin)):
     """Создание нового продукта"""
     try:
-        product_id = db.add_product(product.name, product.price, product.description)
+        product_id = await db.add_product(product.name, to_kopecks(product.price), product.description)
         return {"message": "Продукт создан", "product_id": product_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка создания продукта: {str(e)}")
@@ -211,30 +320,16 @@ async def update_product(product_id: int, product: ProductUpdate, admin: bool =
     """Обновление продукта"""
     try:
         # Проверяем, существует ли продукт
-        products = db.get_products()
-        existing_product = next((p for p in products if p['id'] == product_id), None)
+        existing_product = await db.get_product(product_id)
         if not existing_product:
             raise HTTPException(status_code=404, detail="Продукт не найден")
         
-        # Обновляем продукт
-        query = "UPDATE products SET "
-        params = []
-        updates = []
-        
-        if product.name is not None:
-            updates.append("name = ?")
-            params.append(product.name)
-        if product.price is not None:
-            updates.append("price = ?")
-            params.append(product.price)
-        if product.description is not None:
-            updates.append("description = ?")
-            params.append(product.description)
-        
-        if updates:
-            query += ", ".join(updates) + " WHERE product_id = ?"
-            params.append(product_id)
-            db.execute_query(query, params)
+        # Обновляем продукт (кэш каталога бота увидит новую версию каталога)
+        update_fields = product.model_dump(exclude_none=True)
+        if 'price' in update_fields:
+            update_fields['price'] = to_kopecks(update_fields['price'])
+        if update_fields:
+            await db.update_product(product_id, **update_fields)
         
         return {"message": "Продукт обновлен", "product_id": product_id}
     except Exception as e:
@@ -244,7 +339,8 @@ async def update_product(product_id: int, product: ProductUpdate, admin: bool =
 async def delete_product(product_id: int, admin: bool = Depends(verify_admin)):
     """Удаление продукта"""
     try:
-        db.execute_query("DELETE FROM products WHERE product_id = ?", (product_id,))
+        if not await db.delete_product(product_id):
+            raise HTTPException(status_code=404, detail="Продукт не найден")
         return {"message": "Продукт удален", "product_id": product_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка удаления продукта: {str(e)}")
@@ -252,28 +348,52 @@ async def delete_product(product_id: int, admin: bool = Depends(verify_admin)):
 # === УПРАВЛЕНИЕ ЗАКАЗАМИ ===
 
 @app.get("/api/orders")
-async def get_orders(admin: bool = Depends(verify_admin)):
-    """Получение списка всех заказов"""
+async def get_orders(
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    sort: str = "order_date",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    admin: bool = Depends(verify_admin)
+):
+    """
+    Страница списка заказов (keyset-пагинация)
+    
+    Фильтры: status, user_id, from/to (дата заказа, YYYY-MM-DD); sort:
+    order_date, id; order: asc/desc. Следующая страница - с параметром
+    cursor=next_cursor из ответа.
+    """
+    check_list_params(sort, ORDER_SORTS, order, from_date, to_date)
     try:
-        orders = db.execute_query("SELECT * FROM orders ORDER BY order_date DESC")
+        # Заказы вместе с покупателями и позициями - без запроса на каждый заказ
+        orders, next_cursor = await db.list_orders_with_users(
+            status=status, user_id=user_id, date_from=from_date, date_to=to_date,
+            sort=sort, descending=order == "desc", cursor=cursor, limit=limit
+        )
+        total = await db.count_orders(status=status, user_id=user_id, date_from=from_date, date_to=to_date)
         
-        # Обогащаем заказы информацией о пользователях
-        enriched_orders = []
-        for order in orders:
-            user = db.get_user(order['user_id'])
-            order_with_user = dict(order)
-            order_with_user['user'] = user
-            
-            # Парсим данные заказа
-            if order.get('data'):
-                try:
-                    order_with_user['items'] = json.loads(order['data'])
-                except:
-                    order_with_user['items'] = {}
-            
-            enriched_orders.append(order_with_user)
+        # Позиции - в прежней форме JSON заказа {"items": [...]}, ее ждет Orders.vue
+        for order_row in orders:
+            order_row['total_amount'] = from_kopecks(order_row['total_amount'])
+            order_row['items'] = {
+                'items': [
+                    {
+                        'product_id': item.product_id,
+                        'name': item.name,
+                        'quantity': item.quantity,
+                        'price': from_kopecks(item.unit_price),
+                        'total': from_kopecks(item.unit_price * item.quantity)
+                    }
+                    for item in order_row['items']
+                ]
+            }
         
-        return {"orders": enriched_orders}
+        return {"orders": orders, "next_cursor": next_cursor, "total": total}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения заказов: {str(e)}")
 
@@ -285,7 +405,7 @@ async def update_order_status(order_id: int, status: str, admin: bool = Depends(
         if status not in valid_statuses:
             raise HTTPException(status_code=400, detail=f"Неверный статус. Доступные: {valid_statuses}")
         
-        db.update_order_status(order_id, status)
+        await db.update_order_status(order_id, status)
         return {"message": "Статус заказа обновлен", "order_id": order_id, "status": status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обновления статуса заказа: {str(e)}")
@@ -299,11 +419,14 @@ async def create_notification(notification: NotificationCreate, admin: bool = De
         # Планируем отправку уведомления
         send_time = notification.send_time or datetime.now().isoformat()
         
-        notification_id = db.add_notification(
+        notification_id = await db.add_notification(
+            title=notification.title or "Уведомление",
             message=notification.message,
             target_audience=notification.target_audience,
-            send_time=send_time
+            scheduled_date=send_time
         )
+        if notification_id is None:
+            raise HTTPException(status_code=500, detail="Не удалось сохранить уведомление")
         
         return {"message": "Уведомление создано", "notification_id": notification_id}
     except Exception as e:
@@ -313,8 +436,14 @@ async def create_notification(notification: NotificationCreate, admin: bool = De
 async def get_notifications(admin: bool = Depends(verify_admin)):
     """Получение списка уведомлений"""
     try:
-        notifications = db.execute_query("SELECT * FROM notifications ORDER BY created_at DESC")
-        return {"notifications": notifications}
+        notifications = await db.list_notifications()
+        # Поля в форме, которую ждет Notifications.vue
+        return {
+            "notifications": [
+                {**notification.to_dict(), "send_time": notification.scheduled_date, "sent": bool(notification.is_sent)}
+                for notification in notifications
+            ]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения уведомлений: {str(e)}")
 
@@ -0,0 +1,294 @@
+"""
+Готовые экраны бота: тексты и inline-клавиатуры
+
+Статические экраны (главное меню, справка, бесплатные материалы,
+админ-панель) собираются один раз при создании ScreenCache из настроек
+(FREE_MATERIALS, ANONYMOUS_QUESTION_LINK). Клавиатуры python-telegram-bot
+неизменяемы, поэтому одни и те же объекты безопасно отдавать всем
+пользователям. В тексты при показе подставляются только персональные
+фрагменты вроде имени (Screen.render).
+
+Экраны каталога и карточек продуктов строятся при первом показе и
+хранятся, пока не сменится версия каталога (get_catalog_version
+хранилища): любое изменение таблицы products сбрасывает их все.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import ANONYMOUS_QUESTION_LINK, FREE_MATERIALS
+from money import format_money
+
+WEBSITE_URL = "https://telegram-bot-kate.vercel.app"
+
+MAIN_MENU_TEXT = """
+🤖 **Бот Екатерины - Ваш помощник!**
+
+Выберите, что хотите сделать:
+"""
+
+HELP_TEXT = f"""
+📖 **Справка по боту Екатерины - кризисного целителя**
+
+🤖 **О боте:**
+Я ваш персональный помощник, который поможет вам:
+• 📚 Получить доступ к бесплатным материалам
+• 💎 Ознакомиться с продуктами и услугами
+• 📋 Управлять заказами
+• 👤 Настроить профиль
+
+📱 **Основные команды:**
+• `/start` - Начать работу с ботом
+• `/help` - Показать эту справку
+• `/shop` - Открыть каталог продуктов
+
+🎯 **Как использовать:**
+1. Используйте кнопки меню для навигации
+2. Всегда можно вернуться в главное меню
+3. Для покупок выберите "💎 Продукты"
+4. Бесплатные материалы доступны после регистрации
+
+❓ **Частые вопросы:**
+
+**Q: Как зарегистрироваться?**
+A: Нажмите /start и следуйте инструкциям. Регистрация займет 1 минуту.
+
+**Q: Где найти бесплатные материалы?**
+A: После регистрации они будут доступны в разделе "📚 Бесплатные материалы".
+
+**Q: Как купить продукт?**
+A: Выберите "💎 Продукты" → выберите продукт → "Купить" → оплатите.
+
+**Q: Как посмотреть мои заказы?**
+A: В главном меню выберите "📋 Мои заказы".
+
+**Q: Как изменить профиль?**
+A: "👤 Мой профиль" → "Редактировать профиль".
+
+🌐 **Веб-сайт:** {WEBSITE_URL}
+
+💬 **Нужна помощь?**
+Напишите администратору через веб-сайт или используйте форму обратной связи.
+"""
+
+ADMIN_PANEL_TEXT = """
+🔧 Админ-панель
+
+Выберите действие:
+"""
+
+
+def keyboard(*rows: List[InlineKeyboardButton]) -> InlineKeyboardMarkup:
+    """Клавиатура из рядов кнопок"""
+    return InlineKeyboardMarkup([list(row) for row in rows])
+
+
+MAIN_MENU_BUTTON = InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")
+WEBSITE_BUTTON = InlineKeyboardButton("🌐 Веб-сайт", url=WEBSITE_URL)
+
+
+class Screen:
+    """Текст и клавиатура экрана"""
+    
+    __slots__ = ('text', 'reply_markup')
+    
+    def __init__(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        self.text = text
+        self.reply_markup = reply_markup
+    
+    def render(self, **values) -> str:
+        """
+        Текст с подставленными персональными фрагментами
+        
+        Плейсхолдеры {name} заменяются простой подстановкой, а не
+        str.format, поэтому фигурные скобки в имени пользователя безопасны.
+        """
+        text = self.text
+        for name, value in values.items():
+            text = text.replace(f'{{{name}}}', str(value))
+        return text
+
+
+class ProductScreen:
+    """Карточка продукта: текст и клавиатуры для состояний корзины и избранного"""
+    
+    __slots__ = ('text', '_markups')
+    
+    def __init__(self, product):
+        product_id = product['id']
+        self.text = f"""
+📦 **{product['name']}**
+
+💰 **Цена:** {format_money(product['price'])}
+
+📝 **Описание:**
+{product.get('description', 'Описание отсутствует')}
+
+Выберите действие:
+"""
+        
+        cart_buttons = {
+            True: InlineKeyboardButton("🛒 Удалить из корзины", callback_data=f"remove_cart_{product_id}"),
+            False: InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"add_cart_{product_id}"),
+        }
+        favorite_buttons = {
+            True: InlineKeyboardButton("❤️ Удалить из избранного", callback_data=f"remove_fav_{product_id}"),
+            False: InlineKeyboardButton("🤍 Добавить в избранное", callback_data=f"add_fav_{product_id}"),
+        }
+        buy_button = InlineKeyboardButton("💳 Купить", callback_data=f"buy_product_{product_id}")
+        back_button = InlineKeyboardButton("◀️ Назад в каталог", callback_data="main_shop")
+        
+        self._markups: Dict[Tuple[bool, bool], InlineKeyboardMarkup] = {
+            (in_cart, in_favorites): keyboard(
+                [cart_buttons[in_cart]],
+                [favorite_buttons[in_favorites]],
+                [buy_button],
+                [back_button],
+                [MAIN_MENU_BUTTON],
+            )
+            for in_cart in (True, False)
+            for in_favorites in (True, False)
+        }
+    
+    def reply_markup(self, in_cart: bool, in_favorites: bool) -> InlineKeyboardMarkup:
+        """Клавиатура для текущего состояния корзины и избранного"""
+        return self._markups[bool(in_cart), bool(in_favorites)]
+
+
+class ScreenCache:
+    """Экраны бота, собранные заранее"""
+    
+    def __init__(self):
+        menu_buttons = [
+            [InlineKeyboardButton("💎 Продукты", callback_data="main_shop")],
+            [InlineKeyboardButton("📚 Бесплатные материалы", callback_data="main_materials")],
+            [InlineKeyboardButton("📋 Мои заказы", callback_data="main_orders")],
+            [InlineKeyboardButton("👤 Мой профиль", callback_data="main_profile")],
+            [WEBSITE_BUTTON],
+            [InlineKeyboardButton("❓ Помощь", callback_data="main_help")],
+        ]
+        self.main_menu = Screen(MAIN_MENU_TEXT, keyboard(*menu_buttons))
+        # Для незарегистрированных - с кнопкой регистрации первой строкой
+        self.main_menu_with_registration = Screen(MAIN_MENU_TEXT, keyboard(
+            [InlineKeyboardButton("🚀 Начать регистрацию", callback_data="start_registration")],
+            *menu_buttons
+        ))
+        
+        self.help = Screen(HELP_TEXT, keyboard(
+            [MAIN_MENU_BUTTON],
+            [InlineKeyboardButton("💎 Продукты", callback_data="main_shop")],
+            [InlineKeyboardButton("📚 Материалы", callback_data="main_materials")],
+            [WEBSITE_BUTTON],
+        ))
+        
+        self.admin_panel = Screen(ADMIN_PANEL_TEXT, keyboard(
+            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
+            [InlineKeyboardButton("👥 Список пользователей", callback_data="admin_users")],
+            [InlineKeyboardButton("🎯 Приглашение на встречу", callback_data="admin_meeting")],
+            [InlineKeyboardButton("🔥 Специальное предложение", callback_data="admin_offer")],
+        ))
+        
+        self._build_materials()
+        
+        self._catalog_version: Optional[int] = None
+        self._catalog: Optional[Screen] = None
+        self._products: Dict[int, ProductScreen] = {}
+    
+    def _build_materials(self):
+        """Экраны бесплатных материалов из FREE_MATERIALS"""
+        material_buttons = [
+            [InlineKeyboardButton(material['title'], url=material['url'])]
+            for material in FREE_MATERIALS['materials']
+        ]
+        material_buttons.append([InlineKeyboardButton("📝 Анонимный опрос", url=ANONYMOUS_QUESTION_LINK)])
+        
+        # Тексты по источнику запроса: после регистрации и из главного меню
+        texts = {
+            'registration': f"""
+🎉 **{{user_name}}, поздравляем с завершением регистрации!**
+
+{FREE_MATERIALS['welcome_message']}
+
+🎁 Ниже вы найдете бесплатные материалы, которые помогут вам начать:
+
+Нажмите на кнопки ниже, чтобы открыть материалы:
+""",
+            'menu': f"""
+📚 **Бесплатные материалы**
+
+{FREE_MATERIALS['welcome_message']}
+
+Выберите материал, который вас интересует:
+""",
+        }
+        # Клавиатуры: зарегистрированным - с кнопкой главного меню
+        markups = {
+            False: keyboard(*material_buttons),
+            True: keyboard(*material_buttons, [MAIN_MENU_BUTTON]),
+        }
+        self._materials = {
+            (source, is_registered): Screen(text, markup)
+            for source, text in texts.items()
+            for is_registered, markup in markups.items()
+        }
+    
+    def materials(self, source: str, is_registered: bool) -> Screen:
+        """Экран бесплатных материалов (текст с плейсхолдером {user_name})"""
+        if source != 'registration':
+            source = 'menu'
+        return self._materials[source, bool(is_registered)]
+    
+    # Каталог продуктов
+    
+    def _check_catalog_version(self, catalog_version: int):
+        """Сброс экранов каталога при смене его версии"""
+        if catalog_version != self._catalog_version:
+            self._catalog_version = catalog_version
+            self._catalog = None
+            self._products = {}
+    
+    def catalog(self, catalog_version: int) -> Optional[Screen]:
+        """Экран каталога для версии catalog_version (None - еще не построен)"""
+        self._check_catalog_version(catalog_version)
+        return self._catalog
+    
+    def build_catalog(self, products, catalog_version: int) -> Screen:
+        """Построение и сохранение экрана каталога"""
+        catalog_text = """
+💎 **Каталог продуктов и услуг**
+
+Выберите продукт для покупки:
+
+"""
+        buttons = []
+        for product in products:
+            catalog_text += f"""
+📦 **{product['name']}**
+💰 {format_money(product['price'])}
+📝 {product['description']}
+
+"""
+            buttons.append([InlineKeyboardButton(
+                f"💳 {product['name']} - {format_money(product['price'])}",
+                callback_data=f"product_{product['id']}"
+            )])
+        buttons.append([WEBSITE_BUTTON])
+        buttons.append([MAIN_MENU_BUTTON])
+        
+        screen = Screen(catalog_text, keyboard(*buttons))
+        self._check_catalog_version(catalog_version)
+        self._catalog = screen
+        return screen
+    
+    def product(self, product_id: int, catalog_version: int) -> Optional[ProductScreen]:
+        """Карточка продукта для версии catalog_version (None - еще не построена)"""
+        self._check_catalog_version(catalog_version)
+        return self._products.get(product_id)
+    
+    def build_product(self, product, catalog_version: int) -> ProductScreen:
+        """Построение и сохранение карточки продукта"""
+        screen = ProductScreen(product)
+        self._check_catalog_version(catalog_version)
+        self._products[product['id']] = screen
+        return screen
@@ -0,0 +1,168 @@
+"""
+Кэш сессий пользователей бота
+
+Каждое сообщение и почти каждая кнопка начинаются с get_user(): этапу
+диалога, имени, телефону и флагу регистрации нужна строка users. Пока
+пользователь ходит по меню, эта строка меняется только через сам бот,
+поэтому ее можно держать в памяти процесса.
+
+SessionCache - ограниченный LRU-кэш записей пользователей с метриками
+попаданий. CachedUserStorage оборачивает Storage: get_user и
+get_last_message_id отдаются из кэша, а обновления пользователя
+(update_user_fields, update_user_stage, update_last_message_id,
+reset_user_profile) пишутся в базу и сразу применяются к кэшу
+(write-through). Остальные методы проксируются без изменений.
+
+Изменения пользователя из другого процесса (админ-API) становятся видны
+боту не позже чем через ttl секунд. Кэш живет в одном процессе: если
+обновления одного пользователя распределяются между несколькими
+экземплярами бота, кэш нужно отключить (SESSION_CACHE_SIZE=0).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from records import UserRecord
+from storage import Storage
+
+
+class SessionCache:
+    """Ограниченный LRU-кэш записей пользователей по user_id"""
+    
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        """
+        Args:
+            max_size: Сколько пользователей держать в памяти
+            ttl: Время жизни записи в секундах (0 - без ограничения)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        
+        self._entries: 'OrderedDict[int, Tuple[float, UserRecord]]' = OrderedDict()
+        # Счетчик записей: чтение из базы, во время которого пользователь
+        # менялся, не кладется в кэш (иначе оно затрет более новую запись)
+        self.writes = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        """Запись пользователя из кэша (None - промах)"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            stored_at, user = entry
+            if not self.ttl or time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return user
+            del self._entries[user_id]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, user: UserRecord):
+        """Запись пользователя в кэш с вытеснением самой давней"""
+        self._entries[user.user_id] = (time.monotonic(), user)
+        self._entries.move_to_end(user.user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def update(self, user_id: int, **fields):
+        """Применение записанных в базу полей к закэшированной записи"""
+        self.writes += 1
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            user = entry[1]
+            for field, value in fields.items():
+                setattr(user, field, value)
+    
+    def invalidate(self, user_id: int):
+        """Удаление пользователя из кэша"""
+        self.writes += 1
+        self._entries.pop(user_id, None)
+    
+    def clear(self):
+        """Очистка кэша"""
+        self.writes += 1
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Метрики кэша: size, max_size, hits, misses, hit_rate, evictions"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+class CachedUserStorage:
+    """Storage с кэшем сессий пользователей (write-through)"""
+    
+    def __init__(self, storage: Storage, max_size: int = 10000, ttl: float = 300.0):
+        self.storage = storage
+        self.session_cache = SessionCache(max_size, ttl)
+    
+    def __getattr__(self, name):
+        # Методы без пользовательского состояния - напрямую в хранилище
+        return getattr(self.storage, name)
+    
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        """Пользователь по ID (из кэша, при промахе - из базы)"""
+        cache = self.session_cache
+        user = cache.get(user_id)
+        if user is not None:
+            return user
+        
+        writes = cache.writes
+        user = await self.storage.get_user(user_id)
+        if user is not None and cache.writes == writes:
+            cache.put(user)
+        return user
+    
+    async def update_user_fields(self, user_id: int, **fields) -> Optional[UserRecord]:
+        """Обновление полей пользователя; новая запись кладется в кэш"""
+        self.session_cache.invalidate(user_id)
+        user = await self.storage.update_user_fields(user_id, **fields)
+        if user is not None:
+            self.session_cache.put(user)
+        return user
+    
+    async def update_user_stage(self, user_id: int, stage: str) -> bool:
+        """Обновление этапа пользователя"""
+        updated = await self.storage.update_user_stage(user_id, stage)
+        if updated:
+            self.session_cache.update(user_id, stage=stage)
+        else:
+            self.session_cache.invalidate(user_id)
+        return updated
+    
+    async def reset_user_profile(self, user_id: int) -> bool:
+        """Сброс профиля пользователя"""
+        self.session_cache.invalidate(user_id)
+        reset = await self.storage.reset_user_profile(user_id)
+        self.session_cache.invalidate(user_id)
+        return reset
+    
+    async def update_last_message_id(self, user_id: int, message_id: int) -> bool:
+        """ID последнего сообщения бота пользователю"""
+        updated = await self.storage.update_last_message_id(user_id, message_id)
+        if updated:
+            self.session_cache.update(user_id, last_message_id=message_id)
+        return updated
+    
+    async def get_last_message_id(self, user_id: int) -> Optional[int]:
+        """ID последнего сообщения бота пользователю (из кэша, если пользователь в нем)"""
+        user = await self.get_user(user_id)
+        return user.last_message_id if user else None
+
+
+# Обертка реализует интерфейс: пользовательские методы - с кэшем,
+# остальные - через __getattr__
+Storage.register(CachedUserStorage)
@@ -0,0 +1,231 @@
+"""
+Интерфейс хранилища данных бота и админ-API
+
+Обработчики бота, платежи, уведомления и render_api работают только с
+асинхронным интерфейсом Storage и не знают, где лежат данные:
+
+- SQLite (по умолчанию) - AsyncDatabase поверх Database: один файл базы,
+  к которому обращаются бот и API на одной машине;
+- PostgreSQL (DATABASE_URL=postgresql://...) - PostgresStorage с пулом
+  соединений asyncpg: несколько экземпляров бота и API работают с одной
+  общей базой.
+
+Денежные суммы - в копейках, даты - строки 'YYYY-MM-DD HH:MM:SS' (UTC),
+записи - классы из records.py в обеих реализациях.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from database import AsyncDatabase, Database
+from records import UserRecord, OrderRecord, OrderItemRecord, ProductRecord, CartItem, NotificationRecord
+
+POSTGRES_SCHEMES = ('postgres://', 'postgresql://')
+
+
+class Storage(ABC):
+    """Асинхронный интерфейс хранилища (методы повторяют API Database)"""
+    
+    # Пользователи
+    
+    @abstractmethod
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None,
+                       last_name: str = None) -> bool:
+        """Добавление пользователя (существующий не меняется)"""
+    
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        """Пользователь по ID"""
+    
+    @abstractmethod
+    async def update_user_stage(self, user_id: int, stage: str) -> bool:
+        """Обновление этапа пользователя"""
+    
+    @abstractmethod
+    async def update_user_fields(self, user_id: int, **fields) -> Optional[UserRecord]:
+        """Обновление полей из USER_UPDATABLE_FIELDS одной записью (возвращает новую запись)"""
+    
+    @abstractmethod
+    async def reset_user_profile(self, user_id: int) -> bool:
+        """Сброс регистрационных данных, корзины и избранного"""
+    
+    @abstractmethod
+    async def update_last_message_id(self, user_id: int, message_id: int) -> bool:
+        """ID последнего сообщения бота пользователю"""
+    
+    @abstractmethod
+    async def get_last_message_id(self, user_id: int) -> Optional[int]:
+        """ID последнего сообщения бота пользователю"""
+    
+    @abstractmethod
+    def iter_user_ids(self, segment: str = 'all', batch_size: int = 500) -> AsyncIterator[int]:
+        """Потоковый обход ID пользователей сегмента из USER_SEGMENTS"""
+    
+    @abstractmethod
+    async def list_users(self, stage: str = None, date_from: str = None, date_to: str = None,
+                         sort: str = 'registration_date', descending: bool = True,
+                         cursor: str = None, limit: int = 50) -> Tuple[List[UserRecord], Optional[str]]:
+        """Страница пользователей с keyset-пагинацией"""
+    
+    @abstractmethod
+    async def count_users(self, stage: str = None, date_from: str = None, date_to: str = None) -> int:
+        """Количество пользователей по фильтру"""
+    
+    # Продукты
+    
+    @abstractmethod
+    async def add_product(self, name: str, price: int, description: str) -> Optional[int]:
+        """Добавление продукта (возвращает ID)"""
+    
+    @abstractmethod
+    async def update_product(self, product_id: int, **fields) -> bool:
+        """Обновление полей из PRODUCT_UPDATABLE_FIELDS"""
+    
+    @abstractmethod
+    async def delete_product(self, product_id: int) -> bool:
+        """Удаление продукта"""
+    
+    @abstractmethod
+    async def get_products(self) -> List[ProductRecord]:
+        """Активные продукты"""
+    
+    @abstractmethod
+    async def get_product(self, product_id: int) -> Optional[ProductRecord]:
+        """Активный продукт по ID"""
+    
+    @abstractmethod
+    async def get_catalog_version(self) -> int:
+        """Версия каталога (меняется при любом изменении продуктов)"""
+    
+    # Корзина и избранное
+    
+    @abstractmethod
+    async def add_to_cart(self, user_id: int, product_id: int, quantity: int = 1) -> bool:
+        """Добавление продукта в корзину"""
+    
+    @abstractmethod
+    async def remove_from_cart(self, user_id: int, product_id: int) -> bool:
+        """Удаление продукта из корзины"""
+    
+    @abstractmethod
+    async def get_cart(self, user_id: int) -> List[CartItem]:
+        """Корзина пользователя"""
+    
+    @abstractmethod
+    async def clear_cart(self, user_id: int) -> bool:
+        """Очистка корзины"""
+    
+    @abstractmethod
+    async def is_in_cart(self, user_id: int, product_id: int) -> bool:
+        """Есть ли продукт в корзине"""
+    
+    @abstractmethod
+    async def add_to_favorites(self, user_id: int, product_id: int) -> bool:
+        """Добавление продукта в избранное"""
+    
+    @abstractmethod
+    async def remove_from_favorites(self, user_id: int, product_id: int) -> bool:
+        """Удаление продукта из избранного"""
+    
+    @abstractmethod
+    async def is_in_favorites(self, user_id: int, product_id: int) -> bool:
+        """Есть ли продукт в избранном"""
+    
+    # Заказы
+    
+    @abstractmethod
+    async def checkout_cart(self, user_id: int) -> Optional[OrderRecord]:
+        """Заказ из корзины одной транзакцией (None - корзина пуста или ошибка)"""
+    
+    @abstractmethod
+    async def create_order(self, user_id: int, product_id: int, amount: int, payment_id: str = None) -> int:
+        """Оплаченный заказ одного продукта (возвращает ID или 0)"""
+    
+    @abstractmethod
+    async def get_order(self, order_id: int) -> Optional[OrderRecord]:
+        """Заказ по ID"""
+    
+    @abstractmethod
+    async def get_order_items(self, order_id: int) -> List[OrderItemRecord]:
+        """Позиции заказа"""
+    
+    @abstractmethod
+    async def get_user_orders(self, user_id: int) -> List[OrderRecord]:
+        """Заказы пользователя, от новых к старым"""
+    
+    @abstractmethod
+    async def update_order_status(self, order_id: int, status: str) -> bool:
+        """Обновление статуса заказа"""
+    
+    @abstractmethod
+    async def list_orders_with_users(self, status: str = None, user_id: int = None, date_from: str = None,
+                                     date_to: str = None, sort: str = 'order_date', descending: bool = True,
+                                     cursor: str = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Страница заказов с покупателями и позициями"""
+    
+    @abstractmethod
+    async def count_orders(self, status: str = None, user_id: int = None, date_from: str = None,
+                           date_to: str = None) -> int:
+        """Количество заказов по фильтру"""
+    
+    # Статистика
+    
+    @abstractmethod
+    async def get_stats_counters(self, day: str = None) -> Dict[str, Dict[str, int]]:
+        """Счетчики дашборда {metric: {key: value}}"""
+    
+    @abstractmethod
+    async def get_timeseries(self, metric: str, date_from: str, date_to: str,
+                             period: str = 'day') -> List[Dict[str, Any]]:
+        """Временной ряд метрики из ANALYTICS_METRICS без пропусков"""
+    
+    # Уведомления
+    
+    @abstractmethod
+    async def add_notification(self, title: str, message: str, target_audience: str = 'all',
+                               scheduled_date: str = None) -> Optional[int]:
+        """Добавление уведомления (возвращает ID)"""
+    
+    @abstractmethod
+    async def get_pending_notifications(self) -> List[NotificationRecord]:
+        """Неотправленные уведомления"""
+    
+    @abstractmethod
+    async def mark_notification_sent(self, notification_id: int) -> bool:
+        """Отметка уведомления как отправленного"""
+    
+    @abstractmethod
+    async def list_notifications(self, limit: int = 100) -> List[NotificationRecord]:
+        """Последние уведомления, от новых к старым"""
+    
+    @abstractmethod
+    async def close(self):
+        """Завершение запросов и закрытие соединений"""
+
+
+# AsyncDatabase реализует интерфейс через проксирование методов Database
+Storage.register(AsyncDatabase)
+
+
+def is_postgres_url(database_url: Optional[str]) -> bool:
+    """Указывает ли DATABASE_URL на PostgreSQL"""
+    return bool(database_url) and database_url.startswith(POSTGRES_SCHEMES)
+
+
+def create_storage(database_url: str = None, database_path: str = 'bot_database.db',
+                   pool_size: int = 4, **sqlite_options) -> Storage:
+    """
+    Хранилище по настройкам
+    
+    Args:
+        database_url: URL PostgreSQL; пустой - SQLite-файл database_path
+        database_path: Путь к файлу SQLite
+        pool_size: Размер пула соединений (для PostgreSQL - максимум пула)
+        **sqlite_options: Остальные параметры Database (flush_interval, read_only, ...);
+            PostgreSQL из них использует только rollup_interval
+    """
+    if is_postgres_url(database_url):
+        from postgres_storage import PostgresStorage
+        rollup_interval = sqlite_options.get('rollup_interval', 300.0)
+        return PostgresStorage(database_url, max_size=pool_size, rollup_interval=rollup_interval)
+    return AsyncDatabase(Database(database_path, pool_size=pool_size, **sqlite_options))
@@ -0,0 +1,21 @@
+"""Планы горячих запросов: ни один не должен просматривать таблицу целиком"""
+import pytest
+
+from database import ConnectionPool, Database
+
+
+@pytest.fixture
+def db():
+    database = Database(ConnectionPool.MEMORY_PATH, flush_interval=0, rollup_interval=0)
+    yield database
+    database.close()
+
+
+def test_hot_queries_use_indexes(db):
+    assert db.find_full_scans() == {}
+
+
+def test_hot_queries_execute(db):
+    with db.pool.reader() as conn:
+        for name, (sql, params) in db.hot_queries().items():
+            conn.execute(sql, params).fetchall()